@@ -1,43 +1,203 @@
 #!/usr/bin/env python
 """Convert hack assembly into hack machine language."""
+import argparse
+import io
 import os
+import re
 import sys
+from array import array
 
+import image
+import object_file
 from code import Code
-from parser import CommandType, Parser
+from parser import CommandType, Parser, StreamParser
 from symbol_table import SymbolTable
 
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TOOL_DIR, os.pardir, os.pardir, "tools"))
+
+import build_cache  # noqa: E402
+from source_map import SourceMap  # noqa: E402
+
 
 def main():
     """Entry point for the assembler."""
-    assembly_file = sys.argv[1]
+    args = parse_args()
+    assembly_file = args.file
 
-    f = open(assembly_file, 'r')
-    p = Parser(f)
-    f.close()
+    if args.object:
+        cache = build_cache.open_cache(args.cache, args.cache_size)
+        assemble_object_file(assembly_file, cache)
+        return
 
-    symbol_table = SymbolTable()
-    ROM_ADDRESS = -1
-    while p.hasMoreCommands():
-        p.advance()
-        if p.commandType() == CommandType.L_COMMAND:
-            symbol = p.symbol()
-            if not symbol_table.contains(symbol):
-                address = ROM_ADDRESS + 1
-                symbol_table.addEntry(symbol, address)
-        else:
-            ROM_ADDRESS += 1
+    if args.stream:
+        file_name = os.path.splitext(assembly_file)[0] + image.extension(
+            args.format
+        )
+        with open(assembly_file, 'r') as f, open(file_name, "wb") as hack:
+            assemble_stream(StreamParser(f), hack, args.format)
+        instructions = os.path.getsize(file_name) // image.record_width(
+            args.format
+        )
+    else:
+        cache = build_cache.open_cache(args.cache, args.cache_size)
+        file_name, instructions = assemble_file(
+            assembly_file, args.format, cache
+        )
+
+    if args.source_map:
+        try:
+            carry_source_map(assembly_file, file_name, instructions)
+        except (OSError, ValueError) as error:
+            print(error)
+            sys.exit(1)
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the assembler."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("file", help="hack assembly file to assemble")
+    arg_parser.add_argument(
+        "--stream", action="store_true",
+        help=("read the source lazily and assemble it in a single pass, "
+              "backpatching forward label references at the end")
+    )
+    arg_parser.add_argument(
+        "--format", choices=sorted(image.FORMATS), default="hack",
+        help=("output format: hack text, hex text or a packed little/big "
+              "endian uint16 image (default: hack)")
+    )
+    arg_parser.add_argument(
+        "--cache", metavar="DIR", default=None,
+        help=("reuse outputs of unchanged inputs from this build cache "
+              "(default: $HACK_BUILD_CACHE, off when unset)")
+    )
+    arg_parser.add_argument(
+        "--cache-size", metavar="MB", type=float, default=None,
+        help="evict least recently used cache entries beyond this size"
+    )
+    arg_parser.add_argument(
+        "--source-map", action="store_true",
+        help=("carry <file>.map written by the vm translator over to the "
+              "image, as <image>.map")
+    )
+    arg_parser.add_argument(
+        "--object", action="store_true",
+        help=("write a relocatable <file>.obj for linker.py instead of an "
+              "image")
+    )
+    args = arg_parser.parse_args(argv)
+    if args.object and (args.stream or args.source_map):
+        arg_parser.error(
+            "--object cannot be combined with --stream or --source-map"
+        )
+    return args
+
+
+def assemble_file(assembly_file, fmt="hack", cache=None, symbol_table=None,
+                  code=None):
+    """Assemble assembly_file next to itself in the given image format.
+
+    With a build cache the image is looked up by the hash of the source,
+    the assembler version and the format, and only assembled on a miss.
+    Return the output file name and the number of instructions.
+    """
+    file_name = os.path.splitext(assembly_file)[0] + image.extension(fmt)
+    with open(assembly_file, 'rb') as f:
+        source = f.read()
+
+    if cache is not None:
+        key = cache.key(
+            "assembler", build_cache.fingerprint(TOOL_DIR), fmt, source
+        )
+        data = cache.get(key)
+        if data is not None:
+            with open(file_name, "wb") as hack:
+                hack.write(data)
+            return file_name, len(data) // image.record_width(fmt)
+
+    p = Parser(io.StringIO(source.decode("utf-8")))
+    words = assemble(p, symbol_table, code)
+    data = image.encode(words, fmt)
+    if isinstance(data, str):
+        data = data.encode("ascii")
+
+    with open(file_name, "wb") as hack:
+        hack.write(data)
+    if cache is not None:
+        cache.put(key, data)
+    return file_name, len(words)
+
+
+def assemble_object_file(assembly_file, cache=None):
+    """Assemble assembly_file into a relocatable object next to itself.
+
+    The static variables are those the vm translator named after the .vm
+    file of the same name. Return the object file name.
+    """
+    stem = os.path.splitext(assembly_file)[0]
+    file_name = stem + object_file.EXTENSION
+    name = os.path.basename(stem) + ".vm"
+    with open(assembly_file, 'rb') as f:
+        source = f.read()
+
+    data = None
+    if cache is not None:
+        key = cache.key(
+            "object", build_cache.fingerprint(TOOL_DIR), name, source
+        )
+        data = cache.get(key)
+    if data is None:
+        p = Parser(io.StringIO(source.decode("utf-8")))
+        data = object_file.dumps(assemble_object(p, name))
+        if cache is not None:
+            cache.put(key, data)
+
+    with open(file_name, "wb") as obj:
+        obj.write(data)
+    return file_name
+
+
+def carry_source_map(assembly_file, file_name, instructions):
+    """Write the source map of assembly_file next to its image file_name.
+
+    Instructions keep their index in the assembly as ROM address, so the
+    map only has to be checked against the size of the program: every
+    entry must start at one of its instructions.
+    """
+    source_map = SourceMap.read(assembly_file + ".map")
+    if len(source_map) and source_map.entries[-1].address >= instructions:
+        raise ValueError(
+            f"{assembly_file}.map does not match the {instructions} "
+            f"instructions of {assembly_file}"
+        )
+    source_map.write(file_name + ".map")
+
+
+def assemble(p, symbol_table=None, code=None):
+    """Assemble the commands of parser p into an array of instructions.
+
+    A fresh symbol table and code object are created unless given, a
+    given symbol table is filled with the symbols of the program.
+    """
+    if symbol_table is None:
+        symbol_table = SymbolTable()
+    if code is None:
+        code = Code()
+    add_labels(p, symbol_table)
 
-    # 2nd Pass
-    code = Code()
     p.reset()
+    return assemble_commands(p, symbol_table, code)
+
 
-    # Write lines to a file
-    file_name = os.path.splitext(assembly_file)[0] + ".hack"
-    hack = open(file_name, "w")
+def assemble_commands(p, symbol_table, code):
+    """Return the instructions of parser p, whose labels are known.
 
+    This is the second pass of the assembler, variables are added to
+    symbol_table as they are first referenced.
+    """
+    words = array("H")
     while p.hasMoreCommands():
-        machine_code = ""
         p.advance()
         COMMAND_TYPE = p.commandType()
         if COMMAND_TYPE == CommandType.A_COMMAND:
@@ -52,32 +212,143 @@ def main():
                     symbol_table.incrementNextVariableAddress()
 
                 decimal = symbol_table.getAddress(symbol)
-            machine_code = convertDecimalToBinary(decimal)
+            words.append(decimal)
+
+        elif COMMAND_TYPE == CommandType.C_COMMAND:
+            words.append(code.instruction(p.current_command))
+
+    return words
+
+
+def assemble_object(p, name, code=None):
+    """Assemble the commands of parser p into a relocatable object.
+
+    The object starts at address 0, references to its own labels are
+    relocated and the predefined symbols resolved. Other symbols are left
+    to the linker, those named <name>.<index> as the static variables of
+    the vm file name.
+    """
+    symbol_table = SymbolTable()
+    if code is None:
+        code = Code()
+    labels = add_labels(p, symbol_table)
+    own_labels = set(labels)
+    static = re.compile(re.escape(name) + r"\.\d+$")
+
+    p.reset()
+    words = array("H")
+    relocations = []
+    imports = {}
+    statics = {}
+    while p.hasMoreCommands():
+        p.advance()
+        COMMAND_TYPE = p.commandType()
+        if COMMAND_TYPE == CommandType.A_COMMAND:
+            symbol = p.symbol()
+            try:
+                decimal = int(symbol)
+            except ValueError:
+                if symbol in own_labels:
+                    relocations.append(len(words))
+                    decimal = symbol_table.getAddress(symbol)
+                elif symbol_table.contains(symbol):
+                    decimal = symbol_table.getAddress(symbol)
+                else:
+                    references = statics if static.match(symbol) else imports
+                    references.setdefault(symbol, []).append(len(words))
+                    decimal = 0
+            words.append(decimal)
+
+        elif COMMAND_TYPE == CommandType.C_COMMAND:
+            words.append(code.instruction(p.current_command))
+
+    exports = {label: symbol_table.getAddress(label) for label in labels}
+    return object_file.ObjectFile(
+        name, words, relocations, exports, imports, statics
+    )
+
+
+def add_labels(p, symbol_table):
+    """Add the ROM address of every label of parser p to symbol_table.
+
+    This is the first pass of the assembler, return the labels added.
+    """
+    labels = []
+    ROM_ADDRESS = -1
+    while p.hasMoreCommands():
+        p.advance()
+        if p.commandType() == CommandType.L_COMMAND:
+            symbol = p.symbol()
+            if not symbol_table.contains(symbol):
+                address = ROM_ADDRESS + 1
+                symbol_table.addEntry(symbol, address)
+                labels.append(symbol)
+        else:
+            ROM_ADDRESS += 1
+    return labels
+
+
+def assemble_stream(p, hack, fmt="hack"):
+    """Assemble parser p into hack in one pass, backpatching at the end.
 
-        elif p.commandType() == CommandType.C_COMMAND:
-            machine_code = "111"
-            command = p.comp()
+    A-commands that reference a symbol which is not yet known are written
+    as a placeholder and their ROM address is recorded in a fixup table.
+    Once the source is exhausted the unresolved symbols are either labels
+    defined further down or variables, which are allocated in order of
+    first reference exactly as the two pass assembler does. The hack
+    filestream must be seekable and opened in binary mode for every
+    format, so records are patched at byte offsets.
+    """
+    symbol_table = SymbolTable()
+    code = Code()
 
-            # Determine if we are reading from A or M
-            if "M" in command:
-                machine_code += "1"
-            else:
-                machine_code += "0"
+    # symbol -> ROM addresses waiting for it, in order of first reference
+    fixups = {}
+    placeholder = image.encode_word(0, fmt)
+    width = image.record_width(fmt)
+    ROM_ADDRESS = 0
 
-            machine_code += code.comp(command)
-            machine_code += code.dest(p.dest())
-            machine_code += code.jump(p.jump())
+    while p.hasMoreCommands():
+        p.advance()
+        COMMAND_TYPE = p.commandType()
+        if COMMAND_TYPE == CommandType.L_COMMAND:
+            symbol = p.symbol()
+            if not symbol_table.contains(symbol):
+                symbol_table.addEntry(symbol, ROM_ADDRESS)
+            continue
 
-        if machine_code != "":
-            hack.write(machine_code + "\n")
+        if COMMAND_TYPE == CommandType.A_COMMAND:
+            symbol = p.symbol()
+            try:
+                machine_code = image.encode_word(int(symbol), fmt)
+            except ValueError:
+                if symbol_table.contains(symbol):
+                    decimal = symbol_table.getAddress(symbol)
+                    machine_code = image.encode_word(decimal, fmt)
+                else:
+                    fixups.setdefault(symbol, []).append(ROM_ADDRESS)
+                    machine_code = placeholder
+        else:
+            machine_code = image.encode_word(
+                code.instruction(p.current_command), fmt
+            )
 
-    hack.close()
+        hack.write(machine_code)
+        ROM_ADDRESS += 1
 
+    # Backpatch: anything that never became a label is a variable
+    for symbol, addresses in fixups.items():
+        if not symbol_table.contains(symbol):
+            address = symbol_table.getNextVariableAddress()
+            symbol_table.addEntry(symbol, address)
+            symbol_table.incrementNextVariableAddress()
 
-def convertDecimalToBinary(decimal):
-    """Convert a decimal string to a 16 bit binary."""
-    binary = bin(decimal)[2:]
-    return binary.zfill(16)
+        machine_code = image.encode_word(
+            symbol_table.getAddress(symbol), fmt
+        )
+        for address in addresses:
+            hack.seek(address * width)
+            hack.write(machine_code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""Assemble many hack assembly files concurrently."""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import image
+from assembler import assemble_file as assemble_to_file
+from assembler import build_cache
+from code import Code
+from symbol_table import SymbolTable
+
+# Warm objects created once per worker process by _init_worker
+_symbol_table = None
+_code = None
+_cache = None
+
+
+def main():
+    """Entry point for the batch assembler."""
+    args = parse_args()
+    assembly_files = collect_assembly_files(args.paths)
+    if not assembly_files:
+        print("no .asm files found")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    results = assemble_batch(
+        assembly_files, args.format, args.jobs, args.cache, args.cache_size
+    )
+    elapsed = time.perf_counter() - start
+
+    failures = print_summary(results, elapsed)
+    if failures:
+        sys.exit(1)
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the batch assembler."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "paths", nargs="+",
+        help=".asm files, directories to search recursively or glob patterns"
+    )
+    arg_parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="number of worker processes (default: number of cores)"
+    )
+    arg_parser.add_argument(
+        "--format", choices=sorted(image.FORMATS), default="hack",
+        help="output format (default: hack)"
+    )
+    arg_parser.add_argument(
+        "--cache", metavar="DIR", default=None,
+        help="build cache directory (default: $HACK_BUILD_CACHE)"
+    )
+    arg_parser.add_argument(
+        "--cache-size", metavar="MB", type=float, default=None,
+        help="evict least recently used cache entries beyond this size"
+    )
+    return arg_parser.parse_args(argv)
+
+
+def collect_assembly_files(paths):
+    """Expand files, directories and glob patterns into .asm files."""
+    assembly_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, "**", "*.asm")
+            assembly_files.extend(sorted(glob.glob(pattern, recursive=True)))
+        elif os.path.isfile(path):
+            assembly_files.append(path)
+        else:
+            assembly_files.extend(sorted(glob.glob(path, recursive=True)))
+
+    # drop duplicates but keep the order
+    return list(dict.fromkeys(assembly_files))
+
+
+def assemble_batch(assembly_files, fmt="hack", jobs=None, cache_dir=None,
+                   cache_size=None):
+    """Assemble the files in a process pool, return one result per file.
+
+    Each result is a tuple of (assembly file, output file, instruction
+    count, seconds, error message or None), in the order of the input.
+    """
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker,
+        initargs=(cache_dir, cache_size)
+    ) as executor:
+        return list(executor.map(
+            assemble_file, assembly_files, [fmt] * len(assembly_files)
+        ))
+
+
+def assemble_file(assembly_file, fmt="hack"):
+    """Assemble a single file, capturing timing and failures."""
+    if _symbol_table is None:
+        _init_worker()
+
+    start = time.perf_counter()
+    try:
+        file_name, count = assemble_to_file(
+            assembly_file, fmt, _cache, _symbol_table.copy(), _code
+        )
+    except Exception as error:
+        elapsed = time.perf_counter() - start
+        return (assembly_file, None, 0, elapsed,
+                f"{type(error).__name__}: {error}")
+
+    elapsed = time.perf_counter() - start
+    return (assembly_file, file_name, count, elapsed, None)
+
+
+def print_summary(results, elapsed):
+    """Print per file timing and failures, return the number of failures."""
+    failures = 0
+    for assembly_file, _, count, seconds, error in results:
+        if error is None:
+            print(f"ok    {seconds * 1000:9.1f} ms {count:8d} "
+                  f"instructions  {assembly_file}")
+        else:
+            failures += 1
+            print(f"FAIL  {seconds * 1000:9.1f} ms {'':8s} "
+                  f"              {assembly_file}: {error}")
+
+    print(f"{len(results) - failures} assembled, {failures} failed "
+          f"in {elapsed:.2f} s")
+    return failures
+
+
+def _init_worker(cache_dir=None, cache_size=None):
+    """Create the symbol table prototype and code object of a worker."""
+    global _symbol_table, _code, _cache
+    _symbol_table = SymbolTable()
+    _code = Code()
+    _cache = build_cache.open_cache(cache_dir, cache_size)
+
+
+if __name__ == "__main__":
+    main()
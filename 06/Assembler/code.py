@@ -1,9 +1,14 @@
 """Translate Hack assembly mnemonics into binary."""
+import re
+from functools import lru_cache
 
 
 class Code(object):
     """Translate Hack assembly mnemonics into binary."""
 
+    # dest=comp;jump string -> 16 bit encoding, shared by all instances
+    instruction_table = None
+
     def __init__(self):
         """Create a code object."""
         self.dest_dict = {
@@ -49,6 +54,9 @@ class Code(object):
             "D|A": "010101"
         }
 
+        if Code.instruction_table is None:
+            Code.instruction_table = self._build_instruction_table()
+
     def dest(self, mnemonic):
         """Return binary code of dest mnemonic."""
         return self.dest_dict[mnemonic]
@@ -62,3 +70,54 @@ class Code(object):
     def jump(self, mnemonic):
         """Return the binary code of the jump mnemonic."""
         return self.jump_dict[mnemonic]
+
+    def instruction(self, command):
+        """Return the 16 bit integer encoding of a whole C-command."""
+        try:
+            return Code.instruction_table[command]
+        except KeyError:
+            return _lookup_variant(command)
+
+    def _build_instruction_table(self):
+        """Encode every legal dest=comp;jump combination."""
+        comp_dict = dict(self.comp_dict)
+        # the commutative operations may be spelled either way round
+        for mnemonic in ("D+A", "D&A", "D|A"):
+            comp_dict[mnemonic[::-1]] = self.comp_dict[mnemonic]
+
+        comps = {}
+        for mnemonic, bits in comp_dict.items():
+            comps[mnemonic] = int(bits, 2) << 6
+            if "A" in mnemonic:
+                # reading from M sets the a bit
+                comps[mnemonic.replace("A", "M")] = (1 << 12) | (
+                    int(bits, 2) << 6
+                )
+
+        table = {}
+        for dest, dest_bits in self.dest_dict.items():
+            dest_prefix = "" if dest == "null" else dest + "="
+            for jump, jump_bits in self.jump_dict.items():
+                jump_suffix = "" if jump == "null" else ";" + jump
+                low_bits = (int(dest_bits, 2) << 3) | int(jump_bits, 2)
+                for comp, comp_bits in comps.items():
+                    command = dest_prefix + comp + jump_suffix
+                    table[command] = 0b111 << 13 | comp_bits | low_bits
+        return table
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def _lookup_variant(command):
+    """Encode a C-command that is not spelled in its normalized form."""
+    normalized = _WHITESPACE.sub("", command)
+    if normalized.startswith("null="):
+        normalized = normalized[len("null="):]
+    if normalized.endswith(";null"):
+        normalized = normalized[:-len(";null")]
+    try:
+        return Code.instruction_table[normalized]
+    except KeyError:
+        raise ValueError(f"Invalid C-command: {command}") from None
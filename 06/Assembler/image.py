@@ -0,0 +1,100 @@
+"""Read and write hack ROM images."""
+import sys
+from array import array
+
+# format -> (file extension, is binary, bytes per instruction)
+FORMATS = {
+    "hack": (".hack", False, 17),
+    "hex": (".hex", False, 5),
+    "le": (".le.bin", True, 2),
+    "be": (".be.bin", True, 2),
+}
+
+BYTE_ORDERS = {
+    "le": "little",
+    "be": "big",
+}
+
+
+def extension(fmt):
+    """Return the file extension used for images of the format."""
+    return FORMATS[fmt][0]
+
+
+def is_binary(fmt):
+    """Check if images of the format must be opened in binary mode."""
+    return FORMATS[fmt][1]
+
+
+def record_width(fmt):
+    """Return the size of a single encoded instruction."""
+    return FORMATS[fmt][2]
+
+
+def encode_word(word, fmt):
+    """Encode a single instruction into the bytes of its record."""
+    if fmt == "hack":
+        return (format(word, "016b") + "\n").encode("ascii")
+    elif fmt == "hex":
+        return (format(word, "04X") + "\n").encode("ascii")
+    else:
+        return word.to_bytes(2, BYTE_ORDERS[fmt])
+
+
+def encode(words, fmt):
+    """Encode a sequence of instructions into a whole image."""
+    if fmt in BYTE_ORDERS:
+        packed = array("H", words)
+        if BYTE_ORDERS[fmt] != sys.byteorder:
+            packed.byteswap()
+        return packed.tobytes()
+
+    if not words:
+        return ""
+    spec = "016b" if fmt == "hack" else "04X"
+    return "\n".join([format(word, spec) for word in words]) + "\n"
+
+
+def decode(data, fmt):
+    """Decode a whole image into an array of instructions."""
+    if fmt in BYTE_ORDERS:
+        words = array("H")
+        words.frombytes(data)
+        if BYTE_ORDERS[fmt] != sys.byteorder:
+            words.byteswap()
+        return words
+
+    base = 2 if fmt == "hack" else 16
+    return array("H", [int(line, base) for line in data.split()])
+
+
+def write_image(words, filepath, fmt):
+    """Write the instructions to filepath in a single write."""
+    mode = "wb" if is_binary(fmt) else "w"
+    with open(filepath, mode) as image:
+        image.write(encode(words, fmt))
+
+
+def read_image(filepath, fmt=None):
+    """Read an image, guessing the format from the extension if not given."""
+    if fmt is None:
+        fmt = format_from_path(filepath)
+    mode = "rb" if is_binary(fmt) else "r"
+    with open(filepath, mode) as image:
+        return decode(image.read(), fmt)
+
+
+def format_from_path(filepath):
+    """Guess the image format of filepath from its extension.
+
+    Packed images are only recognized by the extension naming their byte
+    order, the byte order of a plain .bin cannot be guessed.
+    """
+    for fmt, (ext, _, _) in FORMATS.items():
+        if filepath.endswith(ext):
+            return fmt
+    if filepath.endswith(".bin"):
+        raise ValueError(
+            f"Unknown byte order of {filepath}, give the format le or be"
+        )
+    raise ValueError(f"Unknown hack image format: {filepath}")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""Link relocatable hack object files into a hack program."""
+import argparse
+import sys
+from array import array
+
+import image
+import object_file
+from symbol_table import SymbolTable
+
+
+def main():
+    """Entry point for the linker."""
+    args = parse_args()
+    try:
+        objects = [object_file.read(path) for path in args.files]
+        words = link(objects)
+    except (OSError, ValueError) as error:
+        print(error)
+        sys.exit(1)
+
+    mode = "wb" if image.is_binary(args.format) else "w"
+    with open(args.output, mode) as hack:
+        hack.write(image.encode(words, args.format))
+    print(f"{args.output}: {len(words)} instructions")
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the linker."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "files", nargs="+",
+        help=".obj files written by assembler.py --object, in program order"
+    )
+    arg_parser.add_argument(
+        "-o", "--output", required=True, help="image file to write"
+    )
+    arg_parser.add_argument(
+        "--format", choices=sorted(image.FORMATS), default="hack",
+        help="output format of the image (default: hack)"
+    )
+    return arg_parser.parse_args(argv)
+
+
+def link(objects, symbol_table=None):
+    """Return the instructions of the program made of objects, in order.
+
+    Objects are placed one after the other. A label defined by more than
+    one object raises ValueError: references of an object to its own
+    labels are already relocated to its copy, where a single assembly file
+    would use the first definition. Imports no object exports and
+    statics become variables, allocated in order of first reference, so
+    the objects of the files of a program link into the image of their
+    concatenated assembly. Statics are private to their object.
+    """
+    if symbol_table is None:
+        symbol_table = SymbolTable()
+
+    bases = []
+    base = 0
+    defined = {}
+    for obj in objects:
+        bases.append(base)
+        for label, offset in obj.exports.items():
+            if label in defined:
+                raise ValueError(
+                    f"label {label} is defined in both {defined[label]} "
+                    f"and {obj.name}"
+                )
+            defined[label] = obj.name
+            if not symbol_table.contains(label):
+                symbol_table.addEntry(label, base + offset)
+        base += len(obj.code)
+
+    words = array("H")
+    for obj, base in zip(objects, bases):
+        words.extend(obj.code)
+        for offset in obj.relocations:
+            words[base + offset] += base
+
+        references = sorted(
+            list(obj.imports.items()) + list(obj.statics.items()),
+            key=lambda reference: reference[1][0]
+        )
+        for symbol, offsets in references:
+            if symbol in obj.statics:
+                address = allocate_variable(symbol_table)
+            else:
+                if not symbol_table.contains(symbol):
+                    symbol_table.addEntry(
+                        symbol, allocate_variable(symbol_table)
+                    )
+                address = symbol_table.getAddress(symbol)
+            for offset in offsets:
+                words[base + offset] = address
+
+    return words
+
+
+def allocate_variable(symbol_table):
+    """Return the next free variable address of symbol_table."""
+    address = symbol_table.getNextVariableAddress()
+    symbol_table.incrementNextVariableAddress()
+    return address
+
+
+if __name__ == "__main__":
+    main()
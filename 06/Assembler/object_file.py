@@ -0,0 +1,74 @@
+"""Read and write relocatable hack object files."""
+import json
+import sys
+from array import array
+from collections import namedtuple
+
+MAGIC = b"HACKOBJ1\n"
+EXTENSION = ".obj"
+
+# The assembled code of a single file, placed at address 0.
+#   code: array of instructions, symbolic A-commands hold 0
+#   relocations: offsets of instructions holding a ROM address of the
+#       object itself, the address the object is placed at is added to them
+#   exports: label -> offset of every label the object defines
+#   imports: symbol -> offsets of the instructions referencing it, for the
+#       symbols defined elsewhere, either labels of other objects or
+#       variables of the program
+#   statics: symbol -> offsets, for the static variables of the file, which
+#       only the object itself can reference
+# Imports and statics are in order of first reference.
+ObjectFile = namedtuple(
+    "ObjectFile",
+    ["name", "code", "relocations", "exports", "imports", "statics"]
+)
+
+
+def dumps(obj):
+    """Return obj in the object file format.
+
+    The symbols are a JSON header line after the magic line, followed by
+    the code as little endian uint16.
+    """
+    header = json.dumps({
+        "name": obj.name,
+        "relocations": list(obj.relocations),
+        "exports": obj.exports,
+        "imports": obj.imports,
+        "statics": obj.statics,
+    }, separators=(",", ":"))
+    code = array("H", obj.code)
+    if sys.byteorder != "little":
+        code.byteswap()
+    return MAGIC + header.encode("utf-8") + b"\n" + code.tobytes()
+
+
+def loads(data):
+    """Return the ObjectFile of data in the object file format."""
+    if not data.startswith(MAGIC):
+        raise ValueError("not a hack object file")
+    header, code_bytes = data[len(MAGIC):].split(b"\n", 1)
+    header = json.loads(header)
+    code = array("H")
+    code.frombytes(code_bytes)
+    if sys.byteorder != "little":
+        code.byteswap()
+    return ObjectFile(
+        header["name"], code, header["relocations"], header["exports"],
+        header["imports"], header["statics"]
+    )
+
+
+def read(path):
+    """Read an object file."""
+    with open(path, "rb") as filestream:
+        try:
+            return loads(filestream.read())
+        except ValueError as error:
+            raise ValueError(f"{path}: {error}") from None
+
+
+def write(obj, path):
+    """Write obj to an object file."""
+    with open(path, "wb") as filestream:
+        filestream.write(dumps(obj))
@@ -1,5 +1,6 @@
 """Parsers assembly language file."""
 
+import io
 from enum import Enum, auto
 
 
@@ -93,6 +94,40 @@ class Parser(object):
             return "0"
 
 
+class StreamParser(Parser):
+    """Parse an assembly language file lazily, one line at a time."""
+
+    def __init__(self, filestream):
+        """Create a streaming parser object."""
+        self.filestream = filestream
+        self.current_command = None
+        self._next_command = None
+
+    def reset(self):
+        """Streams can only be read once."""
+        raise io.UnsupportedOperation("StreamParser cannot be reset")
+
+    def hasMoreCommands(self):
+        """Read ahead to the next command, if there is one."""
+        while self._next_command is None:
+            line = self.filestream.readline()
+            if not line:
+                return False
+
+            # remove comments and whitespace, skip what is left empty
+            command = line.split("//")[0].strip()
+            if command:
+                self._next_command = command
+
+        return True
+
+    def advance(self):
+        """Read next command and makes it the current."""
+        self.hasMoreCommands()
+        self.current_command = self._next_command
+        self._next_command = None
+
+
 class AutoName(Enum):
     """Override Auto Enum Name generation."""
 
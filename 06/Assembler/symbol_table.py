@@ -21,6 +21,13 @@ class SymbolTable(object):
 
         self._next_variable_address = 16
 
+    def copy(self):
+        """Return an independent copy of the symbol table."""
+        symbol_table = SymbolTable.__new__(SymbolTable)
+        symbol_table.table = self.table.copy()
+        symbol_table._next_variable_address = self._next_variable_address
+        return symbol_table
+
     def addEntry(self, symbol, address):
         """Add a symbol address pair to the table."""
         self.table[symbol] = address
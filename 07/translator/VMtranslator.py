@@ -1,16 +1,49 @@
 #!/usr/bin/env python
 """Translates VM files to hack assembly."""
 
+import argparse
 import glob
+import io
 import os
 import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 from parser import CommandType, Parser
 from code_writer import CodeWriter
+from dead_functions import remove_dead_functions
+from optimizer import optimize
+from vm_optimizer import optimize_commands
 
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TOOL_DIR, os.pardir, os.pardir, "tools"))
 
-def main(path):
-    """Entry point for the vm translator."""
+import build_cache  # noqa: E402
+from source_map import Entry, SourceMap  # noqa: E402
+
+# Code generation options of a translation, optimize runs the VM command
+# optimizer and peephole the optimizer of the generated assembly
+Options = namedtuple(
+    "Options",
+    ["shared_routines", "optimize", "peephole", "top_in_D", "source_map"]
+)
+DEFAULT_OPTIONS = Options(
+    shared_routines=False, optimize=False, peephole=False, top_in_D=False,
+    source_map=False
+)
+
+# A separately translated file: its assembly, number of instructions,
+# (VM commands, instructions) removed by the optimizers and source map
+Unit = namedtuple("Unit", ["assembly", "count", "removed", "source_map"])
+
+
+def main(path, cache=None, jobs=None, options=DEFAULT_OPTIONS,
+         remove_dead=False):
+    """Entry point for the vm translator.
+
+    With remove_dead a directory is translated without the functions the
+    bootstrap never reaches.
+    """
     vm_files_paths = get_vm_files(path)
 
     if not os.path.exists(path):
@@ -26,58 +59,270 @@ def main(path):
         path = os.path.splitext(path)[0]
         isdir = False
 
-    # Create single code write module
-    code_writer = CodeWriter(f"{path}.asm")
+    sources = []
+    for vm_file_path in vm_files_paths:
+        with open(vm_file_path, "rb") as filestream:
+            sources.append((os.path.basename(vm_file_path), filestream.read()))
+
+    dead_functions = []
+    if isdir and remove_dead:
+        sources, dead_sources, dead_functions = remove_dead_functions(
+            sources
+        )
+
+    if cache is not None:
+        # The whole program is keyed by every file name and content
+        key = cache.key(
+            "VMtranslator", build_cache.fingerprint(TOOL_DIR), str(isdir),
+            repr(options), *[part for source in sources for part in source]
+        )
+        data = cache.get(key)
+        map_data = b""
+        if options.source_map:
+            map_data = cache.get(cache.key(key, "map"))
+        if data is not None and map_data is not None:
+            with open(f"{path}.asm", "wb") as asm:
+                asm.write(data)
+            if options.source_map:
+                with open(f"{path}.asm.map", "wb") as source_map:
+                    source_map.write(map_data)
+            return
 
+    units = []
     if isdir:
-        code_writer.writeInit()
+        units.append(translate_init(options))
+    units.extend(translate_units(sources, cache, jobs, options))
 
-    for vm_file_path in vm_files_paths:
-        filestream = open(vm_file_path, "r")
-        parser = Parser(filestream)
-        filestream.close()
-
-        # write to assembly file
-        code_writer.setFileName(os.path.basename(vm_file_path))
-
-        while parser.hasMoreCommands():
-            parser.advance()
-            command_type = parser.commandType()
-
-            if (command_type == CommandType.C_PUSH or
-                    command_type == CommandType.C_POP):
-                segment = parser.arg1()
-                index = parser.arg2()
-                code_writer.writePushPop(
-                    command_type,
-                    segment,
-                    int(index)
-                )
-            elif command_type == CommandType.C_ARITHMETIC:
-                command = parser.arg1()
-                code_writer.writeArithmetic(command)
-            elif command_type == CommandType.C_LABEL:
-                label = parser.arg1()
-                code_writer.writeLabel(label)
-            elif command_type == CommandType.C_GOTO:
-                label = parser.arg1()
-                code_writer.writeGoto(label)
-            elif command_type == CommandType.C_IF:
-                label = parser.arg1()
-                code_writer.writeIf(label)
-            elif command_type == CommandType.C_FUNCTION:
-                label = parser.arg1()
-                number_of_locals = int(parser.arg2())
-                code_writer.writeFunction(label, number_of_locals)
-            elif command_type == CommandType.C_RETURN:
-                code_writer.writeReturn()
-            elif command_type == CommandType.C_CALL:
-                functioname = parser.arg1()
-                number_of_args = int(parser.arg2())
-                code_writer.writeCall(functioname, number_of_args)
-
-        print(code_writer.filestream.get_global_counter())
+    instructions, source_map = link(units, f"{path}.asm", options)
+    if source_map is not None:
+        source_map.write(f"{path}.asm.map")
+    print(f"{path}.asm: {instructions} instructions")
+
+    if options.optimize or options.peephole:
+        names = ["bootstrap"] if isdir else []
+        names.extend(filename for filename, _ in sources)
+        for name, unit in zip(names, units):
+            commands_removed, removed = unit.removed
+            print(f"{name}: removed {commands_removed} VM commands and "
+                  f"{removed} of {unit.count + removed} instructions")
+
+    if dead_functions:
+        report_dead_functions(dead_sources, dead_functions, options)
+
+    if cache is not None:
+        with open(f"{path}.asm", "rb") as asm:
+            cache.put(key, asm.read())
+        if source_map is not None:
+            cache.put(cache.key(key, "map"), source_map.dumps())
+
+
+def report_dead_functions(dead_sources, functions, options=DEFAULT_OPTIONS):
+    """Print the functions removed and the code they would have taken.
+
+    The code is measured by translating the removed functions on their
+    own, with the options of the program.
+    """
+    options = options._replace(source_map=False)
+    commands = 0
+    instructions = 0
+    for filename, source in dead_sources:
+        commands += len(Parser(io.StringIO(source.decode("utf-8"))).commands)
+        instructions += translate_unit(filename, source, None, options).count
+    print(f"removed {len(functions)} unreachable functions: {commands} VM "
+          f"commands, {instructions} instructions ({2 * instructions} "
+          f"bytes of ROM)")
+
+
+def translate_init(options=DEFAULT_OPTIONS):
+    """Return the translation unit of the bootstrap code."""
+    code_writer = CodeWriter(
+        shared_routines=options.shared_routines, top_in_D=options.top_in_D
+    )
+    code_writer.writeInit()
+    assembly, count, removed = finish_unit(code_writer, options)
+    source_map = None
+    if options.source_map:
+        source_map = SourceMap([Entry(0, "-", 0, "$init", "bootstrap")])
+    return Unit(assembly, count, (0, removed), source_map)
+
+
+def translate_unit(filename, source, cache=None, options=DEFAULT_OPTIONS):
+    """Translate a single vm file into a self contained translation unit.
+
+    Generated labels are namespaced by the file, so the assembly of a
+    file only depends on its own content and can be cached on its own.
+    Source maps are only made for unoptimized translations, as the
+    optimizers merge and drop commands.
+    """
+    if options.source_map and (options.optimize or options.peephole):
+        raise ValueError("source maps need an unoptimized translation")
+
+    if cache is not None:
+        key = cache.key(
+            "unit", build_cache.fingerprint(TOOL_DIR), repr(options),
+            filename, source
+        )
+        data = cache.get(key)
+        if data is not None:
+            header, rest = data.decode("utf-8").split("\n", 1)
+            count, commands_removed, removed, map_length = map(
+                int, header.split()
+            )
+            *map_lines, assembly = rest.split("\n", map_length)
+            source_map = None
+            if options.source_map:
+                source_map = SourceMap.loads("\n".join(map_lines))
+            return Unit(
+                assembly, count, (commands_removed, removed), source_map
+            )
+
+    code_writer = CodeWriter(
+        shared_routines=options.shared_routines, top_in_D=options.top_in_D
+    )
+    code_writer.setFileName(filename)
+    parser = Parser(io.StringIO(source.decode("utf-8")))
+    commands = parser.commands_ir()
+    commands_removed = 0
+    if options.optimize:
+        commands, commands_removed = optimize_commands(commands)
+    addresses = [] if options.source_map else None
+    translate(commands, code_writer, addresses)
+
+    assembly, count, removed = finish_unit(code_writer, options)
+    source_map = None
+    map_text = ""
+    if options.source_map:
+        source_map = unit_source_map(filename, parser, addresses)
+        map_text = source_map.dumps()
+    if cache is not None:
+        map_length = len(source_map) if source_map is not None else 0
+        cache.put(
+            key,
+            f"{count} {commands_removed} {removed} {map_length}\n"
+            f"{map_text}{assembly}"
+        )
+    return Unit(assembly, count, (commands_removed, removed), source_map)
+
+
+def unit_source_map(filename, parser, addresses):
+    """Return the source map of a file from the address of each command.
+
+    Commands before the first function belong to one named after the file.
+    """
+    function = os.path.splitext(filename)[0]
+    source_map = SourceMap()
+    for command, line, address in zip(
+            parser.commands, parser.line_numbers, addresses):
+        command = " ".join(command.split())
+        if command.startswith("function "):
+            function = command.split()[1]
+        source_map.append(Entry(address, filename, line, function, command))
+    return source_map
+
+
+def finish_unit(code_writer, options=DEFAULT_OPTIONS):
+    """Return the unit written by code_writer, peephole optimized if
+    requested.
+    """
+    assembly = code_writer.getvalue()
+    count = code_writer.filestream.get_global_counter() + 1
+    if not options.peephole:
+        return assembly, count, 0
+
+    lines, removed = optimize(assembly.split("\n"))
+    return "\n".join(lines), count - removed, removed
+
+
+def translate_units(sources, cache=None, jobs=None, options=DEFAULT_OPTIONS):
+    """Translate (filename, source) pairs into units, in input order.
+
+    Several files are translated concurrently in worker processes, each
+    into its own in-memory buffer.
+    """
+    if jobs == 1 or len(sources) < 2:
+        return [
+            translate_unit(filename, source, cache, options)
+            for filename, source in sources
+        ]
+
+    filenames = [filename for filename, _ in sources]
+    contents = [source for _, source in sources]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(
+            translate_unit, filenames, contents,
+            [cache] * len(sources), [options] * len(sources)
+        ))
+
+
+def link(units, asm_path, options=DEFAULT_OPTIONS):
+    """Concatenate translation units into the final assembly file.
+
+    Return the number of instructions and the source map of the program,
+    which is None without source maps.
+    """
+    code_writer = CodeWriter(
+        asm_path, shared_routines=options.shared_routines
+    )
+    for unit in units:
+        code_writer.writeUnit(unit.assembly, unit.count)
+    source_map = link_source_map(units, code_writer, options)
     code_writer.close()
+    return code_writer.filestream.get_global_counter() + 1, source_map
+
+
+def link_source_map(units, code_writer, options=DEFAULT_OPTIONS):
+    """Return the source map of units written by code_writer, or None.
+
+    Called before the end of the program is written, which is a two
+    instruction loop followed by the shared routines.
+    """
+    if not options.source_map:
+        return None
+
+    source_map = SourceMap()
+    offset = 0
+    for unit in units:
+        source_map.extend(unit.source_map, offset)
+        offset += unit.count
+    halt = code_writer.filestream.get_global_counter() + 1
+    source_map.append(Entry(halt, "-", 0, "$halt", "halt"))
+    if options.shared_routines:
+        source_map.append(
+            Entry(halt + 2, "-", 0, "$shared", "shared routines")
+        )
+    return source_map
+
+
+def translate(commands, code_writer, addresses=None):
+    """Write the assembly of (command type, arg1, arg2) VM commands.
+
+    The address of the first instruction of every command is appended to
+    the list addresses, if given.
+    """
+    for command_type, arg1, arg2 in commands:
+        if addresses is not None:
+            addresses.append(code_writer.filestream.get_global_counter() + 1)
+        if (command_type == CommandType.C_PUSH or
+                command_type == CommandType.C_POP):
+            code_writer.writePushPop(command_type, arg1, arg2)
+        elif command_type == CommandType.C_ARITHMETIC:
+            code_writer.writeArithmetic(arg1)
+        elif command_type == CommandType.C_LABEL:
+            code_writer.writeLabel(arg1)
+        elif command_type == CommandType.C_GOTO:
+            code_writer.writeGoto(arg1)
+        elif command_type == CommandType.C_IF:
+            code_writer.writeIf(arg1)
+        elif command_type == CommandType.C_FUNCTION:
+            code_writer.writeFunction(arg1, arg2)
+        elif command_type == CommandType.C_RETURN:
+            code_writer.writeReturn()
+        elif command_type == CommandType.C_CALL:
+            code_writer.writeCall(arg1, arg2)
+        elif command_type == CommandType.C_MOVE:
+            code_writer.writeMove(arg1, arg2)
+
+    code_writer.flushStack()
 
 
 def get_vm_files(path):
@@ -88,13 +333,82 @@ def get_vm_files(path):
         return [path]
     else:
         if os.path.isdir(path):
-            return glob.glob(path + "*.vm")
+            return sorted(glob.glob(path + "*.vm"))
 
     # Not a valid path fail
     print(f"{path} is not a .vm file or a directory")
     exit(1)
 
 
+def parse_args(argv=None):
+    """Parse the command line arguments of the vm translator."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "path", help="a .vm file or a directory of .vm files ending in /"
+    )
+    arg_parser.add_argument(
+        "--cache", metavar="DIR", default=None,
+        help=("reuse outputs of unchanged inputs from this build cache "
+              "(default: $HACK_BUILD_CACHE, off when unset)")
+    )
+    arg_parser.add_argument(
+        "--cache-size", metavar="MB", type=float, default=None,
+        help="evict least recently used cache entries beyond this size"
+    )
+    arg_parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help=("number of worker processes translating the files of a "
+              "directory (default: number of cores, 1 disables)")
+    )
+    arg_parser.add_argument(
+        "--shared-routines", action="store_true",
+        help=("emit call, return and eq/gt/lt once per program and jump to "
+              "them from small stubs, trading cycles for ROM size")
+    )
+    arg_parser.add_argument(
+        "--top-in-d", action="store_true",
+        help=("keep the top of the stack in the D register between "
+              "commands, writing it to memory only before control flow")
+    )
+    arg_parser.add_argument(
+        "-O", "--optimize", action="store_true",
+        help=("fold constants and drop redundant VM commands, then run "
+              "the --peephole pass, reporting how many commands and "
+              "instructions were removed per file")
+    )
+    arg_parser.add_argument(
+        "--peephole", action="store_true",
+        help=("only drop redundant instructions from the generated "
+              "assembly, reporting how many were removed per file")
+    )
+    arg_parser.add_argument(
+        "--source-map", action="store_true",
+        help=("also write <name>.asm.map, mapping every instruction to its "
+              "VM file, line, command and function")
+    )
+    arg_parser.add_argument(
+        "--remove-dead-functions", action="store_true",
+        help=("translate a directory without the functions Sys.init never "
+              "calls, reporting the code saved")
+    )
+    args = arg_parser.parse_args(argv)
+    if args.source_map and (args.optimize or args.peephole):
+        arg_parser.error(
+            "--source-map cannot be combined with --optimize or --peephole"
+        )
+    return args
+
+
 if __name__ == "__main__":
-    path = sys.argv[1]
-    main(path)
+    args = parse_args()
+    main(
+        args.path,
+        build_cache.open_cache(args.cache, args.cache_size),
+        args.jobs,
+        Options(
+            shared_routines=args.shared_routines, optimize=args.optimize,
+            peephole=args.optimize or args.peephole, top_in_D=args.top_in_d,
+            source_map=args.source_map
+        ),
+        args.remove_dead_functions
+    )
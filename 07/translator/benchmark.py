@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Measure the throughput of the code writer in VM commands per second."""
+
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+
+from parser import Parser
+from code_writer import CodeWriter
+from VMtranslator import translate
+
+
+def main():
+    """Entry point for the code writer benchmark."""
+    args = parse_args()
+    source = generate_program(args.commands, args.seed)
+    commands = Parser(io.StringIO(source)).commands_ir()
+    number_of_commands = len(commands)
+
+    best = None
+    with tempfile.TemporaryDirectory() as directory:
+        asm_path = os.path.join(directory, "Benchmark.asm")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            code_writer = CodeWriter(asm_path)
+            code_writer.setFileName("Benchmark.vm")
+            translate(commands, code_writer)
+            code_writer.close()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+
+    print(f"{number_of_commands} VM commands in {best:.3f} s: "
+          f"{number_of_commands / best:,.0f} commands/s")
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the benchmark."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "-n", "--commands", type=int, default=200000,
+        help="number of VM commands to translate (default: 200000)"
+    )
+    arg_parser.add_argument(
+        "-r", "--repeat", type=int, default=5,
+        help="report the best of this many runs (default: 5)"
+    )
+    arg_parser.add_argument(
+        "--seed", type=int, default=0, help="random seed of the program"
+    )
+    return arg_parser.parse_args(argv)
+
+
+def generate_program(number_of_commands, seed=0):
+    """Return the source of a random but valid VM program."""
+    rng = random.Random(seed)
+    segments = ["local", "argument", "this", "that", "temp", "static"]
+    arithmetic = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]
+
+    lines = ["function Benchmark.main 4"]
+    label = 0
+    while len(lines) < number_of_commands:
+        choice = rng.random()
+        if choice < 0.35:
+            lines.append(f"push constant {rng.randrange(32768)}")
+        elif choice < 0.55:
+            segment = rng.choice(segments)
+            index = rng.randrange(8 if segment == "temp" else 16)
+            lines.append(f"push {segment} {index}")
+        elif choice < 0.70:
+            segment = rng.choice(segments)
+            index = rng.randrange(8 if segment == "temp" else 16)
+            lines.append(f"pop {segment} {index}")
+        elif choice < 0.92:
+            lines.append(rng.choice(arithmetic))
+        elif choice < 0.96:
+            lines.append(f"label L{label}")
+            lines.append(f"if-goto L{label}")
+            label += 1
+        else:
+            lines.append("call Benchmark.main 2")
+
+    lines.append("return")
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    main()
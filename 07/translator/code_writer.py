@@ -1,16 +1,103 @@
 """Translate VM Commands into hack assembly."""
 
+import io
+import os
+
 from parser import CommandType
 
 
+def _template(*lines):
+    """Join lines into a chunk for Filestream.write with its command count."""
+    return "\n".join(lines), len(lines)
+
+
+def _chain(*templates):
+    """Join templates into a single template."""
+    return (
+        "\n".join(text for text, _ in templates),
+        sum(count for _, count in templates)
+    )
+
+
+# Frequently emitted sequences, each buffered as a single chunk
+PUSH_D_TO_STACK = _template("@SP", "A=M", "M=D", "@SP", "M=M+1")
+POP_TO_D = _template("@SP", "M=M-1", "@SP", "A=M", "D=M")
+SET_A_TO_TOP_OF_STACK = _template("@SP", "A=M")
+INCREMENT_SP = _template("@SP", "M=M+1")
+DECREASE_SP = _template("@SP", "M=M-1")
+PUSH_ZERO = _template("@SP", "AM=M+1", "A=A-1", "M=0")
+
+# Pop y to D and point A at x
+BINARY_PROLOGUE = _chain(POP_TO_D, DECREASE_SP, SET_A_TO_TOP_OF_STACK)
+# Point A at y
+UNARY_PROLOGUE = _chain(DECREASE_SP, SET_A_TO_TOP_OF_STACK)
+
+ADD = _chain(BINARY_PROLOGUE, _template("M=M+D"), INCREMENT_SP)
+SUB = _chain(BINARY_PROLOGUE, _template("M=M-D"), INCREMENT_SP)
+AND = _chain(BINARY_PROLOGUE, _template("M=M&D"), INCREMENT_SP)
+OR = _chain(BINARY_PROLOGUE, _template("M=M|D"), INCREMENT_SP)
+NEG = _chain(UNARY_PROLOGUE, _template("M=-M"), INCREMENT_SP)
+NOT = _chain(UNARY_PROLOGUE, _template("M=!M"), INCREMENT_SP)
+COMPARE = _chain(BINARY_PROLOGUE, _template("D=M-D"))
+
+# Binary command -> D=x op y with x at M and y in D
+BINARY_IN_D = {
+    "add": "D=D+M",
+    "sub": "D=M-D",
+    "and": "D=D&M",
+    "or": "D=D|M"
+}
+# Unary command -> D=op y with y in D
+UNARY_IN_D = {
+    "neg": "D=-D",
+    "not": "D=!D"
+}
+# Segment -> register pointing at its base, and the base is fixed
+SEGMENT_BASES = {
+    "local": ("LCL", False),
+    "argument": ("ARG", False),
+    "this": ("THIS", False),
+    "that": ("THAT", False),
+    "pointer": (3, True),
+    "temp": (5, True)
+}
+# Largest index popped by walking A up from the segment base
+MAX_WALKED_INDEX = 6
+
+# Comparison -> routine shared by the whole program in shared routine mode
+SHARED_COMPARISONS = {
+    "eq": "$CMP_EQ",
+    "gt": "$CMP_GT",
+    "lt": "$CMP_LT"
+}
+
+
 class CodeWriter(object):
     """Translate VM Commands into hack assembly."""
 
-    def __init__(self, filepath):
-        """Create an instance of the code writer."""
-        self.filestream = Filestream(open(filepath, 'w'))
+    def __init__(self, filepath=None, shared_routines=False, top_in_D=False):
+        """Create an instance of the code writer.
+
+        Without a filepath the assembly is kept in memory, see getvalue.
+        With shared_routines calls, returns and comparisons jump to a
+        single copy of their code, see writeSharedRoutines.
+        With top_in_D the top of the stack stays in the D register between
+        commands, see flushStack.
+        """
+        if filepath is None:
+            self.filestream = Filestream(io.StringIO())
+        else:
+            self.filestream = Filestream(open(filepath, 'w'))
         self.label_counter = 0
         self.return_label_counter = 0
+        self.shared_routines = shared_routines
+        self.top_in_D = top_in_D
+
+        # Whether D holds the top of the stack instead of RAM[SP - 1]
+        self.cached = False
+
+        # Prefix of generated labels, unique per translated file
+        self.namespace = "$init"
 
     def writeInit(self):
         """Write bootstrap code."""
@@ -23,9 +110,37 @@ class CodeWriter(object):
     def setFileName(self, filename):
         """Close current filestream and open a new one to filepath."""
         self.filename = filename
+        self.namespace = os.path.splitext(filename)[0]
+
+    def getvalue(self):
+        """Return the assembly written to an in memory code writer."""
+        return self.filestream.getFileStream().getvalue()
+
+    def writeUnit(self, assembly, instruction_count):
+        """Write the assembly of a separately translated file."""
+        self.filestream.writeBlock(assembly, instruction_count)
+
+    def flushStack(self):
+        """Write the top of the stack held in D back to the stack.
+
+        Control flow only ever reaches a label with the whole stack in
+        memory, so this is written before labels, jumps, calls, returns
+        and at the end of every file.
+        """
+        if self.cached:
+            self._push_D_to_stack()
+            self.cached = False
 
     def writeArithmetic(self, command):
         """Write  assembly code of arithmetic command."""
+        if self.shared_routines and command in SHARED_COMPARISONS:
+            self.flushStack()
+            self._call_routine(SHARED_COMPARISONS[command])
+            return
+        if self.top_in_D:
+            self._arithmetic_in_D(command)
+            return
+
         if command == "add":
             self._add()
         elif command == "sub":
@@ -47,6 +162,13 @@ class CodeWriter(object):
 
     def writePushPop(self, command_type, segment, index):
         """Write the asemble code for the push pop."""
+        if self.top_in_D:
+            if command_type == CommandType.C_PUSH:
+                self._push_to_D(segment, index)
+            else:
+                self._pop_from_D(segment, index)
+            return
+
         if command_type == CommandType.C_PUSH:
             # push the value from the segment onto the top of stack.
             if segment == "constant":
@@ -85,26 +207,40 @@ class CodeWriter(object):
 
     def writeLabel(self, label):
         """Write label."""
+        self.flushStack()
         self.filestream.write(f"({label})")
         self.filestream.global_counter -= 1
 
     def writeGoto(self, label):
         """Do an unconditional jump to the given label."""
+        self.flushStack()
         self.filestream.write(f"@{label}")
         self.filestream.write("0;JMP")
 
     def writeIf(self, label):
         """Write conditional jump."""
-        self._pop_to_D()
+        if self.top_in_D:
+            self._load_top_to_D()
+            self.cached = False
+        else:
+            self._pop_to_D()
         self.filestream.write(f"@{label}")
         self.filestream.write(f"D;JNE")
 
     def writeCall(self, functioname, number_of_args):
         """Save state of stack and set up args."""
-        # Push return address to stack
-        self._save_segement_address(
-            f"{functioname}.return.{self.return_label_counter}", "A"
+        self.flushStack()
+        return_label = (
+            f"{self.namespace}${functioname}.return."
+            f"{self.return_label_counter}"
         )
+
+        if self.shared_routines:
+            self._call_shared(functioname, number_of_args, return_label)
+            return
+
+        # Push return address to stack
+        self._save_segement_address(return_label, "A")
         self._save_segement_address("LCL", "M")
         self._save_segement_address("ARG", "M")
         self._save_segement_address("THIS", "M")
@@ -136,28 +272,177 @@ class CodeWriter(object):
         self.filestream.write("0;JMP")
 
         # Create label for return address
-        self.filestream.write(
-            f"({functioname}.return.{self.return_label_counter})"
-        )
+        self.writeLabel(return_label)
         self.return_label_counter += 1
 
     def writeFunction(self, label, number_of_locals):
         """Declare a label and initliaze locals to zero."""
+        self.flushStack()
         self.filestream.write(f"({label})")
         self.filestream.global_counter -= 1
 
-        # Initialze locals to error
-
-        # get index of local and add to base
-        for index in range(0, number_of_locals):
-            self._set_D_to_index(index)
-            self.filestream.write("@LCL")
-            self.filestream.write("D=M+D")
-            self.filestream.write("A=D")
-            self.filestream.write("M=0")
+        # Push a zero for every local, LCL already points at the first
+        for _ in range(0, number_of_locals):
+            self.filestream.write(*PUSH_ZERO)
 
     def writeReturn(self):
         """Return the calling function."""
+        self.flushStack()
+        if self.shared_routines:
+            self.filestream.write("@$RETURN\n0;JMP", 2)
+        else:
+            self._write_return()
+
+    def writeSharedRoutines(self):
+        """Write the call, return and comparison routines of the program.
+
+        $CALL expects the return address in D, the function address in
+        R13 and the number of arguments in R14. The comparisons expect
+        their return address in D.
+        """
+        self.writeLabel("$CALL")
+        self._push_D_to_stack()
+        self._save_segement_address("LCL", "M")
+        self._save_segement_address("ARG", "M")
+        self._save_segement_address("THIS", "M")
+        self._save_segement_address("THAT", "M")
+        # ARG = SP - 5 - number of args
+        self.filestream.write(*_template(
+            "@SP", "D=M", "@5", "D=D-A", "@R14", "D=D-M", "@ARG", "M=D"
+        ))
+        # LCL = SP, go to function
+        self.filestream.write(*_template(
+            "@SP", "D=M", "@LCL", "M=D", "@R13", "A=M", "0;JMP"
+        ))
+
+        self.writeLabel("$RETURN")
+        self._write_return()
+
+        for command, routine in SHARED_COMPARISONS.items():
+            self.writeLabel(routine)
+            self.filestream.write("@R15\nM=D", 2)
+            self.filestream.write(*COMPARE)
+            self.filestream.write(f"@{routine}.TRUE\nD;J{command.upper()}", 2)
+            self.filestream.write(*_template(
+                "@SP", "A=M", "M=0", f"@{routine}.END", "0;JMP"
+            ))
+            self.writeLabel(f"{routine}.TRUE")
+            self.filestream.write("@SP\nA=M\nM=-1", 3)
+            self.writeLabel(f"{routine}.END")
+            self.filestream.write(*_template(
+                "@SP", "M=M+1", "@R15", "A=M", "0;JMP"
+            ))
+
+    def _load_top_to_D(self):
+        """Make D hold the top of the stack, popping it if it is in memory."""
+        if not self.cached:
+            self.filestream.write("@SP\nAM=M-1\nD=M", 3)
+            self.cached = True
+
+    def writeMove(self, source, destination):
+        """Copy segment[index] of source to that of destination.
+
+        Both are (segment, index) pairs, the stack is left untouched.
+        """
+        self.flushStack()
+        self._load_D(*source)
+        self._store_D(*destination)
+
+    def _push_to_D(self, segment, index):
+        """Push segment[index] by loading it into D."""
+        self.flushStack()
+        self._load_D(segment, index)
+        self.cached = True
+
+    def _pop_from_D(self, segment, index):
+        """Pop the top of the stack, loaded into D, to segment[index]."""
+        self._load_top_to_D()
+        self.cached = False
+        self._store_D(segment, index)
+
+    def _load_D(self, segment, index):
+        """Set D to the value of segment[index]."""
+        if segment == "constant":
+            self._set_D_to_constant(index)
+        elif segment == "static":
+            self.filestream.write(f"@{self.filename}.{index}\nD=M", 2)
+        elif SEGMENT_BASES[segment][1]:
+            base, _ = SEGMENT_BASES[segment]
+            self.filestream.write(f"@R{base + index}\nD=M", 2)
+        else:
+            self._set_D_to_index(index)
+            self.filestream.write(
+                f"@{SEGMENT_BASES[segment][0]}\nA=M+D\nD=M", 3
+            )
+
+    def _store_D(self, segment, index):
+        """Write the value of D to segment[index]."""
+        if segment == "static":
+            self.filestream.write(f"@{self.filename}.{index}\nM=D", 2)
+            return
+
+        base, fixed = SEGMENT_BASES[segment]
+        if fixed:
+            self.filestream.write(f"@R{base + index}\nM=D", 2)
+        elif index <= MAX_WALKED_INDEX:
+            lines = [f"@{base}", "A=M" if index == 0 else "A=M+1"]
+            lines.extend(["A=A+1"] * (index - 1))
+            lines.append("M=D")
+            self.filestream.write(*_template(*lines))
+        else:
+            # Park the value while D computes the address
+            self.filestream.write("@R14\nM=D", 2)
+            self._set_D_to_index(index)
+            self.filestream.write(*_template(
+                f"@{base}", "D=M+D", "@R13", "M=D",
+                "@R14", "D=M", "@R13", "A=M", "M=D"
+            ))
+
+    def _arithmetic_in_D(self, command):
+        """Write an arithmetic command leaving its result in D."""
+        self._load_top_to_D()
+        if command in UNARY_IN_D:
+            self.filestream.write(UNARY_IN_D[command])
+            return
+
+        self.filestream.write("@SP\nAM=M-1", 2)
+        if command in BINARY_IN_D:
+            self.filestream.write(BINARY_IN_D[command])
+            return
+
+        true_label = f"{self.namespace}$true-{self.label_counter}"
+        end_label = f"{self.namespace}$end-jump-{self.label_counter}"
+        self.label_counter += 1
+        # Both branches leave the result in D, labels are written
+        # directly as the stack is consistent on either path
+        self.filestream.write(*_template(
+            "D=M-D", f"@{true_label}", f"D;J{command.upper()}",
+            "D=0", f"@{end_label}", "0;JMP"
+        ))
+        self.filestream.write(f"({true_label})\nD=-1\n({end_label})", 1)
+
+    def _call_shared(self, functioname, number_of_args, return_label):
+        """Call a function through the shared $CALL routine."""
+        self.filestream.write(f"@{functioname}\nD=A\n@R13\nM=D", 4)
+        if number_of_args <= 1:
+            self.filestream.write(f"@R14\nM={number_of_args}", 2)
+        else:
+            self._set_D_to_index(number_of_args)
+            self.filestream.write("@R14\nM=D", 2)
+        self.filestream.write(f"@{return_label}\nD=A\n@$CALL\n0;JMP", 4)
+
+        self.writeLabel(return_label)
+        self.return_label_counter += 1
+
+    def _call_routine(self, routine):
+        """Jump to a shared routine which returns to the next command."""
+        return_label = f"{self.namespace}$ret-{self.label_counter}"
+        self.label_counter += 1
+        self.filestream.write(f"@{return_label}\nD=A\n@{routine}\n0;JMP", 4)
+        self.writeLabel(return_label)
+
+    def _write_return(self):
+        """Write the code returning from a function."""
         # local is the address imediately after the saved state.
         self.filestream.write("@LCL")
         self.filestream.write("D=M")
@@ -223,7 +508,7 @@ class CodeWriter(object):
 
     def _push_constant(self, index):
         """Push constant to top of stack."""
-        self._set_D_to_index(index)
+        self._set_D_to_constant(index)
         self._push_D_to_stack()
 
     def _push_segment_index(self, segment, index, AM):
@@ -274,120 +559,88 @@ class CodeWriter(object):
 
     def _set_D_to_index(self, index):
         """Set D register to value of the index."""
-        self.filestream.write(f"@{index}")
-        self.filestream.write("D=A")
+        self.filestream.write(f"@{index}\nD=A", 2)
+
+    def _set_D_to_constant(self, value):
+        """Set D register to a signed 16 bit value."""
+        if value >= 0:
+            self._set_D_to_index(value)
+        elif value == -1:
+            self.filestream.write("D=-1")
+        elif value > -32768:
+            self.filestream.write(f"@{-value}\nD=-A", 2)
+        else:
+            self.filestream.write("@32767\nD=-A\nD=D-1", 3)
 
     def _add(self):
         """Add the top two values of the stack."""
         # M=M+D
-
-        self._pop_to_D()
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("M=M+D")
-        self._increment_SP()
+        self.filestream.write(*ADD)
 
     def _sub(self):
         """Subtract Second value from top value from the stack."""
         # M=M-D
-        self._pop_to_D()
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("M=M-D")
-        self._increment_SP()
+        self.filestream.write(*SUB)
 
     def _eq(self):
         # D=M-D;JEQ
-
-        self._pop_to_D()
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("D=M-D")
+        self.filestream.write(*COMPARE)
         self._jump("JEQ")
 
     def _lt(self):
         """Compare that the second value in the stack is less than the top."""
-        self._pop_to_D()
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("D=M-D")
+        self.filestream.write(*COMPARE)
         self._jump("JLT")
 
     def _gt(self):
         """Compare that the second value in the stack is less than the top."""
-        self._pop_to_D()
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("D=M-D")
+        self.filestream.write(*COMPARE)
         self._jump("JGT")
 
     def _neg(self):
         """Negate the top value of the stack."""
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("M=-M")
-        self._increment_SP()
+        self.filestream.write(*NEG)
 
     def _and(self):
         """Bitwise and top two values of the stack."""
         # M=M&D
-        self._pop_to_D()
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("M=M&D")
-        self._increment_SP()
+        self.filestream.write(*AND)
 
     def _or(self):
         """Bitwise Or top two values of the stack."""
         # M=M|D
-        self._pop_to_D()
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("M=M|D")
-        self._increment_SP()
+        self.filestream.write(*OR)
 
     def _not(self):
         """Bitwise not the top value of the stack."""
         # M=!M
-        self._decrease_SP()
-        self._set_A_to_top_of_stack()  # A = value @SP
-        self.filestream.write("M=!M")
-        self._increment_SP()
+        self.filestream.write(*NOT)
 
     def _push_D_to_stack(self):
         """Push the value of the D register to top of the stack."""
-        self.filestream.write("@SP")
-        self.filestream.write("A=M")
-        self.filestream.write("M=D")
-        self._increment_SP()
+        self.filestream.write(*PUSH_D_TO_STACK)
 
     def _pop_to_D(self):
         """Pop the top of the stack to the D Register."""
         # Load the top most value of the stack to D
-        self._decrease_SP()
-        self.filestream.write("@SP")
-        self.filestream.write("A=M")  # Load top of stack to A register
-        self.filestream.write("D=M")
+        self.filestream.write(*POP_TO_D)
 
     def _set_A_to_top_of_stack(self):
         """Set the A register to the address stored at the value of SP."""
-        self.filestream.write("@SP")
-        self.filestream.write("A=M")
+        self.filestream.write(*SET_A_TO_TOP_OF_STACK)
 
     def _increment_SP(self):
         """Increase address of SP by 1."""
-        self.filestream.write("@SP")
-        self.filestream.write("M=M+1")
+        self.filestream.write(*INCREMENT_SP)
 
     def _decrease_SP(self):
         """Decrease address of SP by."""
-        self.filestream.write("@SP")
-        self.filestream.write("M=M-1")
+        self.filestream.write(*DECREASE_SP)
 
     def _jump(self, jump_type):
         """Set jump address and write jump command."""
         self.filestream.get_global_counter() + 10
-        self.filestream.write(f"@true-{self.label_counter}")
+        self.filestream.write(f"@{self.namespace}$true-{self.label_counter}")
         # 7 false command plus the two commands setting up the jump
 
         self.filestream.write(f"D;{jump_type}")
@@ -406,13 +659,15 @@ class CodeWriter(object):
         # Jump pass the true block
         self.filestream.get_global_counter() + 8
 
-        self.filestream.write(f"@end-jump-{self.label_counter}")
+        self.filestream.write(
+            f"@{self.namespace}$end-jump-{self.label_counter}"
+        )
         self.filestream.write("0;JMP")
 
     def _push_true(self):
         """Push false -1 to stack."""
         # Label start of true block
-        self.writeLabel(f"true-{self.label_counter}")
+        self.writeLabel(f"{self.namespace}$true-{self.label_counter}")
 
         # five total commands
         self.filestream.write("@SP")
@@ -421,42 +676,78 @@ class CodeWriter(object):
         self._increment_SP()  # two commands here
 
         # label end of the true block
-        self.writeLabel(f"end-jump-{self.label_counter}")
+        self.writeLabel(f"{self.namespace}$end-jump-{self.label_counter}")
 
         # ensure we create a new unique label in the next jump
         self.label_counter += 1
 
-    def close(self):
-        """Close file."""
+    def writeEnd(self):
+        """Write the final infinite loop and any shared routines."""
+        self.flushStack()
+
         # Loop at the end forever
         counter = self.filestream.get_global_counter() + 2
         self.filestream.write(f"@{counter}")
         self.filestream.write("0;JMP")
+
+        if self.shared_routines:
+            self.writeSharedRoutines()
+
+    def close(self):
+        """Close file."""
+        self.writeEnd()
         self.filestream.close()
 
 
 class Filestream(object):
-    """Implements a custom write for a filesteam."""
+    """Implements a custom buffered write for a filesteam.
+
+    Lines are collected in memory and handed to the underlying filestream
+    in chunks of BUFFER_LINES joined lines.
+    """
+
+    BUFFER_LINES = 8192
 
     def __init__(self, filestream):
         """Create a filestream object."""
         self.filestream = filestream
         self.global_counter = -1
+        self.buffer = []
 
     def getFileStream(self):
-        """Return filestream property."""
+        """Return filestream property, with every buffered line written."""
+        self.flush()
         return self.filestream
 
     def get_global_counter(self):
         """Return current global counter."""
         return self.global_counter
 
-    def write(self, string):
-        """Write line to file with a newline character."""
-        self.filestream.write(f"{string}\n")
-        self.global_counter += 1
+    def write(self, string, instruction_count=1):
+        """Buffer a line, or several joined by newlines, for the file.
+
+        instruction_count is the number of commands in string.
+        """
+        self.buffer.append(string)
+        self.global_counter += instruction_count
+        if len(self.buffer) >= Filestream.BUFFER_LINES:
+            self.flush()
+
+    def writeBlock(self, lines, instruction_count):
+        """Write newline terminated lines of instruction_count commands."""
+        self.flush()
+        self.filestream.write(lines)
+        self.global_counter += instruction_count
+
+    def flush(self):
+        """Write the buffered lines to the file."""
+        if self.buffer:
+            self.buffer.append("")
+            self.filestream.write("\n".join(self.buffer))
+            self.buffer = []
 
     def close(self):
         """Close file."""
         if self.filestream is not None:
+            self.flush()
             self.filestream.close()
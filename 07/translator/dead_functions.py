@@ -0,0 +1,85 @@
+"""Remove the functions a whole vm program never calls."""
+from collections import namedtuple
+
+# A function of a vm file: its name, the index of its first line, the
+# index after its last line and the names of the functions it calls
+Function = namedtuple("Function", ["name", "start", "end", "calls"])
+
+
+def read_functions(lines):
+    """Return the Functions of the lines of a vm file.
+
+    Commands before the first function are returned as a Function named
+    None, which is always kept.
+    """
+    functions = [Function(None, 0, len(lines), [])]
+    for index, line in enumerate(lines):
+        command = line.split("//")[0].split()
+        if not command:
+            continue
+        if command[0] == "function":
+            functions[-1] = functions[-1]._replace(end=index)
+            functions.append(Function(command[1], index, len(lines), []))
+        elif command[0] == "call":
+            functions[-1].calls.append(command[1])
+    return functions
+
+
+def reachable(graph, roots):
+    """Return the names reachable from roots in graph, name -> callees."""
+    seen = set()
+    pending = [root for root in roots if root in graph]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        pending.extend(callee for callee in graph[name] if callee in graph)
+    return seen
+
+
+def remove_dead_functions(sources, roots=("Sys.init",)):
+    """Drop the functions of (filename, source) pairs roots never reach.
+
+    The call graph is built from the call commands of every file, commands
+    outside functions count as roots too. The lines of a removed function
+    are blanked, so the others keep their line numbers. Nothing is removed
+    unless every root is defined. Return the new sources, the removed code
+    as (filename, source) pairs of the files losing functions, with their
+    other lines blanked, and the names of the removed functions.
+    """
+    files = []
+    graph = {}
+    kept_calls = []
+    for filename, source in sources:
+        lines = source.decode("utf-8").split("\n")
+        functions = read_functions(lines)
+        files.append((filename, lines, functions))
+        kept_calls.extend(functions[0].calls)
+        for function in functions[1:]:
+            graph.setdefault(function.name, []).extend(function.calls)
+
+    if not all(root in graph for root in roots):
+        return sources, [], []
+    live = reachable(graph, list(roots) + kept_calls)
+
+    pruned = []
+    dead_sources = []
+    removed = []
+    for filename, lines, functions in files:
+        kept = list(lines)
+        dead = [""] * len(lines)
+        losing = False
+        for function in functions[1:]:
+            if function.name in live:
+                continue
+            removed.append(function.name)
+            losing = True
+            kept[function.start:function.end] = \
+                [""] * (function.end - function.start)
+            dead[function.start:function.end] = \
+                lines[function.start:function.end]
+        pruned.append((filename, "\n".join(kept).encode("utf-8")))
+        if losing:
+            dead_sources.append((filename, "\n".join(dead).encode("utf-8")))
+    return pruned, dead_sources, removed
@@ -0,0 +1,99 @@
+"""Peephole optimizer for the generated hack assembly."""
+
+# What the A register is known to hold
+UNKNOWN = None
+SP_VALUE = "*SP"  # the address stored in SP, i.e. the top of the stack
+
+
+def optimize(lines):
+    """Remove redundant instructions from a list of assembly lines.
+
+    The rules only look at straight line code, a label forgets everything
+    known about the registers:
+
+    - M=M+1 directly followed by M=M-1 (or the reverse) cancel out, this
+      removes the SP adjustments between consecutive push and pop.
+    - @X is dropped when A already holds X, and @SP A=M when A already
+      points at the top of the stack.
+    - @X directly followed by another A-command is a dead load.
+    - D=M directly after M=D (or M=D after D=M) is a no-op.
+
+    The rules are applied until nothing changes. Return the optimized
+    lines and the number of instructions removed.
+    """
+    count = _count_instructions(lines)
+    while True:
+        optimized = _optimize_pass(lines)
+        if len(optimized) == len(lines):
+            break
+        lines = optimized
+
+    return lines, count - _count_instructions(lines)
+
+
+def _optimize_pass(lines):
+    """Apply every rule once over lines."""
+    out = []
+    a_register = UNKNOWN
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        index += 1
+
+        if not line or line.startswith("("):
+            out.append(line)
+            a_register = UNKNOWN
+            continue
+
+        if line.startswith("@"):
+            symbol = line[1:]
+            if a_register == symbol:
+                continue
+            next_line = lines[index] if index < len(lines) else None
+            if (a_register == SP_VALUE and symbol == "SP" and
+                    next_line == "A=M"):
+                index += 1
+                continue
+            if out and out[-1].startswith("@"):
+                out.pop()
+            out.append(line)
+            a_register = symbol
+            continue
+
+        previous = out[-1] if out else None
+        if (line, previous) in _CANCELLING:
+            out.pop()
+            continue
+        if (line, previous) in _REDUNDANT:
+            continue
+
+        out.append(line)
+        dest = line.split("=")[0] if "=" in line else ""
+        if "A" in dest:
+            if a_register == "SP" and line in _LOADS_TOP_OF_STACK:
+                a_register = SP_VALUE
+            else:
+                a_register = UNKNOWN
+
+    return out
+
+
+# (line, previous line) pairs where both lines can be removed
+_CANCELLING = {
+    ("M=M-1", "M=M+1"),
+    ("M=M+1", "M=M-1"),
+}
+
+# (line, previous line) pairs where line does nothing
+_REDUNDANT = {
+    ("D=M", "M=D"),
+    ("M=D", "D=M"),
+}
+
+# Commands leaving the top of stack address in A when A is SP
+_LOADS_TOP_OF_STACK = {"A=M", "AM=M-1", "AM=M+1"}
+
+
+def _count_instructions(lines):
+    """Count the lines which are neither empty nor labels."""
+    return sum(1 for line in lines if line and not line.startswith("("))
@@ -19,20 +19,14 @@ class Parser(object):
 
     def __init__(self, filestream):
         """Create an instance of Parser."""
-        # Filter out comments
-        lines = list(filter(
-            lambda x: not x.startswith("//"), filestream.readlines()
-        ))
-
-        # Remove new line character and emtpy strings
-        commands = list(filter(
-            None, [line.strip() for line in lines]
-        ))
-
-        # remove any inline comments
-        self.commands = list(map(
-            lambda x: x.split("//")[0].strip(), commands
-        ))
+        # Drop comments and empty lines, keeping the line of each command
+        self.commands = []
+        self.line_numbers = []
+        for number, line in enumerate(filestream.readlines(), 1):
+            command = line.split("//")[0].strip()
+            if command:
+                self.commands.append(command)
+                self.line_numbers.append(number)
 
         self.current_index = -1
         self.command = None
@@ -49,6 +43,29 @@ class Parser(object):
         self.current_index += 1
         self.command = self.commands[self.current_index]
 
+    def commands_ir(self):
+        """Return the remaining commands as (command type, arg1, arg2).
+
+        arg1 and arg2 are None for commands without them, arg2 is an int.
+        """
+        with_arg2 = {
+            CommandType.C_PUSH,
+            CommandType.C_POP,
+            CommandType.C_FUNCTION,
+            CommandType.C_CALL
+        }
+        commands = []
+        while self.hasMoreCommands():
+            self.advance()
+            command_type = self.commandType()
+            arg1 = arg2 = None
+            if command_type != CommandType.C_RETURN:
+                arg1 = self.arg1()
+            if command_type in with_arg2:
+                arg2 = int(self.arg2())
+            commands.append((command_type, arg1, arg2))
+        return commands
+
     def commandType(self):
         """Return the type of the VM command."""
         if self.command.startswith("push"):
@@ -114,3 +131,5 @@ class CommandType(Enum):
     C_RETURN = auto()
     C_FUNCTION = auto()
     C_CALL = auto()
+    # pop segment[index] <- push segment[index], only made by vm_optimizer
+    C_MOVE = auto()
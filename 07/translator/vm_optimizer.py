@@ -0,0 +1,89 @@
+"""Optimize VM commands before they are translated to assembly."""
+
+from parser import CommandType
+
+# Arithmetic on 16 bit words as the generated assembly computes it
+BINARY = {
+    "add": lambda x, y: x + y,
+    "sub": lambda x, y: x - y,
+    "and": lambda x, y: x & y,
+    "or": lambda x, y: x | y,
+    # comparisons look at the sign of the wrapped x - y like D=M-D does
+    "eq": lambda x, y: -1 if _to_word(x - y) == 0 else 0,
+    "gt": lambda x, y: -1 if _to_word(x - y) > 0 else 0,
+    "lt": lambda x, y: -1 if _to_word(x - y) < 0 else 0
+}
+UNARY = {
+    "neg": lambda y: -y,
+    "not": lambda y: ~y
+}
+
+
+def optimize_commands(commands):
+    """Rewrite a list of (command type, arg1, arg2) VM commands.
+
+    Every rule looks at the end of the commands kept so far, so a rewrite
+    can enable another one further back:
+
+    - arithmetic on pushed constants is folded into one constant, which
+      may be negative.
+    - push x / pop x is removed.
+    - push constant / if-goto is removed when the constant is 0, and
+      becomes a goto otherwise.
+    - push x / pop y becomes a single C_MOVE command (arg1 = x, arg2 = y
+      as (segment, index) pairs) that does not touch the stack.
+
+    Return the new commands and the number of commands removed.
+    """
+    out = []
+    for command in commands:
+        command_type, arg1, arg2 = command
+
+        if command_type == CommandType.C_ARITHMETIC:
+            if arg1 in UNARY and _pushes_constant(out, 1):
+                value = out.pop()[2]
+                out.append(_constant(UNARY[arg1](value)))
+                continue
+            if arg1 in BINARY and _pushes_constant(out, 2):
+                y = out.pop()[2]
+                x = out.pop()[2]
+                out.append(_constant(BINARY[arg1](x, y)))
+                continue
+
+        elif command_type == CommandType.C_IF and _pushes_constant(out, 1):
+            if out.pop()[2] != 0:
+                out.append((CommandType.C_GOTO, arg1, None))
+            continue
+
+        elif (command_type == CommandType.C_POP and out and
+                out[-1][0] == CommandType.C_PUSH):
+            _, segment, index = out.pop()
+            if (segment, index) != (arg1, arg2):
+                out.append(
+                    (CommandType.C_MOVE, (segment, index), (arg1, arg2))
+                )
+            continue
+
+        out.append(command)
+
+    return out, len(commands) - len(out)
+
+
+def _pushes_constant(commands, count):
+    """Check if the last count commands all push a constant."""
+    if len(commands) < count:
+        return False
+    return all(
+        command_type == CommandType.C_PUSH and segment == "constant"
+        for command_type, segment, _ in commands[-count:]
+    )
+
+
+def _constant(value):
+    """Return the command pushing value as a signed 16 bit constant."""
+    return (CommandType.C_PUSH, "constant", _to_word(value))
+
+
+def _to_word(value):
+    """Wrap value to the range of a signed 16 bit word."""
+    return (value + 0x8000) % 0x10000 - 0x8000
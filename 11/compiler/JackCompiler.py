@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Compiles jack files to vm files."""
+
+import argparse
+import glob
+import os
+import sys
+
+from compilation_engine import CompilationEngine
+from tokenizer import JackError, JackTokenizer
+from vm_writer import VMWriter
+
+
+def main(path):
+    """Compile a .jack file, or every .jack file of a directory."""
+    jack_files_paths = get_jack_files(path)
+
+    failed = False
+    for jack_file_path in jack_files_paths:
+        try:
+            compile_file(jack_file_path)
+        except JackError as error:
+            print(f"{jack_file_path}: {error}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+def compile_file(jack_file_path, vm_file_path=None):
+    """Compile a .jack file, writing the .vm file next to it by default."""
+    if vm_file_path is None:
+        vm_file_path = os.path.splitext(jack_file_path)[0] + ".vm"
+
+    with open(jack_file_path) as filestream:
+        engine = CompilationEngine(
+            JackTokenizer(filestream), VMWriter(vm_file_path)
+        )
+        engine.compileClass()
+
+
+def compile_source(source):
+    """Return the vm code of the jack class in source."""
+    writer = VMWriter()
+    engine = CompilationEngine(JackTokenizer(source.splitlines()), writer)
+    engine.compileClass()
+    return writer.getvalue()
+
+
+def get_jack_files(path):
+    """Return a list of jack files."""
+    if os.path.splitext(path)[1] == ".jack" and os.path.isfile(path):
+        return [path]
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.jack")))
+
+    print(f"{path} is not a .jack file or a directory")
+    sys.exit(1)
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the jack compiler."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "path", help="a .jack file or a directory of .jack files"
+    )
+    return arg_parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args().path)
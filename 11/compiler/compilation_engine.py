@@ -0,0 +1,347 @@
+"""Compile the tokens of a jack class into vm commands."""
+from symbol_table import SymbolTable
+from tokenizer import JackError, TokenType
+
+# Binary operator -> vm command, or OS function called with both operands
+BINARY_OPERATORS = {
+    "+": "add",
+    "-": "sub",
+    "&": "and",
+    "|": "or",
+    "<": "lt",
+    ">": "gt",
+    "=": "eq",
+    "*": "call Math.multiply 2",
+    "/": "call Math.divide 2"
+}
+UNARY_OPERATORS = {
+    "-": "neg",
+    "~": "not"
+}
+
+
+class CompilationEngine(object):
+    """Recursive descent compiler of a single jack class.
+
+    Every compile method starts at the first token of its construct and
+    leaves the tokenizer at its last token. Labels are prefixed with the
+    subroutine name as the vm translator does not scope them.
+    """
+
+    def __init__(self, tokenizer, vm_writer):
+        """Create a compilation engine reading tokens from tokenizer."""
+        self.tokenizer = tokenizer
+        self.writer = vm_writer
+        self.symbols = SymbolTable()
+        self.class_name = None
+        self.subroutine_name = None
+        self.label_count = 0
+
+    def compileClass(self):
+        """Compile class name { classVarDec* subroutineDec* }."""
+        self.expect("class")
+        self.class_name = self.expect_identifier()
+        self.expect("{")
+        while self.peek_value() in ("static", "field"):
+            self.compileClassVarDec()
+        while self.peek_value() in ("constructor", "function", "method"):
+            self.compileSubroutine()
+        self.expect("}")
+        if self.tokenizer.hasMoreTokens():
+            self.error("expected the end of the file after the class",
+                       self.tokenizer.peek())
+        self.writer.close()
+
+    def compileClassVarDec(self):
+        """Compile (static | field) type name (, name)* ;."""
+        kind = self.tokenizer.advance().value
+        self.compile_names(kind)
+
+    def compileSubroutine(self):
+        """Compile a constructor, function or method declaration."""
+        kind = self.tokenizer.advance().value
+        self.tokenizer.advance()  # the return type
+        self.subroutine_name = self.expect_identifier()
+        self.label_count = 0
+        self.symbols.startSubroutine()
+        if kind == "method":
+            self.symbols.define("this", self.class_name, "arg")
+
+        self.expect("(")
+        self.compileParameterList()
+        self.expect(")")
+        self.expect("{")
+        while self.peek_value() == "var":
+            self.compileVarDec()
+
+        self.writer.writeFunction(
+            f"{self.class_name}.{self.subroutine_name}",
+            self.symbols.varCount("var")
+        )
+        if kind == "constructor":
+            self.writer.writePush("constant", self.symbols.varCount("field"))
+            self.writer.writeCall("Memory.alloc", 1)
+            self.writer.writePop("pointer", 0)
+        elif kind == "method":
+            self.writer.writePush("argument", 0)
+            self.writer.writePop("pointer", 0)
+
+        self.compileStatements()
+        self.expect("}")
+
+    def compileParameterList(self):
+        """Compile a possibly empty list of type name pairs."""
+        if self.peek_value() == ")":
+            return
+        while True:
+            type_ = self.tokenizer.advance().value
+            self.symbols.define(self.expect_identifier(), type_, "arg")
+            if self.peek_value() != ",":
+                return
+            self.tokenizer.advance()
+
+    def compileVarDec(self):
+        """Compile var type name (, name)* ;."""
+        self.tokenizer.advance()
+        self.compile_names("var")
+
+    def compile_names(self, kind):
+        """Compile type name (, name)* ; defining variables of kind."""
+        type_ = self.tokenizer.advance().value
+        while True:
+            self.symbols.define(self.expect_identifier(), type_, kind)
+            if self.tokenizer.advance().value == ";":
+                return
+            if self.tokenizer.token.value != ",":
+                self.error("expected , or ;")
+
+    def compileStatements(self):
+        """Compile statements up to the closing brace."""
+        statements = {
+            "let": self.compileLet,
+            "if": self.compileIf,
+            "while": self.compileWhile,
+            "do": self.compileDo,
+            "return": self.compileReturn
+        }
+        while self.peek_value() in statements:
+            statements[self.tokenizer.advance().value]()
+
+    def compileLet(self):
+        """Compile let name([expression])? = expression ;."""
+        name = self.expect_identifier()
+        segment, index = self.variable(name)
+        if self.peek_value() == "[":
+            self.tokenizer.advance()
+            self.writer.writePush(segment, index)
+            self.compileExpression()
+            self.expect("]")
+            self.writer.writeArithmetic("add")
+            self.expect("=")
+            self.compileExpression()
+            # the value is parked while pointer 1 is set to the element
+            self.writer.writePop("temp", 0)
+            self.writer.writePop("pointer", 1)
+            self.writer.writePush("temp", 0)
+            self.writer.writePop("that", 0)
+        else:
+            self.expect("=")
+            self.compileExpression()
+            self.writer.writePop(segment, index)
+        self.expect(";")
+
+    def compileIf(self):
+        """Compile if (expression) { statements } (else { statements })?."""
+        else_label = self.new_label("IF_ELSE")
+        self.compile_condition(else_label)
+        if self.peek_value() == "else":
+            end_label = self.new_label("IF_END")
+            self.writer.writeGoto(end_label)
+            self.writer.writeLabel(else_label)
+            self.tokenizer.advance()
+            self.compile_block()
+            self.writer.writeLabel(end_label)
+        else:
+            self.writer.writeLabel(else_label)
+
+    def compileWhile(self):
+        """Compile while (expression) { statements }."""
+        loop_label = self.new_label("WHILE_EXP")
+        end_label = self.new_label("WHILE_END")
+        self.writer.writeLabel(loop_label)
+        self.compile_condition(end_label)
+        self.writer.writeGoto(loop_label)
+        self.writer.writeLabel(end_label)
+
+    def compile_condition(self, false_label):
+        """Compile (expression) { statements }, skipped when false."""
+        self.expect("(")
+        self.compileExpression()
+        self.expect(")")
+        self.writer.writeArithmetic("not")
+        self.writer.writeIf(false_label)
+        self.compile_block()
+
+    def compile_block(self):
+        """Compile { statements }."""
+        self.expect("{")
+        self.compileStatements()
+        self.expect("}")
+
+    def compileDo(self):
+        """Compile do subroutineCall ; dropping the returned value."""
+        self.compile_call(self.expect_identifier())
+        self.writer.writePop("temp", 0)
+        self.expect(";")
+
+    def compileReturn(self):
+        """Compile return expression? ;."""
+        if self.peek_value() == ";":
+            self.writer.writePush("constant", 0)
+        else:
+            self.compileExpression()
+        self.expect(";")
+        self.writer.writeReturn()
+
+    def compileExpression(self):
+        """Compile term (op term)*, evaluated left to right."""
+        self.compileTerm()
+        while self.peek_value() in BINARY_OPERATORS and \
+                self.tokenizer.peek().type == TokenType.SYMBOL:
+            operator = self.tokenizer.advance().value
+            self.compileTerm()
+            command = BINARY_OPERATORS[operator]
+            if command.startswith("call"):
+                _, name, n_args = command.split()
+                self.writer.writeCall(name, int(n_args))
+            else:
+                self.writer.writeArithmetic(command)
+
+    def compileTerm(self):
+        """Compile a constant, variable, call, (expression) or op term."""
+        token = self.tokenizer.advance()
+        if token.type == TokenType.INT_CONST:
+            self.writer.writePush("constant", token.value)
+        elif token.type == TokenType.STRING_CONST:
+            self.writer.writePush("constant", len(token.value))
+            self.writer.writeCall("String.new", 1)
+            for character in token.value:
+                self.writer.writePush("constant", ord(character))
+                self.writer.writeCall("String.appendChar", 2)
+        elif token.type == TokenType.KEYWORD:
+            self.compile_keyword_constant(token)
+        elif token.type == TokenType.IDENTIFIER:
+            following = self.peek_value()
+            if following in ("(", "."):
+                self.compile_call(token.value)
+            else:
+                self.writer.writePush(*self.variable(token.value))
+                if following == "[":
+                    self.tokenizer.advance()
+                    self.compileExpression()
+                    self.expect("]")
+                    self.writer.writeArithmetic("add")
+                    self.writer.writePop("pointer", 1)
+                    self.writer.writePush("that", 0)
+        elif token.value == "(":
+            self.compileExpression()
+            self.expect(")")
+        elif token.value in UNARY_OPERATORS:
+            self.compileTerm()
+            self.writer.writeArithmetic(UNARY_OPERATORS[token.value])
+        else:
+            self.error("expected a term", token)
+
+    def compile_keyword_constant(self, token):
+        """Compile true, false, null or this."""
+        if token.value == "true":
+            self.writer.writePush("constant", 1)
+            self.writer.writeArithmetic("neg")
+        elif token.value in ("false", "null"):
+            self.writer.writePush("constant", 0)
+        elif token.value == "this":
+            self.writer.writePush("pointer", 0)
+        else:
+            self.error("expected a term", token)
+
+    def compileExpressionList(self):
+        """Compile a possibly empty list of expressions, return its size."""
+        if self.peek_value() == ")":
+            return 0
+        count = 1
+        self.compileExpression()
+        while self.peek_value() == ",":
+            self.tokenizer.advance()
+            self.compileExpression()
+            count += 1
+        return count
+
+    def compile_call(self, name):
+        """Compile the rest of a subroutine call starting with name.
+
+        name(...) calls a method on this, variable.name(...) a method on
+        the object in the variable and Class.name(...) a function or
+        constructor.
+        """
+        n_args = 0
+        if self.peek_value() == ".":
+            self.tokenizer.advance()
+            subroutine = self.expect_identifier()
+            if self.symbols.kindOf(name) is not None:
+                self.writer.writePush(*self.variable(name))
+                name = f"{self.symbols.typeOf(name)}.{subroutine}"
+                n_args = 1
+            else:
+                name = f"{name}.{subroutine}"
+        else:
+            self.writer.writePush("pointer", 0)
+            name = f"{self.class_name}.{name}"
+            n_args = 1
+
+        self.expect("(")
+        n_args += self.compileExpressionList()
+        self.expect(")")
+        self.writer.writeCall(name, n_args)
+
+    def variable(self, name):
+        """Return the segment and index of a variable."""
+        if self.symbols.kindOf(name) is None:
+            raise JackError(
+                f"line {self.tokenizer.token.line}: undefined variable {name}"
+            )
+        return self.symbols.segmentOf(name), self.symbols.indexOf(name)
+
+    def new_label(self, prefix):
+        """Return a label unique to the whole program."""
+        label = (f"{self.class_name}.{self.subroutine_name}${prefix}"
+                 f"{self.label_count}")
+        self.label_count += 1
+        return label
+
+    def peek_value(self):
+        """Return the value of the next token, or None at the end."""
+        token = self.tokenizer.peek()
+        return token.value if token is not None else None
+
+    def expect(self, value):
+        """Consume the next token, which must be value."""
+        token = self.tokenizer.advance()
+        if token.value != value or token.type in (
+                TokenType.STRING_CONST, TokenType.IDENTIFIER):
+            self.error(f"expected {value}", token)
+        return token
+
+    def expect_identifier(self):
+        """Consume the next token, which must be an identifier."""
+        token = self.tokenizer.advance()
+        if token.type != TokenType.IDENTIFIER:
+            self.error("expected an identifier", token)
+        return token.value
+
+    def error(self, message, token=None):
+        """Raise a JackError at token, the current token by default."""
+        if token is None:
+            token = self.tokenizer.token
+        raise JackError(
+            f"line {token.line}: {message} but found {token.value!r}"
+        )
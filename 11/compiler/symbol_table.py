@@ -0,0 +1,66 @@
+"""The symbol table for the jack compiler."""
+
+# Kind of variable -> vm segment holding it
+SEGMENTS = {
+    "static": "static",
+    "field": "this",
+    "arg": "argument",
+    "var": "local"
+}
+
+
+class SymbolTable(object):
+    """The variables of a class and of its subroutine being compiled.
+
+    Each scope is a dict from name to (type, kind, index). The subroutine
+    scope is replaced by an empty dict for every subroutine.
+    """
+
+    def __init__(self):
+        """Create a symbol table with empty scopes."""
+        self.class_scope = {}
+        self.subroutine_scope = {}
+        self.counts = {kind: 0 for kind in SEGMENTS}
+
+    def startSubroutine(self):
+        """Start a new subroutine scope."""
+        self.subroutine_scope = {}
+        self.counts["arg"] = 0
+        self.counts["var"] = 0
+
+    def define(self, name, type_, kind):
+        """Define a variable of kind static, field, arg or var."""
+        if kind in ("static", "field"):
+            scope = self.class_scope
+        else:
+            scope = self.subroutine_scope
+        scope[name] = (type_, kind, self.counts[kind])
+        self.counts[kind] += 1
+
+    def varCount(self, kind):
+        """Return the number of variables of kind in the current scope."""
+        return self.counts[kind]
+
+    def kindOf(self, name):
+        """Return the kind of a variable, or None when it is undefined."""
+        entry = self._lookup(name)
+        return entry[1] if entry else None
+
+    def typeOf(self, name):
+        """Return the type of a variable."""
+        return self._lookup(name)[0]
+
+    def indexOf(self, name):
+        """Return the index of a variable within its kind."""
+        return self._lookup(name)[2]
+
+    def segmentOf(self, name):
+        """Return the vm segment of a variable."""
+        return SEGMENTS[self._lookup(name)[1]]
+
+    def _lookup(self, name):
+        """Return the entry of name, subroutine scope first."""
+        entry = self.subroutine_scope.get(name)
+        if entry is None:
+            entry = self.class_scope.get(name)
+        return entry
@@ -0,0 +1,150 @@
+"""Tokenize jack source files."""
+import re
+from collections import namedtuple
+from enum import auto, Enum
+
+KEYWORDS = {
+    "class", "constructor", "function", "method", "field", "static", "var",
+    "int", "char", "boolean", "void", "true", "false", "null", "this",
+    "let", "do", "if", "else", "while", "return"
+}
+
+# Largest integer constant of the jack language
+MAX_INT = 32767
+
+# Whitespace and comments, a block comment continued on a later line, then
+# the tokens of the jack language
+TOKENS = re.compile(r"""
+    (?P<skip>\s+|//.*|/\*.*?\*/)
+  | (?P<open_comment>/\*)
+  | (?P<int>\d+)
+  | (?P<string>"[^"\n]*")
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<symbol>[{}()\[\].,;+\-*/&|<>=~])
+""", re.X)
+
+# A token with the line it was read from, value is an int for INT_CONST
+Token = namedtuple("Token", ["type", "value", "line"])
+
+
+class JackError(Exception):
+    """A jack file which is not a valid program."""
+
+
+class TokenType(Enum):
+    """Enum for token types."""
+
+    KEYWORD = auto()
+    SYMBOL = auto()
+    IDENTIFIER = auto()
+    INT_CONST = auto()
+    STRING_CONST = auto()
+
+
+def tokenize(lines):
+    """Yield the Tokens of an iterable of source lines.
+
+    Lines are matched one at a time, only an open block comment is carried
+    from one line to the next, so the tokens of a file are never all held
+    in memory.
+    """
+    in_comment = False
+    for number, line in enumerate(lines, 1):
+        position = 0
+        if in_comment:
+            end = line.find("*/")
+            if end < 0:
+                continue
+            position = end + 2
+            in_comment = False
+
+        while position < len(line):
+            match = TOKENS.match(line, position)
+            if match is None:
+                raise JackError(
+                    f"line {number}: unexpected character {line[position]!r}"
+                )
+            position = match.end()
+            kind = match.lastgroup
+            text = match.group()
+            if kind == "skip":
+                continue
+            if kind == "open_comment":
+                in_comment = True
+                break
+            if kind == "int":
+                if int(text) > MAX_INT:
+                    raise JackError(
+                        f"line {number}: integer {text} is larger than "
+                        f"{MAX_INT}"
+                    )
+                yield Token(TokenType.INT_CONST, int(text), number)
+            elif kind == "string":
+                yield Token(TokenType.STRING_CONST, text[1:-1], number)
+            elif kind == "word":
+                token_type = (TokenType.KEYWORD if text in KEYWORDS
+                              else TokenType.IDENTIFIER)
+                yield Token(token_type, text, number)
+            else:
+                yield Token(TokenType.SYMBOL, text, number)
+
+    if in_comment:
+        raise JackError("unterminated comment")
+
+
+class JackTokenizer(object):
+    """Walk the tokens of a jack file with one token of lookahead."""
+
+    def __init__(self, filestream):
+        """Create a tokenizer reading lines from filestream."""
+        self.tokens = tokenize(filestream)
+        self.token = None
+        self.next_token = next(self.tokens, None)
+
+    def hasMoreTokens(self):
+        """Check if there are any more tokens."""
+        return self.next_token is not None
+
+    def advance(self):
+        """Read the next token and make it the current token."""
+        if self.next_token is None:
+            raise JackError("unexpected end of file")
+        self.token = self.next_token
+        self.next_token = next(self.tokens, None)
+        return self.token
+
+    def peek(self):
+        """Return the token after the current one, or None at the end."""
+        return self.next_token
+
+    def tokenType(self):
+        """Return the type of the current token."""
+        return self.token.type
+
+    def keyWord(self):
+        """Return the keyword of the current token."""
+        return self._value(TokenType.KEYWORD)
+
+    def symbol(self):
+        """Return the character of the current symbol token."""
+        return self._value(TokenType.SYMBOL)
+
+    def identifier(self):
+        """Return the name of the current identifier token."""
+        return self._value(TokenType.IDENTIFIER)
+
+    def intVal(self):
+        """Return the value of the current integer constant."""
+        return self._value(TokenType.INT_CONST)
+
+    def stringVal(self):
+        """Return the current string constant without its quotes."""
+        return self._value(TokenType.STRING_CONST)
+
+    def _value(self, token_type):
+        """Return the value of the current token, which must be token_type."""
+        if self.token.type != token_type:
+            raise ValueError(
+                f"Current token is a {self.token.type}, not a {token_type}"
+            )
+        return self.token.value
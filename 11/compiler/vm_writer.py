@@ -0,0 +1,56 @@
+"""Write vm commands for the jack compiler."""
+
+
+class VMWriter(object):
+    """Buffer the vm commands of a class and write them out on close."""
+
+    def __init__(self, filepath=None):
+        """Create a vm writer, writing to filepath on close if given."""
+        self.filepath = filepath
+        self.lines = []
+
+    def writePush(self, segment, index):
+        """Write a push command."""
+        self.lines.append(f"push {segment} {index}")
+
+    def writePop(self, segment, index):
+        """Write a pop command."""
+        self.lines.append(f"pop {segment} {index}")
+
+    def writeArithmetic(self, command):
+        """Write an arithmetic or logical command."""
+        self.lines.append(command)
+
+    def writeLabel(self, label):
+        """Write a label command."""
+        self.lines.append(f"label {label}")
+
+    def writeGoto(self, label):
+        """Write a goto command."""
+        self.lines.append(f"goto {label}")
+
+    def writeIf(self, label):
+        """Write an if-goto command."""
+        self.lines.append(f"if-goto {label}")
+
+    def writeCall(self, name, n_args):
+        """Write a call command."""
+        self.lines.append(f"call {name} {n_args}")
+
+    def writeFunction(self, name, n_locals):
+        """Write a function command."""
+        self.lines.append(f"function {name} {n_locals}")
+
+    def writeReturn(self):
+        """Write a return command."""
+        self.lines.append("return")
+
+    def getvalue(self):
+        """Return the vm code written so far."""
+        return "\n".join(self.lines) + "\n"
+
+    def close(self):
+        """Write the vm code to the output file."""
+        if self.filepath is not None:
+            with open(self.filepath, "w") as vm:
+                vm.write(self.getvalue())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""Execute hack machine code by compiling basic blocks to python."""
+import argparse
+import os
+import sys
+import time
+from bisect import bisect_right
+
+from cpu_emulator import ROM_SIZE, CPUEmulator, alu, read_program
+
+ASSEMBLER_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "06", "Assembler"
+)
+
+# Longest block compiled into a single function
+MAX_BLOCK_LENGTH = 256
+
+# Comp bits (zx nx zy ny f no) -> python expression of x = D and y = A or M
+EXPRESSIONS = {
+    0b101010: "0",
+    0b111111: "1",
+    0b111010: "0xFFFF",
+    0b001100: "{x}",
+    0b110000: "{y}",
+    0b001101: "{x} ^ 0xFFFF",
+    0b110001: "{y} ^ 0xFFFF",
+    0b001111: "-{x} & 0xFFFF",
+    0b110011: "-{y} & 0xFFFF",
+    0b011111: "({x} + 1) & 0xFFFF",
+    0b110111: "({y} + 1) & 0xFFFF",
+    0b001110: "({x} - 1) & 0xFFFF",
+    0b110010: "({y} - 1) & 0xFFFF",
+    0b000010: "({x} + {y}) & 0xFFFF",
+    0b010011: "({x} - {y}) & 0xFFFF",
+    0b000111: "({y} - {x}) & 0xFFFF",
+    0b000000: "{x} & {y}",
+    0b010101: "{x} | {y}",
+}
+
+# Jump bits -> python condition on the ALU output
+CONDITIONS = {
+    0b001: "0 < out < 0x8000",
+    0b010: "out == 0",
+    0b011: "out < 0x8000",
+    0b100: "out >= 0x8000",
+    0b101: "out != 0",
+    0b110: "out == 0 or out >= 0x8000",
+    0b111: "True",
+}
+
+
+def compile_block(rom, start, leaders=()):
+    """Compile the basic block starting at ROM address start.
+
+    The block ends with its first unconditional jump, before the next
+    address in the sorted leaders or after MAX_BLOCK_LENGTH instructions,
+    conditional jumps leave it early. Return a function (ram, a, d) ->
+    (a, d, pc, cycles) running the block up to its exit, the length of
+    the block and whether it only ever writes A, so jumping back to its
+    start is an infinite loop.
+    """
+    end = min(start + MAX_BLOCK_LENGTH, ROM_SIZE)
+    index = bisect_right(leaders, start)
+    if index < len(leaders):
+        end = min(end, leaders[index])
+
+    lines = ["def block(ram, a, d):"]
+    # A as a python expression, a literal while it is known
+    a_value = "a"
+    pure = True
+    pc = start
+    while pc < end:
+        instruction = rom[pc]
+        pc += 1
+        if not instruction & 0x8000:
+            a_value = str(instruction)
+            continue
+
+        comp = (instruction >> 6) & 0b111111
+        y = f"ram[{a_value}]" if instruction & 0x1000 else a_value
+        if comp in EXPRESSIONS:
+            expression = EXPRESSIONS[comp].format(x="d", y=y)
+        else:
+            expression = f"alu(d, {y}, {comp})"
+        lines.append(f"    out = {expression}")
+
+        target = a_value
+        if instruction & 0b001000:
+            lines.append(f"    ram[{a_value}] = out")
+        if instruction & 0b010000:
+            lines.append("    d = out")
+        if instruction & 0b100000:
+            if a_value == "a":
+                lines.append("    target = a")
+                target = "target"
+            lines.append("    a = out")
+            a_value = "a"
+        if instruction & 0b111000:
+            pure = False
+
+        jump = instruction & 0b111
+        if jump == 0b111:
+            lines.append(
+                f"    return {a_value}, d, {target} & 0x7FFF, {pc - start}"
+            )
+            break
+        if jump:
+            lines.append(f"    if {CONDITIONS[jump]}:")
+            lines.append(
+                f"        return {a_value}, d, {target} & 0x7FFF, "
+                f"{pc - start}"
+            )
+    else:
+        lines.append(f"    return {a_value}, d, {pc & 0x7FFF}, {pc - start}")
+
+    namespace = {"alu": alu}
+    exec(compile("\n".join(lines), f"<block {start}>", "exec"), namespace)
+    return namespace["block"], pc - start, pure
+
+
+class BlockExecutor(CPUEmulator):
+    """Run the program a basic block at a time.
+
+    Blocks are compiled the first time execution reaches their start
+    address and kept by that address. Inside a block the registers are
+    python locals and addresses loaded by A-instructions are constants.
+    """
+
+    def __init__(self, program=None, leaders=()):
+        """Create a computer, leaders are addresses which start a block."""
+        self.leaders = sorted(leaders)
+        self.blocks = [None] * ROM_SIZE
+        super().__init__(program)
+
+    def loadProgram(self, instructions, leaders=None):
+        """Load a list of instructions and forget the compiled blocks."""
+        super().loadProgram(instructions)
+        if leaders is not None:
+            self.leaders = sorted(leaders)
+        self.blocks = [None] * ROM_SIZE
+
+    def run(self, cycles, stop_at_halt=False):
+        """Execute up to cycles instructions and return how many ran.
+
+        Blocks longer than the remaining cycles are single stepped.
+        """
+        blocks = self.blocks
+        ram = self.ram
+        a = self.a
+        d = self.d
+        pc = self.pc
+        remaining = cycles
+        halted = False
+
+        while remaining:
+            block = blocks[pc]
+            if block is None:
+                block = compile_block(self.rom, pc, self.leaders)
+                blocks[pc] = block
+
+            function, length, pure = block
+            if length > remaining:
+                # too few cycles left to run to any exit of the block
+                break
+            start = pc
+            a, d, pc, executed = function(ram, a, d)
+            remaining -= executed
+            if stop_at_halt and pure and pc == start:
+                halted = True
+                break
+
+        self.a = a
+        self.d = d
+        self.pc = pc
+        self.cycles += cycles - remaining
+        if remaining and not halted:
+            return cycles - remaining + super().run(remaining, stop_at_halt)
+        return cycles - remaining
+
+
+def label_addresses(asm_path):
+    """Return the ROM addresses of the labels of a hack assembly file."""
+    sys.path.insert(0, ASSEMBLER_DIR)
+    from assembler import add_labels
+    from parser import Parser
+    from symbol_table import SymbolTable
+
+    symbol_table = SymbolTable()
+    with open(asm_path) as asm:
+        labels = add_labels(Parser(asm), symbol_table)
+    return [symbol_table.getAddress(label) for label in labels]
+
+
+def differential_check(program, cycles, step=997):
+    """Run the program on both executors, comparing state every step cycles.
+
+    Return the number of cycles run before the first difference, or None
+    when the executors agree for all cycles.
+    """
+    reference = CPUEmulator(program)
+    executor = BlockExecutor(program)
+    ran = 0
+    while ran < cycles:
+        chunk = min(step, cycles - ran)
+        reference.run(chunk)
+        executor.run(chunk)
+        ran += chunk
+        if ((reference.a, reference.d, reference.pc) !=
+                (executor.a, executor.d, executor.pc) or
+                reference.ram != executor.ram):
+            return ran
+    return None
+
+
+def main():
+    """Run a .hack program and report the speed of the executor."""
+    args = parse_args()
+    program = read_program(args.file)
+    leaders = label_addresses(args.asm) if args.asm else ()
+
+    if args.check:
+        difference = differential_check(program, args.cycles)
+        if difference is not None:
+            print(f"block executor differs from single stepping "
+                  f"after {difference} cycles")
+            sys.exit(1)
+        print(f"block executor matches single stepping for "
+              f"{args.cycles} cycles")
+
+    executor = BlockExecutor(program, leaders)
+    start = time.perf_counter()
+    executed = executor.run(args.cycles, stop_at_halt=not args.no_halt)
+    elapsed = time.perf_counter() - start
+
+    for address in args.print:
+        print(f"RAM[{address}] = {executor.peek(address)}")
+    print(f"{executed} instructions in {elapsed:.3f} s: "
+          f"{executed / elapsed:,.0f} instructions/s")
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the block executor."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("file", help="the .hack file to run")
+    arg_parser.add_argument(
+        "--asm", metavar="FILE",
+        help="start blocks at the labels of the program's assembly"
+    )
+    arg_parser.add_argument(
+        "-n", "--cycles", type=int, default=10000000,
+        help="maximum number of instructions to run (default: 10000000)"
+    )
+    arg_parser.add_argument(
+        "--no-halt", action="store_true",
+        help="keep running through the final infinite loop"
+    )
+    arg_parser.add_argument(
+        "--check", action="store_true",
+        help="first compare against single stepping for the same cycles"
+    )
+    arg_parser.add_argument(
+        "--print", type=int, action="append", default=[], metavar="ADDRESS",
+        help="print RAM[ADDRESS] after running"
+    )
+    return arg_parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Content addressed on-disk cache for build artifacts."""
+import glob
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Suffix of entries being written, which are not part of the cache yet
+TEMP_SUFFIX = ".tmp"
+
+
+class BuildCache(object):
+    """Store artifacts keyed by a hash of their inputs.
+
+    Entries live in two level fan-out directories below the cache
+    directory. Every hit refreshes the modification time of the entry so
+    eviction, which removes the oldest entries once the cache grows past
+    max_bytes, is least recently used.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """Create a build cache rooted at directory."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, *parts):
+        """Return the key of an artifact built from the given parts."""
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            # length prefix so ("ab", "c") and ("a", "bc") differ
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the artifact stored under key or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as entry:
+                data = entry.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store the artifact under key and evict old entries if needed."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # an entry written by a concurrent miss or an earlier build is
+        # replaced, so only the difference in size is added
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+
+        # write atomically so concurrent builds never see partial entries
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix=TEMP_SUFFIX
+        )
+        with os.fdopen(fd, "wb") as entry:
+            entry.write(data)
+        os.replace(temp_path, path)
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += len(data) - replaced
+
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def _entries(self):
+        """Yield (path, size, mtime) of every entry in the cache.
+
+        Temporary files of writes in progress, or left behind by an
+        interrupted one, are not entries.
+        """
+        for path in glob.glob(os.path.join(self.directory, "??", "*")):
+            if path.endswith(TEMP_SUFFIX):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+    def _path(self, key):
+        """Return the path of the entry for key."""
+        return os.path.join(self.directory, key[:2], key[2:])
+
+
+@lru_cache(maxsize=None)
+def fingerprint(directory):
+    """Hash the python sources of a tool so new versions miss the cache."""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def open_cache(directory, max_megabytes=None):
+    """Return a BuildCache for directory, or None when caching is off."""
+    if directory is None:
+        directory = os.environ.get("HACK_BUILD_CACHE")
+    if not directory:
+        return None
+
+    if max_megabytes is None:
+        return BuildCache(directory)
+    return BuildCache(directory, int(max_megabytes * 1024 * 1024))
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""Measure the code the vm translator generates for the test programs."""
+import argparse
+import glob
+import io
+import json
+import os
+import re
+import sys
+
+from cpu_emulator import CPUEmulator
+from hack_build import ROOT_DIR, VMtranslator, assembler, link
+from tst_runner import (
+    ScriptError, collect_scripts, parse_output_list, parse_script,
+    parse_value
+)
+
+DEFAULT_PATHS = (os.path.join(ROOT_DIR, "07"), os.path.join(ROOT_DIR, "08"))
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "code_benchmark_baseline.json"
+)
+RAM_VARIABLE = re.compile(r"RAM\[(\d+)\]$")
+
+# Measurements compared with the baseline, larger is worse for both
+METRICS = ("rom_words", "cycles")
+
+
+def main():
+    """Entry point for the code quality benchmark."""
+    args = parse_args()
+    options = VMtranslator.Options(
+        shared_routines=args.shared_routines, optimize=args.optimize,
+        peephole=args.optimize or args.peephole,
+        top_in_D=args.top_in_d, source_map=False
+    )
+    script_paths = [
+        path for path in collect_scripts(args.paths or DEFAULT_PATHS)
+        if not path.endswith("VME.tst")
+    ]
+    if not script_paths:
+        print("no .tst files found")
+        sys.exit(1)
+
+    results = {}
+    failures = 0
+    print(f"{'program':<36}{'ROM words':>10}{'commands':>10}"
+          f"{'words/cmd':>10}{'cycles':>10}")
+    for script_path in script_paths:
+        name = program_name(script_path)
+        try:
+            result = measure(script_path, options, args.cycles)
+        except ScriptError as error:
+            print(f"{name:<36}skipped: {error}")
+            continue
+        if result["cycles"] is None:
+            print(f"{name:<36}FAIL: the .cmp values were not reached in "
+                  f"{args.cycles} cycles")
+            failures += 1
+            continue
+        results[name] = result
+        print(f"{name:<36}{result['rom_words']:>10}{result['commands']:>10}"
+              f"{result['rom_words'] / result['commands']:>10.2f}"
+              f"{result['cycles']:>10}")
+
+    if results:
+        totals = {
+            key: sum(result[key] for result in results.values())
+            for key in ("rom_words", "commands", "cycles")
+        }
+        print(f"{'total':<36}{totals['rom_words']:>10}"
+              f"{totals['commands']:>10}"
+              f"{totals['rom_words'] / totals['commands']:>10.2f}"
+              f"{totals['cycles']:>10}")
+
+    key = options_key(options)
+    baseline = read_baseline(args.baseline)
+    if args.update_baseline:
+        baseline[key] = {
+            name: {metric: result[metric] for metric in METRICS}
+            for name, result in results.items()
+        }
+        with open(args.baseline, "w") as filestream:
+            json.dump(baseline, filestream, indent=1, sort_keys=True)
+            filestream.write("\n")
+        print(f"updated the {key} baseline in {args.baseline}")
+    else:
+        failures += compare(results, baseline.get(key, {}), key)
+
+    if failures:
+        sys.exit(1)
+
+
+def measure(script_path, options=VMtranslator.DEFAULT_OPTIONS,
+            max_cycles=1000000):
+    """Translate, assemble and run the program tested by a script.
+
+    Return the ROM words of the program, the number of vm commands it was
+    translated from and the cycles until the RAM holds every value the
+    .cmp file expects, None when that takes more than max_cycles.
+    """
+    setup, expected = read_conditions(script_path)
+    words, commands = build_program(script_path, options)
+
+    computer = CPUEmulator(list(words))
+    for address, value in setup:
+        computer.poke(address, value)
+    return {
+        "rom_words": len(words),
+        "commands": commands,
+        "cycles": run_until(computer, expected, max_cycles),
+    }
+
+
+def build_program(script_path, options=VMtranslator.DEFAULT_OPTIONS):
+    """Return the instructions and vm command count of a script's program.
+
+    Directories with a Sys.vm are translated whole with the bootstrap code,
+    others only translate the .vm file named after the script.
+    """
+    directory = os.path.dirname(script_path)
+    vm_paths = sorted(glob.glob(os.path.join(directory, "*.vm")))
+    bootstrap = os.path.join(directory, "Sys.vm") in vm_paths
+    if not bootstrap:
+        vm_paths = [os.path.splitext(script_path)[0] + ".vm"]
+        if not os.path.exists(vm_paths[0]):
+            raise ScriptError(f"no {os.path.basename(vm_paths[0])}")
+
+    units = [VMtranslator.translate_init(options)] if bootstrap else []
+    commands = 0
+    for vm_path in vm_paths:
+        with open(vm_path, "rb") as vm:
+            source = vm.read()
+        units.append(VMtranslator.translate_unit(
+            os.path.basename(vm_path), source, None, options
+        ))
+        commands += len(
+            VMtranslator.Parser(io.StringIO(source.decode("utf-8"))).commands
+        )
+
+    assembly, _ = link(units, options)
+    words = assembler.assemble(assembler.Parser(io.StringIO(assembly)))
+    return words, commands
+
+
+def read_conditions(script_path):
+    """Return the RAM set up by a script and the values its .cmp expects.
+
+    Both are lists of (address, value), the set statements before the
+    first repeat make the setup.
+    """
+    with open(script_path) as script:
+        statements = parse_script(script.read())
+
+    setup = []
+    expected = []
+    compare_lines = iter(())
+    columns = []
+    started = False
+    for statement in statements:
+        command = statement[0]
+        if command == "compare-to":
+            compare_path = os.path.join(
+                os.path.dirname(script_path), statement[1]
+            )
+            with open(compare_path) as cmp:
+                compare_lines = iter(cmp.read().splitlines())
+        elif command == "output-list":
+            columns = [
+                ram_address(column[0])
+                for column in parse_output_list(statement[1:])
+            ]
+            next(compare_lines, None)
+        elif command == "output":
+            row = next(compare_lines, None)
+            if row is None:
+                raise ScriptError("more outputs than .cmp lines")
+            cells = row.strip().strip("|").split("|")
+            expected.extend(
+                (address, int(cell)) for address, cell in zip(columns, cells)
+            )
+        elif command == "set" and not started:
+            setup.append(
+                (ram_address(statement[1]), parse_value(statement[2]))
+            )
+        elif command == "repeat":
+            started = True
+
+    if not expected:
+        raise ScriptError("nothing to compare")
+    return setup, expected
+
+
+def ram_address(name):
+    """Return the address of a RAM[n] variable of a script."""
+    match = RAM_VARIABLE.match(name)
+    if match is None:
+        raise ScriptError(f"unsupported variable {name}")
+    return int(match.group(1))
+
+
+def run_until(computer, expected, max_cycles):
+    """Single step computer until RAM holds the expected (address, value).
+
+    Return the number of cycles that took, or None after max_cycles.
+    """
+    ram = computer.ram
+    targets = [(address, value & 0xFFFF) for address, value in expected]
+    for cycle in range(max_cycles + 1):
+        if all(ram[address] == value for address, value in targets):
+            return cycle
+        computer.run(1)
+    return None
+
+
+def compare(results, baseline, key):
+    """Print the differences to the baseline, return the regressions."""
+    regressions = 0
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name}: not in the {key} baseline")
+            continue
+        for metric in METRICS:
+            old, new = baseline[name][metric], result[metric]
+            if new > old:
+                print(f"regression: {name} {metric} {old} -> {new}")
+                regressions += 1
+            elif new < old:
+                print(f"improved: {name} {metric} {old} -> {new}, "
+                      f"run with --update-baseline")
+    return regressions
+
+
+def program_name(script_path):
+    """Return the name of the program tested by a script."""
+    return os.path.relpath(
+        os.path.dirname(os.path.abspath(script_path)), ROOT_DIR
+    ).replace(os.sep, "/")
+
+
+def options_key(options):
+    """Return the baseline key of the code generation options."""
+    enabled = [
+        name for name in (
+            "optimize", "peephole", "shared_routines", "top_in_D"
+        )
+        if getattr(options, name)
+    ]
+    return "+".join(enabled) or "default"
+
+
+def read_baseline(path):
+    """Return the baselines of a baseline file, keyed by options."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as filestream:
+        return json.load(filestream)
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the code quality benchmark."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "paths", nargs="*",
+        help=".tst files or directories to search (default: 07 and 08)"
+    )
+    arg_parser.add_argument(
+        "-n", "--cycles", type=int, default=1000000,
+        help="most cycles a program may run (default: 1000000)"
+    )
+    arg_parser.add_argument(
+        "--baseline", metavar="FILE", default=DEFAULT_BASELINE,
+        help=("baseline to compare with "
+              "(default: tools/code_benchmark_baseline.json)")
+    )
+    arg_parser.add_argument(
+        "--update-baseline", action="store_true",
+        help="store the results as the baseline of the options instead"
+    )
+    arg_parser.add_argument(
+        "--shared-routines", action="store_true",
+        help="emit call, return and eq/gt/lt once per program"
+    )
+    arg_parser.add_argument(
+        "--top-in-d", action="store_true",
+        help="keep the top of the stack in the D register"
+    )
+    arg_parser.add_argument(
+        "-O", "--optimize", action="store_true",
+        help=("fold constants and drop redundant VM commands, then run the "
+              "--peephole pass")
+    )
+    arg_parser.add_argument(
+        "--peephole", action="store_true",
+        help="only drop redundant instructions from the generated assembly"
+    )
+    return arg_parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+"""Execute hack machine code produced by the assembler."""
+import argparse
+import time
+from array import array
+
+ROM_SIZE = 32768
+RAM_SIZE = 65536
+SCREEN = 16384
+KBD = 24576
+
+# Jump bits -> jump when the ALU output is (zero, negative, positive)
+JUMPS = {
+    0b000: (False, False, False),
+    0b001: (False, False, True),
+    0b010: (True, False, False),
+    0b011: (True, False, True),
+    0b100: (False, True, False),
+    0b101: (False, True, True),
+    0b110: (True, True, False),
+    0b111: (True, True, True),
+}
+
+# Comp bits (zx nx zy ny f no) -> output for x = D and y = A or M
+COMPUTATIONS = {
+    0b101010: lambda x, y: 0,
+    0b111111: lambda x, y: 1,
+    0b111010: lambda x, y: 0xFFFF,
+    0b001100: lambda x, y: x,
+    0b110000: lambda x, y: y,
+    0b001101: lambda x, y: x ^ 0xFFFF,
+    0b110001: lambda x, y: y ^ 0xFFFF,
+    0b001111: lambda x, y: -x & 0xFFFF,
+    0b110011: lambda x, y: -y & 0xFFFF,
+    0b011111: lambda x, y: (x + 1) & 0xFFFF,
+    0b110111: lambda x, y: (y + 1) & 0xFFFF,
+    0b001110: lambda x, y: (x - 1) & 0xFFFF,
+    0b110010: lambda x, y: (y - 1) & 0xFFFF,
+    0b000010: lambda x, y: (x + y) & 0xFFFF,
+    0b010011: lambda x, y: (x - y) & 0xFFFF,
+    0b000111: lambda x, y: (y - x) & 0xFFFF,
+    0b000000: lambda x, y: x & y,
+    0b010101: lambda x, y: x | y,
+}
+
+
+def alu(x, y, comp):
+    """Compute the ALU output for any combination of the six comp bits."""
+    if comp & 0b100000:
+        x = 0
+    if comp & 0b010000:
+        x ^= 0xFFFF
+    if comp & 0b001000:
+        y = 0
+    if comp & 0b000100:
+        y ^= 0xFFFF
+    out = (x + y) & 0xFFFF if comp & 0b000010 else x & y
+    if comp & 0b000001:
+        out ^= 0xFFFF
+    return out
+
+
+def decode(instruction):
+    """Decode an instruction into the form executed by CPUEmulator.run.
+
+    A-instructions decode to their value, C-instructions to a tuple of
+    (computation, reads M, writes A, writes D, writes M, jumps if zero,
+    jumps if negative, jumps if positive).
+    """
+    if not instruction & 0x8000:
+        return instruction
+
+    comp = (instruction >> 6) & 0b111111
+    computation = COMPUTATIONS.get(comp)
+    if computation is None:
+        def computation(x, y, comp=comp):
+            return alu(x, y, comp)
+
+    return (
+        computation,
+        bool(instruction & 0x1000),
+        bool(instruction & 0b100000),
+        bool(instruction & 0b010000),
+        bool(instruction & 0b001000),
+    ) + JUMPS[instruction & 0b111]
+
+
+def read_program(filepath):
+    """Return the instructions of a .hack file."""
+    with open(filepath) as hack:
+        return [int(line, 2) for line in hack.read().split()]
+
+
+class CPUEmulator(object):
+    """The hack computer: CPU, ROM and memory mapped RAM.
+
+    RAM is an array('H') of unsigned 16 bit words, the screen and keyboard
+    are plain words of it. It spans every value of A so a stray address
+    past the memory map cannot crash the emulator. Every ROM word is
+    decoded once when loaded.
+    """
+
+    def __init__(self, program=None):
+        """Create a computer, optionally loaded with a list of instructions."""
+        self.rom = array("H", bytes(2 * ROM_SIZE))
+        self.program = [0] * ROM_SIZE
+        self.ram = array("H", bytes(2 * RAM_SIZE))
+        self.reset()
+        if program is not None:
+            self.loadProgram(program)
+
+    def load(self, filepath):
+        """Load the program of a .hack file into ROM."""
+        self.loadProgram(read_program(filepath))
+
+    def loadProgram(self, instructions):
+        """Load a list of instructions into ROM and reset the CPU."""
+        if len(instructions) > ROM_SIZE:
+            raise ValueError(
+                f"Program of {len(instructions)} instructions does not fit "
+                f"in ROM"
+            )
+        self.rom = array("H", instructions)
+        self.rom.extend([0] * (ROM_SIZE - len(instructions)))
+        self.program = [decode(instruction) for instruction in self.rom]
+        self.reset()
+
+    def reset(self):
+        """Set the registers and the cycle count to zero, keeping RAM."""
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def step(self):
+        """Execute a single instruction."""
+        self.run(1)
+
+    def run(self, cycles, stop_at_halt=False):
+        """Execute up to cycles instructions and return how many ran.
+
+        With stop_at_halt execution also stops at a jump to itself, or to
+        the A-instruction loading its target, which is how programs end.
+        """
+        program = self.program
+        ram = self.ram
+        a = self.a
+        d = self.d
+        pc = self.pc
+        remaining = cycles
+
+        while remaining:
+            remaining -= 1
+            instruction = program[pc]
+            if instruction.__class__ is int:
+                a = instruction
+                pc = (pc + 1) & 0x7FFF
+                continue
+
+            (computation, reads_m, writes_a, writes_d, writes_m,
+             if_zero, if_negative, if_positive) = instruction
+            out = computation(d, ram[a] if reads_m else a)
+            if writes_m:
+                ram[a] = out
+            if writes_d:
+                d = out
+
+            if out == 0:
+                jump = if_zero
+            elif out & 0x8000:
+                jump = if_negative
+            else:
+                jump = if_positive
+
+            if jump:
+                # a jump loads the value A had before this instruction
+                if (stop_at_halt and not (writes_a or writes_d or writes_m)
+                        and (a == pc or a == pc - 1 and program[a] == a)):
+                    remaining += 1
+                    break
+                pc = a & 0x7FFF
+            else:
+                pc = (pc + 1) & 0x7FFF
+            if writes_a:
+                a = out
+
+        self.a = a
+        self.d = d
+        self.pc = pc
+        self.cycles += cycles - remaining
+        return cycles - remaining
+
+    def peek(self, address):
+        """Return the signed value of RAM[address]."""
+        value = self.ram[address]
+        return value - 0x10000 if value & 0x8000 else value
+
+    def poke(self, address, value):
+        """Set RAM[address] to a signed or unsigned 16 bit value."""
+        self.ram[address] = value & 0xFFFF
+
+
+def main():
+    """Run a .hack program and report the speed of the emulator."""
+    args = parse_args()
+    cpu = CPUEmulator()
+    cpu.load(args.file)
+    for address, value in args.set:
+        cpu.poke(address, value)
+
+    start = time.perf_counter()
+    executed = cpu.run(args.cycles, stop_at_halt=not args.no_halt)
+    elapsed = time.perf_counter() - start
+
+    for address in args.print:
+        print(f"RAM[{address}] = {cpu.peek(address)}")
+    print(f"{executed} instructions in {elapsed:.3f} s: "
+          f"{executed / elapsed:,.0f} instructions/s")
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the emulator."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("file", help="the .hack file to run")
+    arg_parser.add_argument(
+        "-n", "--cycles", type=int, default=10000000,
+        help="maximum number of instructions to run (default: 10000000)"
+    )
+    arg_parser.add_argument(
+        "--no-halt", action="store_true",
+        help="keep running through the final infinite loop"
+    )
+    arg_parser.add_argument(
+        "--set", nargs=2, type=int, action="append", default=[],
+        metavar=("ADDRESS", "VALUE"), help="set RAM[ADDRESS] before running"
+    )
+    arg_parser.add_argument(
+        "--print", type=int, action="append", default=[], metavar="ADDRESS",
+        help="print RAM[ADDRESS] after running"
+    )
+    return arg_parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+"""Build a directory of jack classes into a runnable hack program."""
+import argparse
+import glob
+import importlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import build_cache
+from block_executor import ASSEMBLER_DIR
+from cpu_emulator import ROM_SIZE
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+COMPILER_DIR = os.path.join(ROOT_DIR, "11", "compiler")
+TRANSLATOR_DIR = os.path.join(ROOT_DIR, "07", "translator")
+OS_DIR = os.path.join(ROOT_DIR, "12")
+
+# Module names used by more than one project, or shadowing the standard
+# library, which must not leak from one project into another
+SHARED_NAMES = ("parser", "symbol_table", "code")
+
+
+def load_project(directory, name):
+    """Import module name from a project directory.
+
+    Clashing modules of the other projects are set aside while importing
+    and the ones of this project are dropped afterwards. Modules keep the
+    objects they imported, so every loaded project keeps working.
+    """
+    saved = {
+        shared: sys.modules.pop(shared)
+        for shared in SHARED_NAMES if shared in sys.modules
+    }
+    sys.path.insert(0, directory)
+    try:
+        return importlib.import_module(name)
+    finally:
+        sys.path.remove(directory)
+        for shared in SHARED_NAMES:
+            sys.modules.pop(shared, None)
+        sys.modules.update(saved)
+
+
+JackCompiler = load_project(COMPILER_DIR, "JackCompiler")
+VMtranslator = load_project(TRANSLATOR_DIR, "VMtranslator")
+assembler = load_project(ASSEMBLER_DIR, "assembler")
+linker = load_project(ASSEMBLER_DIR, "linker")
+
+# Stages reported by the build, in pipeline order
+STAGES = ("compile", "translate", "assemble", "link", "write")
+
+
+def main():
+    """Entry point for the build driver."""
+    args = parse_args()
+    options = VMtranslator.Options(
+        shared_routines=args.shared_routines, optimize=args.optimize,
+        peephole=args.optimize or args.peephole,
+        top_in_D=args.top_in_d, source_map=args.source_map
+    )
+    os_dir = None if args.no_os else args.os
+    cache = build_cache.open_cache(args.cache, args.cache_size)
+
+    try:
+        hack_path, instructions, timings = build(
+            args.path, os_dir, args.format, cache, args.jobs, options,
+            args.keep, args.remove_dead_functions
+        )
+    except (JackCompiler.JackError, OSError) as error:
+        print(error)
+        sys.exit(1)
+
+    for stage in STAGES:
+        print(f"{stage:<10}{timings[stage]:8.3f} s")
+    print(f"{'total':<10}{timings['total']:8.3f} s")
+    print(f"{hack_path}: {instructions} instructions")
+
+
+def build(path, os_dir=OS_DIR, fmt="hack", cache=None, jobs=None,
+          options=VMtranslator.DEFAULT_OPTIONS, keep=False,
+          remove_dead=False):
+    """Build the jack program in directory path next to its sources.
+
+    The classes of os_dir the program does not define itself are linked
+    in. Classes are compiled and translated concurrently, the vm code and
+    assembly are handed between stages in memory and only written out
+    with keep. Every class is assembled into a relocatable object, cached
+    on its own, and the objects are linked into the image. With
+    options.source_map the source map of the image is written next to it.
+    With remove_dead the functions Sys.init never reaches are left out.
+    Return the image path, the number of instructions and the seconds
+    spent per stage, summed over the workers for the concurrent stages.
+    A program too big for the ROM raises JackError instead.
+    """
+    start = time.perf_counter()
+    path = os.path.normpath(path)
+    if not glob.glob(os.path.join(path, "*.jack")):
+        raise JackCompiler.JackError(f"{path}: no .jack files found")
+    sources = collect_sources(path, os_dir)
+
+    timings = dict.fromkeys(STAGES, 0.0)
+    init = VMtranslator.translate_init(options)
+    vm_files, units = [], [init]
+    objects = [assemble_unit("$init", init)]
+    for vm_file, unit, obj, (compiling, translating, assembling) in \
+            build_classes(sources, cache, jobs, options, remove_dead):
+        vm_files.append(vm_file)
+        units.append(unit)
+        objects.append(obj)
+        timings["compile"] += compiling
+        timings["translate"] += translating
+        timings["assemble"] += assembling
+
+    stage = time.perf_counter()
+    words, source_map = link_objects(units, objects, options)
+    if len(words) > ROM_SIZE:
+        raise JackCompiler.JackError(
+            f"{path}: {len(words)} instructions do not fit the "
+            f"{ROM_SIZE} words of ROM, try -O, --shared-routines or "
+            f"--remove-dead-functions"
+        )
+    data = assembler.image.encode(words, fmt)
+    timings["link"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    name = os.path.join(path, os.path.basename(path))
+    hack_path = name + assembler.image.extension(fmt)
+    with open(hack_path, "wb" if assembler.image.is_binary(fmt) else "w") \
+            as hack:
+        hack.write(data)
+    if source_map is not None:
+        source_map.write(hack_path + ".map")
+    if keep:
+        for filename, vm in vm_files:
+            with open(os.path.join(path, filename), "w") as vm_file:
+                vm_file.write(vm)
+        with open(name + ".asm", "w") as asm:
+            asm.write(link(units, options)[0])
+        if source_map is not None:
+            source_map.write(name + ".asm.map")
+    timings["write"] = time.perf_counter() - stage
+
+    timings["total"] = time.perf_counter() - start
+    return hack_path, len(words), timings
+
+
+def collect_sources(path, os_dir=OS_DIR):
+    """Return (filename, source) of the program's classes, then the OS's.
+
+    Both are sorted by file name so builds are reproducible.
+    """
+    sources = []
+    for jack_path in sorted(glob.glob(os.path.join(path, "*.jack"))):
+        with open(jack_path) as jack:
+            sources.append((os.path.basename(jack_path), jack.read()))
+
+    if os_dir is not None:
+        defined = {filename for filename, _ in sources}
+        for jack_path in sorted(glob.glob(os.path.join(os_dir, "*.jack"))):
+            filename = os.path.basename(jack_path)
+            if filename not in defined:
+                with open(jack_path) as jack:
+                    sources.append((filename, jack.read()))
+    return sources
+
+
+def build_classes(sources, cache=None, jobs=None,
+                  options=VMtranslator.DEFAULT_OPTIONS, remove_dead=False):
+    """Return build_class of every (filename, source), in input order.
+
+    With remove_dead the functions Sys.init never reaches are left out.
+    They are only known once the whole program is compiled, so every class
+    is compiled before any is translated, and the vm code returned is the
+    one translated.
+    """
+    filenames = [filename for filename, _ in sources]
+    contents = [source for _, source in sources]
+    caches = [cache] * len(sources)
+    if not remove_dead:
+        return map_jobs(
+            build_class, jobs, filenames, contents, caches,
+            [options] * len(sources)
+        )
+
+    compiled = map_jobs(compile_step, jobs, filenames, contents, caches)
+    vm_sources, _, _ = VMtranslator.remove_dead_functions([
+        (vm_filename, vm.encode("utf-8")) for vm_filename, vm, _ in compiled
+    ])
+    translated = map_jobs(
+        translate_class, jobs, [vm_filename for vm_filename, _ in vm_sources],
+        [vm for _, vm in vm_sources], caches, [options] * len(sources)
+    )
+    return [
+        ((vm_filename, vm.decode("utf-8")), unit, obj,
+         (compiling, translating, assembling))
+        for (vm_filename, vm), (_, _, compiling),
+        (unit, obj, (translating, assembling))
+        in zip(vm_sources, compiled, translated)
+    ]
+
+
+def map_jobs(function, jobs, *arguments):
+    """Return function applied to the arguments, like map, in input order.
+
+    The calls run in jobs worker processes unless jobs is 1 or there is a
+    single call.
+    """
+    if jobs == 1 or len(arguments[0]) < 2:
+        return list(map(function, *arguments))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(function, *arguments))
+
+
+def build_class(filename, source, cache=None,
+                options=VMtranslator.DEFAULT_OPTIONS):
+    """Compile a jack class, translate and assemble it into an object.
+
+    Return the (vm filename, vm code), the translation unit, the object
+    and the seconds spent compiling, translating and assembling.
+    """
+    vm_filename, vm, compiling = compile_step(filename, source, cache)
+    unit, obj, (translating, assembling) = translate_class(
+        vm_filename, vm.encode("utf-8"), cache, options
+    )
+    return (vm_filename, vm), unit, obj, (
+        compiling, translating, assembling
+    )
+
+
+def compile_step(filename, source, cache=None):
+    """Return the vm filename and code of a jack class and the seconds
+    spent compiling it.
+    """
+    start = time.perf_counter()
+    vm = compile_class(filename, source, cache)
+    return (
+        os.path.splitext(filename)[0] + ".vm", vm,
+        time.perf_counter() - start
+    )
+
+
+def translate_class(vm_filename, vm, cache=None,
+                    options=VMtranslator.DEFAULT_OPTIONS):
+    """Translate the vm code of a class and assemble it into an object.
+
+    Return the translation unit, the object and the seconds spent
+    translating and assembling.
+    """
+    start = time.perf_counter()
+    unit = VMtranslator.translate_unit(vm_filename, vm, cache, options)
+    translated = time.perf_counter()
+    obj = assemble_unit(vm_filename, unit, cache)
+    return unit, obj, (
+        translated - start, time.perf_counter() - translated
+    )
+
+
+def compile_class(filename, source, cache=None):
+    """Return the vm code of a jack class, looked up in cache if given."""
+    if cache is not None:
+        key = cache.key(
+            "jack", build_cache.fingerprint(COMPILER_DIR), source
+        )
+        data = cache.get(key)
+        if data is not None:
+            return data.decode("utf-8")
+
+    try:
+        vm = JackCompiler.compile_source(source)
+    except JackCompiler.JackError as error:
+        raise JackCompiler.JackError(f"{filename}: {error}") from None
+
+    if cache is not None:
+        cache.put(key, vm)
+    return vm
+
+
+def assemble_unit(vm_filename, unit, cache=None):
+    """Return the relocatable object of a unit, looked up in cache if given."""
+    if cache is not None:
+        key = cache.key(
+            "object", build_cache.fingerprint(ASSEMBLER_DIR), vm_filename,
+            unit.assembly
+        )
+        data = cache.get(key)
+        if data is not None:
+            return assembler.object_file.loads(data)
+
+    obj = assembler.assemble_object(
+        assembler.Parser(io.StringIO(unit.assembly)), vm_filename
+    )
+    if cache is not None:
+        cache.put(key, assembler.object_file.dumps(obj))
+    return obj
+
+
+def link_objects(units, objects, options=VMtranslator.DEFAULT_OPTIONS):
+    """Return the instructions and source map of the program of units.
+
+    objects are the assembled units, the code the translator ends every
+    program with is assembled here, as it depends on the program size.
+    The result is the image of the assembly link returns.
+    """
+    code_writer = VMtranslator.CodeWriter(
+        shared_routines=options.shared_routines
+    )
+    # move the end of the program past the units without writing them
+    code_writer.writeUnit("", sum(unit.count for unit in units))
+    source_map = VMtranslator.link_source_map(units, code_writer, options)
+    code_writer.writeEnd()
+    end = assembler.assemble_object(
+        assembler.Parser(io.StringIO(code_writer.getvalue())), "$end"
+    )
+    return linker.link(objects + [end]), source_map
+
+
+def link(units, options=VMtranslator.DEFAULT_OPTIONS):
+    """Return the assembly and source map of the program made of units.
+
+    The source map is None unless options.source_map is set.
+    """
+    code_writer = VMtranslator.CodeWriter(
+        shared_routines=options.shared_routines
+    )
+    for unit in units:
+        code_writer.writeUnit(unit.assembly, unit.count)
+    source_map = VMtranslator.link_source_map(units, code_writer, options)
+    code_writer.writeEnd()
+    return code_writer.getvalue(), source_map
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the build driver."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "path", help="directory of .jack files, built into <path>/<name>"
+    )
+    arg_parser.add_argument(
+        "--os", metavar="DIR", default=OS_DIR,
+        help="link in the classes of this directory (default: project 12)"
+    )
+    arg_parser.add_argument(
+        "--no-os", action="store_true",
+        help="only build the classes of the program"
+    )
+    arg_parser.add_argument(
+        "--format", choices=sorted(assembler.image.FORMATS), default="hack",
+        help="output format of the image (default: hack)"
+    )
+    arg_parser.add_argument(
+        "--keep", action="store_true",
+        help="also write the .vm files and the .asm file of the program"
+    )
+    arg_parser.add_argument(
+        "--cache", metavar="DIR", default=None,
+        help=("reuse outputs of unchanged inputs from this build cache "
+              "(default: $HACK_BUILD_CACHE, off when unset)")
+    )
+    arg_parser.add_argument(
+        "--cache-size", metavar="MB", type=float, default=None,
+        help="evict least recently used cache entries beyond this size"
+    )
+    arg_parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help=("number of worker processes building classes "
+              "(default: number of cores, 1 disables)")
+    )
+    arg_parser.add_argument(
+        "--shared-routines", action="store_true",
+        help="emit call, return and eq/gt/lt once per program"
+    )
+    arg_parser.add_argument(
+        "--top-in-d", action="store_true",
+        help="keep the top of the stack in the D register"
+    )
+    arg_parser.add_argument(
+        "-O", "--optimize", action="store_true",
+        help=("fold constants and drop redundant VM commands, then run the "
+              "--peephole pass")
+    )
+    arg_parser.add_argument(
+        "--peephole", action="store_true",
+        help="only drop redundant instructions from the generated assembly"
+    )
+    arg_parser.add_argument(
+        "--source-map", action="store_true",
+        help="also write <image>.map for tools/hack_profiler.py"
+    )
+    arg_parser.add_argument(
+        "--remove-dead-functions", action="store_true",
+        help="leave out the functions Sys.init never calls"
+    )
+    args = arg_parser.parse_args(argv)
+    if args.source_map and (args.optimize or args.peephole):
+        arg_parser.error(
+            "--source-map cannot be combined with --optimize or --peephole"
+        )
+    return args
+
+
+if __name__ == "__main__":
+    main()
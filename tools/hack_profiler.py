@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""Profile a translated hack program per vm function and command type."""
+import argparse
+import sys
+from collections import Counter
+
+from block_executor import BlockExecutor, compile_block
+from cpu_emulator import CPUEmulator, ROM_SIZE, read_program
+from source_map import SourceMap
+
+
+class Profiler(BlockExecutor):
+    """Block executor counting the cycles spent at every ROM address.
+
+    Every vm command starts a block, so the cycles of a block all belong
+    to one command and the number of times a block is entered at the
+    start of a command is the number of times the command ran.
+    """
+
+    def __init__(self, program, source_map):
+        """Create a profiler of program, split into blocks by source_map."""
+        self.source_map = source_map
+        self.spent = [0] * ROM_SIZE
+        self.entered = [0] * ROM_SIZE
+        super().__init__(program, source_map.addresses())
+
+    def run(self, cycles, stop_at_halt=False):
+        """Execute up to cycles instructions and return how many ran.
+
+        Like BlockExecutor.run, recording the cycles and entries of every
+        block at its start address.
+        """
+        blocks = self.blocks
+        ram = self.ram
+        spent = self.spent
+        entered = self.entered
+        a = self.a
+        d = self.d
+        pc = self.pc
+        remaining = cycles
+        halted = False
+
+        while remaining:
+            block = blocks[pc]
+            if block is None:
+                block = compile_block(self.rom, pc, self.leaders)
+                blocks[pc] = block
+
+            function, length, pure = block
+            if length > remaining:
+                break
+            start = pc
+            a, d, pc, executed = function(ram, a, d)
+            remaining -= executed
+            spent[start] += executed
+            entered[start] += 1
+            if stop_at_halt and pure and pc == start:
+                halted = True
+                break
+
+        self.a = a
+        self.d = d
+        self.pc = pc
+        self.cycles += cycles - remaining
+        ran = cycles - remaining
+        if remaining and not halted:
+            # single step what is left of the last block
+            entered[self.pc] += 1
+            while remaining:
+                address = self.pc
+                if not CPUEmulator.run(self, 1, stop_at_halt):
+                    break
+                spent[address] += 1
+                remaining -= 1
+                ran += 1
+        return ran
+
+    def profile(self):
+        """Return cycles per function, calls per function and cycles and
+        executions per command type, as Counters.
+        """
+        function_cycles = Counter()
+        calls = Counter()
+        command_cycles = Counter()
+        executions = Counter()
+
+        for address, cycles in enumerate(self.spent):
+            if cycles:
+                entry = self.source_map.lookup(address)
+                function = entry.function if entry else "-"
+                command = entry.command.split()[0] if entry else "-"
+                function_cycles[function] += cycles
+                command_cycles[command] += cycles
+
+        for entry in self.source_map.entries:
+            count = self.entered[entry.address]
+            # commands without code share the address of the next one
+            if not count or self.source_map.lookup(entry.address) != entry:
+                continue
+            command = entry.command.split()
+            executions[command[0]] += count
+            if command[0] == "call":
+                calls[command[1]] += count
+            elif command[0] == "bootstrap":
+                # the bootstrap ends in the call of Sys.init
+                calls["Sys.init"] += count
+        return function_cycles, calls, command_cycles, executions
+
+
+def report(profiler, top=None):
+    """Print the profile of a finished run."""
+    function_cycles, calls, command_cycles, executions = profiler.profile()
+    total = sum(function_cycles.values()) or 1
+
+    print(f"{'function':<32}{'calls':>10}{'cycles':>12}{'%':>8}")
+    for function, cycles in function_cycles.most_common(top):
+        print(f"{function:<32}{calls[function]:>10}{cycles:>12}"
+              f"{100 * cycles / total:>8.2f}")
+
+    print()
+    print(f"{'command':<32}{'executed':>10}{'cycles':>12}"
+          f"{'per command':>14}")
+    for command, cycles in command_cycles.most_common():
+        count = executions[command]
+        per_command = f"{cycles / count:.2f}" if count else "-"
+        print(f"{command:<32}{count:>10}{cycles:>12}{per_command:>14}")
+
+
+def main():
+    """Run a .hack program and print where its cycles were spent."""
+    args = parse_args()
+    program = read_program(args.file)
+    source_map = SourceMap.read(args.map or args.file + ".map")
+
+    profiler = Profiler(program, source_map)
+    for assignment in args.set:
+        address, value = assignment.split("=")
+        profiler.poke(int(address), int(value))
+    executed = profiler.run(args.cycles, stop_at_halt=not args.no_halt)
+    if executed == args.cycles:
+        print(f"stopped after {executed} cycles", file=sys.stderr)
+
+    report(profiler, args.top)
+    print()
+    print(f"{executed} cycles")
+    for address in args.print:
+        print(f"RAM[{address}] = {profiler.peek(address)}")
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the profiler."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("file", help="the .hack file to run")
+    arg_parser.add_argument(
+        "--map", metavar="FILE",
+        help="source map of the program (default: <file>.map)"
+    )
+    arg_parser.add_argument(
+        "-n", "--cycles", type=int, default=10000000,
+        help="maximum number of instructions to run (default: 10000000)"
+    )
+    arg_parser.add_argument(
+        "--no-halt", action="store_true",
+        help="keep running through the final infinite loop"
+    )
+    arg_parser.add_argument(
+        "--top", type=int, default=None, metavar="N",
+        help="only list the N functions using the most cycles"
+    )
+    arg_parser.add_argument(
+        "--set", action="append", default=[], metavar="ADDRESS=VALUE",
+        help="set RAM[ADDRESS] before running"
+    )
+    arg_parser.add_argument(
+        "--print", type=int, action="append", default=[], metavar="ADDRESS",
+        help="print RAM[ADDRESS] after running"
+    )
+    return arg_parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
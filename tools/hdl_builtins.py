@@ -0,0 +1,224 @@
+"""Array backed models of the memory, register and I/O chips.
+
+Models work on numpy arrays holding the unsigned value of a pin in every
+lane. The memory chips written in projects 03 and 05 are replaced by
+their model once the implementation is shown to behave the same, the
+I/O chips and the registers of the CPU only exist as models.
+"""
+import numpy as np
+
+from cpu_emulator import ROM_SIZE, read_program
+
+# Pins of every chip with a model, in the notation of the builtin chips
+INTERFACES = {
+    "Register": "IN in[16], load; OUT out[16];",
+    "ARegister": "IN in[16], load; OUT out[16];",
+    "DRegister": "IN in[16], load; OUT out[16];",
+    "PC": "IN in[16], load, inc, reset; OUT out[16];",
+    "RAM8": "IN in[16], load, address[3]; OUT out[16];",
+    "RAM64": "IN in[16], load, address[6]; OUT out[16];",
+    "RAM512": "IN in[16], load, address[9]; OUT out[16];",
+    "RAM4K": "IN in[16], load, address[12]; OUT out[16];",
+    "RAM16K": "IN in[16], load, address[14]; OUT out[16];",
+    "Screen": "IN in[16], load, address[13]; OUT out[16];",
+    "Keyboard": "OUT out[16];",
+    "ROM32K": "IN address[15]; OUT out[16];",
+}
+
+
+def interface(name):
+    """Return the source of the builtin chip declaring the pins of name."""
+    return f"CHIP {name} {{ {INTERFACES[name]} BUILTIN {name}; }}"
+
+
+class Model(object):
+    """A chip without state, outputs are computed by evaluate.
+
+    combinational lists the input pins the outputs depend on without a
+    clock cycle in between. Clocked models sample all their inputs on
+    tick and update their state on tock.
+    """
+
+    combinational = ()
+    clocked = False
+
+    def evaluate(self, inputs):
+        """Return the outputs for the combinational inputs."""
+        raise NotImplementedError
+
+    def tick(self, inputs):
+        """Sample the inputs, the state only changes on tock."""
+
+    def tock(self):
+        """Move to the state sampled by tick."""
+
+    def get(self, index):
+        """Return the internal value at index in the first lane.
+
+        Like the builtin chips of the hardware simulator, values sampled
+        by tick are already visible before tock.
+        """
+        raise KeyError(index)
+
+    def set(self, index, value):
+        """Set the internal value at index in every lane."""
+        raise KeyError(index)
+
+
+class Register(Model):
+    """A 16 bit register: out(t+1) = in(t) if load(t) else out(t)."""
+
+    clocked = True
+
+    def __init__(self, lanes):
+        """Create a register holding zero in every lane."""
+        self.state = np.zeros(lanes, dtype=np.int64)
+        self.next_state = self.state
+
+    def evaluate(self, inputs):
+        """Return the stored value."""
+        return {"out": self.state}
+
+    def tick(self, inputs):
+        """Sample the value to store."""
+        self.next_state = np.where(inputs["load"] != 0, inputs["in"],
+                                   self.state)
+
+    def tock(self):
+        """Store the sampled value."""
+        self.state = self.next_state
+
+    def get(self, index):
+        """Return the stored value, the index is ignored."""
+        return int(self.next_state[0])
+
+    def set(self, index, value):
+        """Store value, the index is ignored."""
+        self.state = np.full_like(self.state, value & 0xFFFF)
+        self.next_state = self.state
+
+
+class ProgramCounter(Register):
+    """A register which resets to zero, loads or increments."""
+
+    def tick(self, inputs):
+        """Sample the next count, reset wins over load over inc."""
+        self.next_state = np.where(
+            inputs["reset"] != 0, 0, np.where(
+                inputs["load"] != 0, inputs["in"], np.where(
+                    inputs["inc"] != 0, (self.state + 1) & 0xFFFF,
+                    self.state
+                )
+            )
+        )
+
+
+class RAM(Model):
+    """Memory of size words read at address and written on the clock."""
+
+    combinational = ("address",)
+    clocked = True
+    size = 8
+
+    def __init__(self, lanes):
+        """Create a memory holding zeros in every lane."""
+        self.memory = np.zeros((lanes, self.size), dtype=np.uint16)
+        self.lanes = np.arange(lanes)
+        self.write = None
+
+    def evaluate(self, inputs):
+        """Return the word at address."""
+        return {"out": self.memory[self.lanes, inputs["address"]]
+                .astype(np.int64)}
+
+    def tick(self, inputs):
+        """Sample the word to write, if load is set."""
+        load = inputs["load"] != 0
+        self.write = (self.lanes[load], inputs["address"][load],
+                      inputs["in"][load])
+
+    def tock(self):
+        """Write the sampled word."""
+        if self.write is not None:
+            lanes, addresses, values = self.write
+            self.memory[lanes, addresses] = values
+            self.write = None
+
+    def get(self, index):
+        """Return the word at index."""
+        if self.write is not None:
+            lanes, addresses, values = self.write
+            written = (lanes == 0) & (addresses == index)
+            if written.any():
+                return int(values[written][0])
+        return int(self.memory[0, index])
+
+    def set(self, index, value):
+        """Write value to the word at index."""
+        self.memory[:, index] = value & 0xFFFF
+
+
+class Keyboard(Model):
+    """The memory mapped keyboard, Keyboard[] is the key held down."""
+
+    def __init__(self, lanes):
+        """Create a keyboard with no key pressed."""
+        self.key = np.zeros(lanes, dtype=np.int64)
+
+    def evaluate(self, inputs):
+        """Return the key held down."""
+        return {"out": self.key}
+
+    def get(self, index):
+        """Return the key held down, the index is ignored."""
+        return int(self.key[0])
+
+    def set(self, index, value):
+        """Hold down the key with code value, the index is ignored."""
+        self.key = np.full_like(self.key, value & 0xFFFF)
+
+
+class ROM(Model):
+    """The instruction memory, filled with "ROM32K load file.hack"."""
+
+    combinational = ("address",)
+
+    def __init__(self, lanes):
+        """Create a ROM of zeros, shared by every lane."""
+        self.memory = np.zeros(ROM_SIZE, dtype=np.uint16)
+
+    def load(self, path):
+        """Load the program of a .hack file."""
+        program = read_program(path)
+        self.memory[:] = 0
+        self.memory[:len(program)] = program
+
+    def evaluate(self, inputs):
+        """Return the instruction at address."""
+        return {"out": self.memory[inputs["address"]].astype(np.int64)}
+
+    def get(self, index):
+        """Return the instruction at index."""
+        return int(self.memory[index])
+
+
+def _ram(size):
+    """Return the RAM model of size words."""
+    return type(f"RAM{size}", (RAM,), {"size": size})
+
+
+# Chip name -> model class, created with the number of lanes
+MODELS = {
+    "Register": Register,
+    "ARegister": Register,
+    "DRegister": Register,
+    "PC": ProgramCounter,
+    "RAM8": _ram(8),
+    "RAM64": _ram(64),
+    "RAM512": _ram(512),
+    "RAM4K": _ram(4096),
+    "RAM16K": _ram(16384),
+    "Screen": _ram(8192),
+    "Keyboard": Keyboard,
+    "ROM32K": ROM,
+}
@@ -0,0 +1,148 @@
+"""Parse the chip definitions of .hdl files."""
+import os
+import re
+from collections import namedtuple
+
+# Comments, words and the punctuation of the hdl language
+TOKENS = re.compile(r"//[^\n]*|/\*.*?\*/|\.\.|[{}()\[\];:,=]|\w+", re.S)
+
+# A chip, pins are (name, width) pairs and parts (chip name, connections)
+Chip = namedtuple(
+    "Chip", ["name", "inputs", "outputs", "parts", "builtin", "clocked"]
+)
+# pin[bits]=signal[bits] where bits are (first, last) or None for all
+Connection = namedtuple(
+    "Connection", ["pin", "pin_bits", "signal", "signal_bits"]
+)
+
+# Directories of the repository searched for chips, after the chip's own
+PROJECT_DIRS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, path)
+    for path in ("01", "02", os.path.join("03", "a"),
+                 os.path.join("03", "b"), "05")
+]
+
+
+class HDLError(Exception):
+    """An invalid chip definition."""
+
+
+class MissingChipError(HDLError):
+    """A chip without a .hdl implementation the simulator can use."""
+
+
+def parse_hdl(text):
+    """Parse the source of a .hdl file into a Chip."""
+    tokens = [
+        token for token in TOKENS.findall(text)
+        if not token.startswith(("//", "/*"))
+    ]
+    return _HDLParser(tokens).chip()
+
+
+def find_chip(name, directories):
+    """Return the path of name.hdl in the first directory containing it."""
+    for directory in directories:
+        path = os.path.join(directory, f"{name}.hdl")
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class _HDLParser(object):
+    """Recursive descent parser over the tokens of a .hdl file."""
+
+    def __init__(self, tokens):
+        """Create a parser of tokens."""
+        self.tokens = tokens
+        self.index = 0
+
+    def chip(self):
+        """Parse CHIP name { IN ...; OUT ...; PARTS: ... }."""
+        self.expect("CHIP")
+        name = self.next()
+        self.expect("{")
+        inputs = outputs = []
+        parts = []
+        builtin = False
+        clocked = []
+        while self.peek() != "}":
+            keyword = self.next()
+            if keyword == "IN":
+                inputs = self.pins()
+            elif keyword == "OUT":
+                outputs = self.pins()
+            elif keyword == "PARTS":
+                self.expect(":")
+                while self.peek() not in ("}", "BUILTIN", "CLOCKED"):
+                    parts.append(self.part())
+            elif keyword == "BUILTIN":
+                self.next()
+                self.expect(";")
+                builtin = True
+            elif keyword == "CLOCKED":
+                clocked = [pin for pin, _ in self.pins()]
+            else:
+                raise HDLError(f"unexpected {keyword} in chip {name}")
+        self.expect("}")
+        return Chip(name, inputs, outputs, parts, builtin, clocked)
+
+    def pins(self):
+        """Parse a pin list ending in ;."""
+        pins = []
+        while True:
+            name = self.next()
+            width = 1
+            if self.peek() == "[":
+                self.next()
+                width = int(self.next())
+                self.expect("]")
+            pins.append((name, width))
+            if self.next() == ";":
+                return pins
+
+    def part(self):
+        """Parse Name(pin=signal, ...);."""
+        name = self.next()
+        self.expect("(")
+        connections = []
+        while True:
+            pin, pin_bits = self.bus()
+            self.expect("=")
+            signal, signal_bits = self.bus()
+            connections.append(Connection(pin, pin_bits, signal, signal_bits))
+            if self.next() == ")":
+                break
+        self.expect(";")
+        return name, connections
+
+    def bus(self):
+        """Parse name, name[i] or name[i..j]."""
+        name = self.next()
+        if self.peek() != "[":
+            return name, None
+        self.next()
+        first = last = int(self.next())
+        if self.peek() == "..":
+            self.next()
+            last = int(self.next())
+        self.expect("]")
+        return name, (first, last)
+
+    def peek(self):
+        """Return the next token without consuming it."""
+        if self.index >= len(self.tokens):
+            raise HDLError("unexpected end of file")
+        return self.tokens[self.index]
+
+    def next(self):
+        """Consume and return the next token."""
+        token = self.peek()
+        self.index += 1
+        return token
+
+    def expect(self, expected):
+        """Consume the next token, which must be expected."""
+        token = self.next()
+        if token != expected:
+            raise HDLError(f"expected {expected} but found {token}")
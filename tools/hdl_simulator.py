@@ -0,0 +1,715 @@
+"""Simulate .hdl chips as netlists of Nand gates evaluated with numpy.
+
+Every net holds one bit per lane, packed 64 lanes to a numpy uint64
+word, so a single sweep over the netlist evaluates the chip for as many
+input vectors as there are lanes.
+"""
+import io
+import json
+import os
+
+import numpy as np
+
+import build_cache
+from hdl_builtins import INTERFACES, MODELS, interface
+from hdl_parser import (
+    PROJECT_DIRS, Chip, HDLError, MissingChipError, find_chip, parse_hdl
+)
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Nets of the constants
+FALSE = 0
+TRUE = 1
+# Type of the net numbers
+NET = np.int32
+
+# Random clock cycles and lanes a memory chip is checked on before it is
+# replaced by its model
+VERIFY_CYCLES = 100
+VERIFY_LANES = 64
+
+
+class Netlist(object):
+    """A chip flattened to Nand gates, DFFs and modelled parts.
+
+    Nets FALSE and TRUE are the constants. pins maps every IN and OUT pin
+    of the chip to an array of its nets, least significant bit first.
+    gates is a (3, n) array of the a, b and out nets of the Nand gates,
+    sorted by level: the gates before level_ends[i] only read nets driven
+    by earlier levels. dffs is a (2, m) array of DFF in and out nets.
+    components are (chip name, pins) of the parts simulated by a model of
+    hdl_builtins, evaluated before the gates of level component_waves[i].
+    """
+
+    def __init__(self, name, inputs, outputs, net_count, pins, gates,
+                 level_ends, dffs, components=(), component_waves=()):
+        """Create a netlist, see elaborate."""
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.net_count = net_count
+        self.pins = pins
+        self.gates = gates
+        self.level_ends = level_ends
+        self.dffs = dffs
+        self.components = list(components)
+        self.component_waves = np.asarray(component_waves, dtype=NET)
+        self.waves = [
+            (np.flatnonzero(self.component_waves == wave).tolist(),
+             tuple(gates[:, begin:end]))
+            for wave, (begin, end) in enumerate(
+                zip(np.r_[0, level_ends[:-1]], level_ends)
+            )
+        ]
+
+    @property
+    def gate_count(self):
+        """Return the number of Nand gates."""
+        return self.gates.shape[1]
+
+    @property
+    def dff_in(self):
+        """Return the nets sampled by the DFFs."""
+        return self.dffs[0]
+
+    @property
+    def dff_out(self):
+        """Return the nets driven by the DFFs."""
+        return self.dffs[1]
+
+    @property
+    def clocked(self):
+        """Return whether the chip has any state."""
+        return self.dffs.shape[1] > 0 or any(
+            MODELS[name].clocked for name, _ in self.components
+        )
+
+    def width(self, pin):
+        """Return the number of bits of a pin."""
+        return len(self.pins[pin])
+
+    def to_bytes(self):
+        """Serialize the netlist for the build cache."""
+        header = {
+            "name": self.name, "inputs": self.inputs,
+            "outputs": self.outputs, "net_count": self.net_count,
+            "components": [
+                [name, [[pin, len(nets)] for pin, nets in pins.items()]]
+                for name, pins in self.components
+            ],
+        }
+        component_nets = [
+            nets for _, pins in self.components for nets in pins.values()
+        ]
+        data = io.BytesIO()
+        np.savez(
+            data, header=np.array(json.dumps(header)), gates=self.gates,
+            level_ends=self.level_ends, dffs=self.dffs,
+            pins=np.concatenate(list(self.pins.values())),
+            component_nets=np.concatenate([np.zeros(0, NET)] +
+                                          component_nets),
+            component_waves=self.component_waves
+        )
+        return data.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Return the netlist serialized by to_bytes."""
+        arrays = np.load(io.BytesIO(data))
+        header = json.loads(str(arrays["header"]))
+        inputs = [tuple(pin) for pin in header["inputs"]]
+        outputs = [tuple(pin) for pin in header["outputs"]]
+        pins = _split(arrays["pins"], inputs + outputs)
+        component_nets = arrays["component_nets"]
+        components = []
+        for name, component_pins in header["components"]:
+            components.append((name, _split(component_nets,
+                                            component_pins)))
+            component_nets = component_nets[sum(
+                width for _, width in component_pins
+            ):]
+        return cls(
+            header["name"], inputs, outputs, header["net_count"], pins,
+            arrays["gates"], arrays["level_ends"], arrays["dffs"],
+            components, arrays["component_waves"]
+        )
+
+
+def _split(nets, pins):
+    """Return a dict of the nets of each (name, width) pin in turn."""
+    split = {}
+    offset = 0
+    for name, width in pins:
+        split[name] = nets[offset:offset + width]
+        offset += width
+    return split
+
+
+def _primitive(chip, gates=(), dffs=(), component=False):
+    """Return the Netlist of a primitive chip on nets 2, 3, ...
+
+    A component netlist is a single part simulated by its model.
+    """
+    pins = {}
+    for pin, width in chip.inputs + chip.outputs:
+        start = sum(len(nets) for nets in pins.values()) + 2
+        pins[pin] = np.arange(start, start + width, dtype=NET)
+    gates = np.array(gates, dtype=NET).reshape(3, -1)
+    return Netlist(
+        chip.name, chip.inputs, chip.outputs,
+        sum(len(nets) for nets in pins.values()) + 2, pins, gates,
+        np.array([gates.shape[1]], dtype=NET),
+        np.array(dffs, dtype=NET).reshape(2, -1),
+        [(chip.name, pins)] if component else [], [0] if component else []
+    )
+
+
+# Chips the netlist is made of
+PRIMITIVES = {
+    "Nand": _primitive(
+        Chip("Nand", [("a", 1), ("b", 1)], [("out", 1)], [], True, []),
+        gates=[[2], [3], [4]]
+    ),
+    "DFF": _primitive(
+        Chip("DFF", [("in", 1)], [("out", 1)], [], True, ["in"]),
+        dffs=[[2], [3]]
+    ),
+}
+
+
+def elaborate(chip_path, cache=None, substitute=True):
+    """Flatten the chip of a .hdl file into a Netlist.
+
+    Parts are looked up next to the chip, then in the chip directories of
+    the other projects. With substitute, memory parts shown equivalent to
+    their model in hdl_builtins are simulated by the model. With a build
+    cache the netlist of every chip in the hierarchy is stored under the
+    hash of its source and the sources of its parts, so unchanged chips
+    are not elaborated again.
+    """
+    directories = [os.path.dirname(os.path.abspath(chip_path))]
+    directories.extend(PROJECT_DIRS)
+    with open(chip_path) as hdl:
+        source = hdl.read()
+    elaborator = _Elaborator(directories, cache, substitute)
+    chip = parse_hdl(source)
+    if chip.builtin:
+        return elaborator.netlist(elaborator.add(chip, source))
+    # the chip under test is always simulated from its own parts
+    return elaborator.compiled(elaborator.add(chip, source))
+
+
+def equivalent(netlist, model_class, cycles=VERIFY_CYCLES,
+               lanes=VERIFY_LANES, seed=0):
+    """Return whether a netlist behaves like a model on random inputs.
+
+    Every lane runs its own random sequence of clock cycles. Addresses
+    are drawn from a few random values so words written are read back.
+    """
+    rng = np.random.default_rng(seed)
+    simulator = Simulator(netlist, lanes)
+    model = model_class(lanes)
+    addresses = {
+        name: rng.integers(0, 1 << width, 16)
+        for name, width in netlist.inputs if name == "address"
+    }
+
+    def same():
+        outputs = model.evaluate(
+            {pin: inputs[pin] for pin in model.combinational}
+        )
+        return all(
+            np.array_equal(simulator.get(pin), outputs[pin])
+            for pin, _ in netlist.outputs
+        )
+
+    for _ in range(cycles):
+        inputs = {}
+        for name, width in netlist.inputs:
+            if name in addresses:
+                inputs[name] = rng.choice(addresses[name], lanes)
+            else:
+                inputs[name] = rng.integers(0, 1 << width, lanes)
+            simulator.set(name, inputs[name])
+        simulator.evaluate()
+        if not same():
+            return False
+        simulator.tick()
+        model.tick(inputs)
+        simulator.tock()
+        model.tock()
+        if not same():
+            return False
+    return True
+
+
+class _Elaborator(object):
+    """Compile chips to netlists, each chip once.
+
+    The netlist of a chip is made by copying the netlists of its parts
+    with their nets shifted past the nets used so far, then joining the
+    nets connected to each other. A memory part is checked against its
+    model with its own parts already replaced, so each check only
+    simulates a few gates around smaller models.
+    """
+
+    def __init__(self, directories, cache=None, substitute=True):
+        """Create an elaborator looking up parts in directories."""
+        self.directories = directories
+        self.cache = cache
+        self.substitute = substitute
+        self.chips = {}
+        self.sources = {}
+        self.keys = {}
+        self.netlists = dict(PRIMITIVES)
+        self.compiled_netlists = {}
+
+    def add(self, chip, source):
+        """Add a parsed chip and return its name."""
+        self.chips[chip.name] = chip
+        self.sources[chip.name] = source
+        return chip.name
+
+    def netlist(self, name):
+        """Return the Netlist of a part called name."""
+        if name not in self.netlists:
+            chip = self.load(name)
+            if chip.builtin and name not in MODELS:
+                raise MissingChipError(
+                    f"builtin chip {name} is not simulated"
+                )
+            if chip.builtin or (self.substitute and name in MODELS and
+                                self.equivalent(name)):
+                self.netlists[name] = _primitive(chip, component=True)
+            else:
+                self.netlists[name] = self.compiled(name)
+        return self.netlists[name]
+
+    def compiled(self, name):
+        """Return the Netlist of the gates of the chip called name."""
+        if name in self.compiled_netlists:
+            return self.compiled_netlists[name]
+
+        # missing parts fail before the long compilation of the others
+        self.load_parts(self.load(name))
+        key = None
+        if self.cache is not None:
+            key = self.key(name)
+            data = self.cache.get(key)
+            if data is not None:
+                netlist = Netlist.from_bytes(data)
+                self.compiled_netlists[name] = netlist
+                return netlist
+
+        netlist = self.compile(self.load(name))
+        if key is not None:
+            self.cache.put(key, netlist.to_bytes())
+        self.compiled_netlists[name] = netlist
+        return netlist
+
+    def equivalent(self, name):
+        """Return whether the chip called name behaves like its model."""
+        chip = self.load(name)
+        builtin = parse_hdl(interface(name))
+        if (chip.inputs, chip.outputs) != (builtin.inputs, builtin.outputs):
+            return False
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key("equivalent", self.key(name))
+            data = self.cache.get(key)
+            if data is not None:
+                return data == b"1"
+
+        result = equivalent(self.compiled(name), MODELS[name])
+        if key is not None:
+            self.cache.put(key, b"1" if result else b"0")
+        return result
+
+    def compile(self, chip):
+        """Flatten chip into a Netlist."""
+        nets = _Nets()
+        pins = {
+            name: nets.new(width)
+            for name, width in chip.inputs + chip.outputs
+        }
+        internal = {}
+        gates = []
+        dffs = []
+        components = []
+        for part_name, connections in chip.parts:
+            part = self.netlist(part_name)
+            offset = nets.reserve(part.net_count - 2) - 2
+
+            def place(local):
+                return np.where(local < 2, local, local + offset)
+
+            gates.append(place(part.gates))
+            dffs.append(place(part.dffs))
+            components.extend(
+                (name, {pin: place(pin_nets)
+                        for pin, pin_nets in component_pins.items()})
+                for name, component_pins in part.components
+            )
+            for connection in connections:
+                if connection.pin not in part.pins:
+                    raise HDLError(
+                        f"{part_name} has no pin {connection.pin} "
+                        f"(in {chip.name})"
+                    )
+                part_nets = _select(
+                    place(part.pins[connection.pin]).tolist(),
+                    connection.pin_bits
+                )
+                signal = self.signal(
+                    connection, len(part_nets), pins, internal, nets,
+                    chip.name
+                )
+                for net, signal_net in zip(part_nets, signal):
+                    nets.union(net, signal_net)
+
+        roots = nets.roots()
+        gates = roots[np.concatenate([np.zeros((3, 0), NET)] + gates, 1)]
+        dffs = roots[np.concatenate([np.zeros((2, 0), NET)] + dffs, 1)]
+        pins = {name: roots[pin_nets] for name, pin_nets in pins.items()}
+        components = [
+            (name, {pin: roots[pin_nets]
+                    for pin, pin_nets in component_pins.items()})
+            for name, component_pins in components
+        ]
+        return _compact(
+            chip, nets.count, pins, components, *levelize(
+                gates, dffs, nets.count, [
+                    self.dependencies(name, component_pins)
+                    for name, component_pins in components
+                ]
+            )
+        )
+
+    def dependencies(self, name, pins):
+        """Return the combinational input and the output nets of a part."""
+        inputs = [pins[pin] for pin in MODELS[name].combinational]
+        outputs = [pins[pin] for pin, _ in self.load(name).outputs]
+        return (np.concatenate([np.zeros(0, NET)] + inputs),
+                np.concatenate(outputs))
+
+    def signal(self, connection, width, pins, internal, nets, chip_name):
+        """Return the nets of the signal side of a connection."""
+        name = connection.signal
+        if name == "true":
+            return [TRUE] * width
+        if name == "false":
+            return [FALSE] * width
+
+        if name in pins:
+            signal_nets = _select(pins[name], connection.signal_bits)
+        else:
+            # internal pins take their width from their connections
+            bus = internal.setdefault(name, [])
+            first = connection.signal_bits[0] if connection.signal_bits else 0
+            if len(bus) < first + width:
+                bus.extend(nets.new(first + width - len(bus)))
+            signal_nets = bus[first:first + width]
+
+        if len(signal_nets) != width:
+            raise HDLError(
+                f"{connection.pin} of width {width} connected to {name} "
+                f"of width {len(signal_nets)} (in {chip_name})"
+            )
+        return signal_nets
+
+    def load(self, name):
+        """Return the Chip of a part.
+
+        Chips with a model but no .hdl file get their builtin interface.
+        """
+        if name not in self.chips:
+            path = find_chip(name, self.directories)
+            if path is not None:
+                with open(path) as hdl:
+                    source = hdl.read()
+            elif name in INTERFACES:
+                source = interface(name)
+            else:
+                raise MissingChipError(f"no implementation of chip {name}")
+            self.add(parse_hdl(source), source)
+        return self.chips[name]
+
+    def load_parts(self, chip):
+        """Load the Chip of every part in the hierarchy of chip."""
+        for part_name, _ in chip.parts:
+            if part_name not in self.chips and part_name not in PRIMITIVES:
+                self.load_parts(self.load(part_name))
+
+    def key(self, name):
+        """Return the cache key of a chip and every part below it."""
+        if name in PRIMITIVES or self.load(name).builtin:
+            return name
+        if name not in self.keys:
+            parts = sorted({part_name for part_name, _ in
+                            self.load(name).parts})
+            self.keys[name] = self.cache.key(
+                "hdl_simulator", build_cache.fingerprint(TOOL_DIR),
+                str(self.substitute), self.sources[name],
+                *[f"{part} {self.key(part)}" for part in parts]
+            )
+        return self.keys[name]
+
+
+class _Nets(object):
+    """Allocate nets and join them in a union find forest.
+
+    Only joined nets are kept in the forest, every other net is its own
+    root. Roots are the smallest net so the constants stay FALSE and TRUE.
+    """
+
+    def __init__(self):
+        """Start with the constant nets."""
+        self.count = 2
+        self.parent = {}
+
+    def new(self, count):
+        """Return a list of count new nets."""
+        start = self.reserve(count)
+        return list(range(start, start + count))
+
+    def reserve(self, count):
+        """Allocate count nets and return the first of them."""
+        start = self.count
+        self.count += count
+        return start
+
+    def find(self, net):
+        """Return the root of the nets joined with net."""
+        parent = self.parent
+        while parent.get(net, net) != net:
+            parent[net] = parent.get(parent[net], parent[net])
+            net = parent[net]
+        return net
+
+    def union(self, first, second):
+        """Join two nets into one."""
+        first = self.find(first)
+        second = self.find(second)
+        if first < second:
+            self.parent[second] = first
+        elif second < first:
+            self.parent[first] = second
+
+    def roots(self):
+        """Return an array mapping every net to its root."""
+        roots = np.arange(self.count, dtype=NET)
+        for net in self.parent:
+            roots[net] = self.find(net)
+        return roots
+
+
+def _select(nets, bits):
+    """Return the nets of bits (first, last), or all of them for None."""
+    if bits is None:
+        return nets
+    first, last = bits
+    if not 0 <= first <= last < len(nets):
+        raise HDLError(f"bits {first}..{last} out of range")
+    return nets[first:last + 1]
+
+
+def levelize(gates, dffs, net_count, components=()):
+    """Sort Nand gates into levels in topological order.
+
+    components are the (input nets, output nets) of modelled parts, whose
+    outputs depend on those inputs. Gates of a level reading the same two
+    nets are merged into one. Return the sorted gates, the end of every
+    level, the level before which each component is evaluated, the DFFs
+    and an array mapping the output of every merged gate to the gate kept
+    in its place.
+    """
+    a, b, out = gates
+    gate_count = len(a)
+    component_inputs = [inputs for inputs, _ in components]
+    component_outputs = [outputs for _, outputs in components]
+    outputs = np.concatenate([np.zeros(0, NET)] + component_outputs)
+    output_starts = np.cumsum(
+        [0] + [len(nets) for nets in component_outputs], dtype=NET
+    )
+    ready = np.ones(net_count, dtype=bool)
+    ready[out] = False
+    ready[outputs] = False
+
+    # gates are nodes 0, 1, ... and the components follow them
+    inputs = np.concatenate([a, b] + component_inputs)
+    nodes = np.concatenate(
+        [np.tile(np.arange(gate_count, dtype=NET), 2)] + [
+            np.full(len(nets), gate_count + index, dtype=NET)
+            for index, nets in enumerate(component_inputs)
+        ]
+    )
+    # number of inputs of every node still waiting for their driver
+    pending = np.bincount(nodes[~ready[inputs]],
+                          minlength=gate_count + len(components))
+    # nodes reading each net, as ranges of consumers
+    order = np.argsort(inputs, kind="stable")
+    consumers = nodes[order]
+    starts = np.searchsorted(inputs[order], np.arange(net_count + 1))
+
+    alias = np.arange(net_count, dtype=NET)
+    component_waves = np.zeros(len(components), dtype=NET)
+    frontier = np.flatnonzero(pending == 0)
+    levels = []
+    placed = 0
+    while len(frontier):
+        placed += len(frontier)
+        evaluated = frontier[frontier >= gate_count] - gate_count
+        component_waves[evaluated] = len(levels)
+        frontier = frontier[frontier < gate_count]
+
+        level = np.vstack((alias[a[frontier]], alias[b[frontier]],
+                           out[frontier]))
+        pairs = (np.minimum(level[0], level[1]).astype(np.int64) * net_count
+                 + np.maximum(level[0], level[1]))
+        _, kept, merged = np.unique(
+            pairs, return_index=True, return_inverse=True
+        )
+        alias[level[2]] = level[2, kept][merged.ravel()]
+        levels.append(level[:, kept])
+
+        driven = np.concatenate((level[2], _ranges(
+            outputs, output_starts[evaluated], output_starts[evaluated + 1]
+        )))
+        waiting = _ranges(consumers, starts[driven], starts[driven + 1])
+        waiting, counts = np.unique(waiting, return_counts=True)
+        pending[waiting] -= counts
+        frontier = waiting[pending[waiting] == 0]
+
+    if placed < len(pending):
+        raise HDLError("combinational loop without a DFF")
+    level_ends = np.cumsum([0] + [level.shape[1] for level in levels])
+    return (np.concatenate([np.zeros((3, 0), NET)] + levels, axis=1),
+            level_ends[1:].astype(NET), component_waves, alias[dffs],
+            alias)
+
+
+def _ranges(values, starts, ends):
+    """Return the concatenation of values[start:end] for every range."""
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return values[offsets + np.arange(lengths.sum())]
+
+
+def _compact(chip, net_count, pins, components, gates, level_ends,
+             component_waves, dffs, alias):
+    """Return the Netlist of chip numbering only the nets in use."""
+    pins = {name: alias[pin_nets] for name, pin_nets in pins.items()}
+    components = [
+        (name, {pin: alias[pin_nets]
+                for pin, pin_nets in component_pins.items()})
+        for name, component_pins in components
+    ]
+    used = np.zeros(net_count, dtype=bool)
+    used[[FALSE, TRUE]] = True
+    used[gates] = True
+    used[dffs] = True
+    for pin_nets in pins.values():
+        used[pin_nets] = True
+    for _, component_pins in components:
+        for pin_nets in component_pins.values():
+            used[pin_nets] = True
+    compact = (np.cumsum(used) - 1).astype(NET)
+    return Netlist(
+        chip.name, chip.inputs, chip.outputs, int(used.sum()),
+        {name: compact[pin_nets] for name, pin_nets in pins.items()},
+        compact[gates], level_ends, compact[dffs], [
+            (name, {pin: compact[pin_nets]
+                    for pin, pin_nets in component_pins.items()})
+            for name, component_pins in components
+        ], component_waves
+    )
+
+
+class Simulator(object):
+    """Evaluate a netlist for a number of lanes at once.
+
+    values holds a row of 64 lanes per uint64 word, one bit of every net
+    in each, so evaluating a level gathers from contiguous rows. Every
+    component of the netlist gets its own model.
+    """
+
+    def __init__(self, netlist, lanes=1):
+        """Create a simulator with every net, DFF and model at zero."""
+        self.netlist = netlist
+        self.lanes = lanes
+        self.words = (lanes + 63) // 64
+        self.values = np.zeros((self.words, netlist.net_count), np.uint64)
+        self.values[:, TRUE] = np.uint64(0xFFFFFFFFFFFFFFFF)
+        self.state = np.zeros((self.words, len(netlist.dff_out)), np.uint64)
+        self.next_state = self.state
+        self.models = [MODELS[name](lanes) for name, _ in netlist.components]
+
+    def set(self, pin, values):
+        """Set an input pin to one value, or a value per lane."""
+        self.write(self.netlist.pins[pin], values)
+
+    def get(self, pin):
+        """Return the unsigned value of a pin in every lane."""
+        return self.read(self.netlist.pins[pin])
+
+    def write(self, nets, values):
+        """Set nets to the bits of one value, or of a value per lane."""
+        values = np.broadcast_to(
+            np.asarray(values, dtype=np.int64), (self.lanes,)
+        )
+        bits = (values[None, :] >> np.arange(len(nets))[:, None]) & 1
+        padded = np.zeros((len(nets), self.words * 64), dtype=np.uint8)
+        padded[:, :self.lanes] = bits
+        packed = np.packbits(padded, axis=1, bitorder="little")
+        self.values[:, nets] = packed.view("<u8").T
+
+    def read(self, nets):
+        """Return the unsigned value of nets in every lane."""
+        words = np.ascontiguousarray(self.values[:, nets].T).view(np.uint8)
+        bits = np.unpackbits(words, axis=1, bitorder="little")
+        bits = bits[:, :self.lanes].astype(np.int64)
+        return (bits << np.arange(len(nets))[:, None]).sum(axis=0)
+
+    def model(self, chip):
+        """Return the model of the first part called chip."""
+        for model, (name, _) in zip(self.models, self.netlist.components):
+            if name == chip:
+                return model
+        raise KeyError(chip)
+
+    def evaluate(self):
+        """Compute every net from the inputs and the DFF outputs."""
+        self.values[:, self.netlist.dff_out] = self.state
+        for components, (a, b, out) in self.netlist.waves:
+            for index in components:
+                self._evaluate_component(index)
+            for values in self.values:
+                values[out] = ~(values[a] & values[b])
+
+    def _evaluate_component(self, index):
+        """Drive the outputs of a component from its model."""
+        model = self.models[index]
+        _, pins = self.netlist.components[index]
+        outputs = model.evaluate(
+            {pin: self.read(pins[pin]) for pin in model.combinational}
+        )
+        for pin, values in outputs.items():
+            self.write(pins[pin], values)
+
+    def tick(self):
+        """Evaluate and let every DFF and model sample its inputs."""
+        self.evaluate()
+        self.next_state = self.values[:, self.netlist.dff_in]
+        for model, (_, pins) in zip(self.models, self.netlist.components):
+            if model.clocked:
+                model.tick({pin: self.read(nets)
+                            for pin, nets in pins.items()})
+
+    def tock(self):
+        """Move the sampled inputs to the DFF outputs and evaluate."""
+        self.state = self.next_state
+        for model in self.models:
+            model.tock()
+        self.evaluate()
@@ -0,0 +1,78 @@
+"""Map the ROM addresses of translated programs back to vm commands."""
+from bisect import bisect_right
+from collections import namedtuple
+
+# The vm command whose code starts at address. Code added by the
+# translator itself has the file "-", line 0 and a function starting in $
+Entry = namedtuple("Entry", ["address", "file", "line", "function", "command"])
+
+
+class SourceMap(object):
+    """Entries sorted by address, each covering the code up to the next.
+
+    Commands without code, such as labels, share the address of the next
+    command, which is the one owning the code. The text format has one
+    tab separated entry per line.
+    """
+
+    def __init__(self, entries=()):
+        """Create a source map of entries sorted by address."""
+        self.entries = list(entries)
+        self._addresses = None
+
+    def __len__(self):
+        """Return the number of entries."""
+        return len(self.entries)
+
+    def append(self, entry):
+        """Add an entry at or after the address of the last one."""
+        self.entries.append(entry)
+        self._addresses = None
+
+    def extend(self, other, offset=0):
+        """Add the entries of other, moving them offset addresses up."""
+        self.entries.extend(
+            entry._replace(address=entry.address + offset)
+            for entry in other.entries
+        )
+        self._addresses = None
+
+    def addresses(self):
+        """Return the sorted start addresses of the entries."""
+        if self._addresses is None:
+            self._addresses = [entry.address for entry in self.entries]
+        return self._addresses
+
+    def lookup(self, address):
+        """Return the entry owning the code at address, or None."""
+        index = bisect_right(self.addresses(), address) - 1
+        return self.entries[index] if index >= 0 else None
+
+    def dumps(self):
+        """Return the source map in the text format."""
+        return "".join(
+            "\t".join(str(field) for field in entry) + "\n"
+            for entry in self.entries
+        )
+
+    @classmethod
+    def loads(cls, text):
+        """Return the source map of the text format."""
+        entries = []
+        for line in text.splitlines():
+            address, filename, number, function, command = line.split("\t")
+            entries.append(
+                Entry(int(address), filename, int(number), function, command)
+            )
+        return cls(entries)
+
+    @classmethod
+    def read(cls, path):
+        """Read a source map file."""
+        with open(path) as filestream:
+            return cls.loads(filestream.read())
+
+    def write(self, path):
+        """Write the source map to a file."""
+        with open(path, "w") as filestream:
+            filestream.write(self.dumps())
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+"""Measure how the assembler and the vm translator scale with input size."""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import build_cache
+from block_executor import ASSEMBLER_DIR
+from cpu_emulator import ROM_SIZE
+from hack_build import TRANSLATOR_DIR, VMtranslator, assembler
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+MIXES = ("labels", "variables", "calls", "comparisons")
+
+# Stages timed per tool, in the order they run
+STAGES = {
+    "assembler": ("parse", "symbols", "codegen", "output"),
+    "translator": ("parse", "codegen", "output"),
+}
+
+# Most variables a generated assembly program uses, RAM[16..16383] fits
+# a few more
+MAX_VARIABLES = 16000
+
+
+def main():
+    """Entry point for the toolchain benchmark."""
+    args = parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for tool in args.tools:
+            for mix in args.mixes:
+                for size in args.sizes:
+                    path = write_workload(
+                        directory, tool, mix, size, args.seed
+                    )
+                    result = measure(tool, path, args.repeat)
+                    result.update(tool=tool, mix=mix, size=size)
+                    results.append(result)
+                    print_result(result)
+
+    if args.history is None:
+        return
+    history = read_history(args.history)
+    regressions = find_regressions(history, results, args.tolerance)
+    history.append({
+        "version": version(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    })
+    write_history(args.history, history)
+
+    for result, previous in regressions:
+        print(f"regression: {result['tool']} {result['mix']} "
+              f"{result['lines']} lines at {result['lines_per_second']:,.0f} "
+              f"lines/s, was {previous['lines_per_second']:,.0f}")
+    if regressions:
+        sys.exit(1)
+
+
+def print_result(result):
+    """Print the timings of a single workload."""
+    stages = "  ".join(
+        f"{stage} {seconds:.3f}" for stage, seconds in result["stages"].items()
+    )
+    print(f"{result['tool']:<11}{result['mix']:<12}{result['lines']:>9} "
+          f"lines  {result['lines_per_second']:>11,.0f} lines/s  "
+          f"{result['peak_rss_kb'] / 1024:7.1f} MB  {stages}")
+
+
+def measure(tool, path, repeat=3):
+    """Run tool on the workload at path in a fresh process.
+
+    Return the stage timings of the fastest of repeat runs, the number of
+    lines, lines per second and the peak resident set size of the process,
+    which includes reading the source like the tool itself does.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_workload, tool, path, repeat).result()
+
+
+def run_workload(tool, path, repeat=3):
+    """Time the stages of tool on path, run inside a worker process."""
+    runner = run_assembler if tool == "assembler" else run_translator
+    with open(path) as source:
+        lines = sum(1 for _ in source)
+
+    best = None
+    for _ in range(repeat):
+        stages = runner(path, path + ".out")
+        if best is None or sum(stages.values()) < sum(best.values()):
+            best = stages
+    os.remove(path + ".out")
+
+    total = sum(best.values())
+    return {
+        "lines": lines,
+        "stages": best,
+        "seconds": total,
+        "lines_per_second": lines / total,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_assembler(path, output_path):
+    """Assemble path into output_path, return the seconds per stage."""
+    stages = {}
+    start = time.perf_counter()
+    with open(path) as source:
+        p = assembler.Parser(source)
+    stages["parse"] = lap(start)
+
+    start = time.perf_counter()
+    symbol_table = assembler.SymbolTable()
+    assembler.add_labels(p, symbol_table)
+    stages["symbols"] = lap(start)
+
+    start = time.perf_counter()
+    p.reset()
+    words = assembler.assemble_commands(p, symbol_table, assembler.Code())
+    stages["codegen"] = lap(start)
+
+    start = time.perf_counter()
+    with open(output_path, "w") as hack:
+        hack.write(assembler.image.encode(words, "hack"))
+    stages["output"] = lap(start)
+    return stages
+
+
+def run_translator(path, output_path):
+    """Translate path into output_path, return the seconds per stage."""
+    stages = {}
+    start = time.perf_counter()
+    with open(path) as source:
+        commands = VMtranslator.Parser(source).commands_ir()
+    stages["parse"] = lap(start)
+
+    start = time.perf_counter()
+    code_writer = VMtranslator.CodeWriter()
+    code_writer.setFileName(os.path.basename(path))
+    VMtranslator.translate(commands, code_writer)
+    stages["codegen"] = lap(start)
+
+    start = time.perf_counter()
+    with open(output_path, "w") as asm:
+        asm.write(code_writer.getvalue())
+    stages["output"] = lap(start)
+    return stages
+
+
+def lap(start):
+    """Return the seconds since start."""
+    return time.perf_counter() - start
+
+
+def write_workload(directory, tool, mix, size, seed=0):
+    """Write a program of about size lines, return its path."""
+    generate = generate_assembly if tool == "assembler" else generate_vm
+    extension = ".asm" if tool == "assembler" else ".vm"
+    path = os.path.join(directory, f"{mix}{size}{extension}")
+    with open(path, "w") as program:
+        for chunk in generate(mix, size, seed):
+            program.write("\n".join(chunk) + "\n")
+    return path
+
+
+def generate_vm(mix, size, seed=0):
+    """Yield chunks of lines of a vm program of about size lines."""
+    rng = random.Random(seed)
+    segments = ["local", "argument", "this", "that", "static"]
+    written = 1
+    yield ["function Bench.main 8"]
+    label = 0
+    while written < size:
+        if mix == "labels":
+            chunk = [
+                f"label L{label}",
+                f"push local {rng.randrange(8)}",
+                f"if-goto L{rng.randrange(label + 1)}",
+                f"goto L{rng.randrange(label + 1)}",
+            ]
+            label += 1
+        elif mix == "variables":
+            chunk = [
+                f"push {rng.choice(segments)} {rng.randrange(240)}",
+                f"pop {rng.choice(segments)} {rng.randrange(240)}",
+                f"push temp {rng.randrange(8)}",
+                f"pop static {rng.randrange(240)}",
+            ]
+        elif mix == "calls":
+            chunk = [
+                f"function Bench.f{label} 2",
+                "push argument 0",
+                f"call Bench.f{rng.randrange(label + 1)} 1",
+                "return",
+            ]
+            label += 1
+        else:
+            chunk = [
+                f"push constant {rng.randrange(32768)}",
+                f"push local {rng.randrange(8)}",
+                rng.choice(["eq", "gt", "lt"]),
+                "pop temp 0",
+            ]
+        written += len(chunk)
+        yield chunk
+
+
+def generate_assembly(mix, size, seed=0):
+    """Yield chunks of lines of an assembly program of about size lines.
+
+    Labels are defined throughout, but only those in the first ROM_SIZE
+    instructions are referenced, as an A-instruction cannot address more.
+    """
+    rng = random.Random(seed)
+    variables = max(16, min(size // 8, MAX_VARIABLES))
+    written = 0
+    label = 0
+    while written < size:
+        if mix == "labels":
+            reachable = _reachable(size, 6, 5)
+            chunk = [
+                f"(L{label})",
+                "D=D-1",
+                f"@L{rng.randrange(reachable)}",
+                "D;JGT",
+                f"@L{rng.randrange(reachable)}",
+                "0;JMP",
+            ]
+        elif mix == "variables":
+            chunk = [
+                f"@v{rng.randrange(variables)}",
+                "D=M",
+                f"@v{rng.randrange(variables)}",
+                "M=D+M",
+            ]
+        elif mix == "calls":
+            # the call sequence of the vm translator
+            reachable = _reachable(size, 21, 19)
+            chunk = [
+                f"@RET{label % reachable}", "D=A", "@SP", "A=M", "M=D",
+                "@SP", "M=M+1", "@SP", "D=M", "@6", "D=D-A", "@ARG", "M=D",
+                "@SP", "D=M", "@LCL", "M=D",
+                f"@F{rng.randrange(reachable)}", "0;JMP",
+                f"(RET{label})", f"(F{label})",
+            ]
+        else:
+            reachable = _reachable(size, 17, 15)
+            chunk = [
+                "@SP", "AM=M-1", "D=M", "A=A-1", "D=M-D",
+                f"@TRUE{label % reachable}",
+                rng.choice(["D;JEQ", "D;JGT", "D;JLT"]),
+                "@SP", "A=M-1", "M=0", f"@END{label % reachable}", "0;JMP",
+                f"(TRUE{label})", "@SP", "A=M-1", "M=-1", f"(END{label})",
+            ]
+        label += 1
+        written += len(chunk)
+        yield chunk
+
+
+def _reachable(size, lines, instructions):
+    """Return how many chunks of a program have their labels in ROM."""
+    return max(1, min(size // lines, ROM_SIZE // instructions))
+
+
+def version():
+    """Return a hash of the sources of the assembler and the translator."""
+    digest = hashlib.sha256()
+    for directory in (ASSEMBLER_DIR, TRANSLATOR_DIR):
+        digest.update(build_cache.fingerprint(directory).encode("ascii"))
+    return digest.hexdigest()[:12]
+
+
+def read_history(path):
+    """Return the runs recorded in a history file, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as history:
+        return json.load(history)
+
+
+def write_history(path, history):
+    """Write the runs of a history file."""
+    with open(path, "w") as filestream:
+        json.dump(history, filestream, indent=1)
+        filestream.write("\n")
+
+
+def find_regressions(history, results, tolerance=0.15):
+    """Return (result, previous result) pairs which got slower.
+
+    Each result is compared with the latest earlier run of the same tool,
+    mix and size, a regression is more than tolerance fewer lines/s.
+    """
+    regressions = []
+    for result in results:
+        for run in reversed(history):
+            previous = next((
+                old for old in run["results"]
+                if (old["tool"], old["mix"], old["size"]) ==
+                (result["tool"], result["mix"], result["size"])
+            ), None)
+            if previous is not None:
+                if result["lines_per_second"] < (
+                        1 - tolerance) * previous["lines_per_second"]:
+                    regressions.append((result, previous))
+                break
+    return regressions
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the benchmark."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "--tools", nargs="+", choices=sorted(STAGES), default=sorted(STAGES),
+        help="tools to measure (default: all)"
+    )
+    arg_parser.add_argument(
+        "--mixes", nargs="+", choices=MIXES, default=list(MIXES),
+        help="kinds of generated programs (default: all)"
+    )
+    arg_parser.add_argument(
+        "--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES),
+        metavar="LINES",
+        help="program sizes in lines (default: 10000 100000 1000000)"
+    )
+    arg_parser.add_argument(
+        "-r", "--repeat", type=int, default=3,
+        help="report the best of this many runs (default: 3)"
+    )
+    arg_parser.add_argument(
+        "--seed", type=int, default=0, help="random seed of the programs"
+    )
+    arg_parser.add_argument(
+        "--history", metavar="FILE",
+        help=("append the results to this JSON file and fail on lines/s "
+              "regressions against its latest run")
+    )
+    arg_parser.add_argument(
+        "--tolerance", type=float, default=0.15,
+        help="slowdown counted as a regression (default: 0.15)"
+    )
+    return arg_parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,626 @@
+#!/usr/bin/env python
+"""Run .tst test scripts headless and compare their output to .cmp files."""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import build_cache
+from block_executor import ASSEMBLER_DIR, BlockExecutor
+from hdl_parser import MissingChipError
+
+try:
+    import hdl_simulator
+except ImportError:  # numpy is not installed, .hdl scripts are skipped
+    hdl_simulator = None
+
+# Comments, strings and the punctuation of the script language
+TOKENS = re.compile(r'//[^\n]*|/\*.*?\*/|"[^"]*"|[{},;]|[^\s{},;]+', re.S)
+OUTPUT_FORMAT = re.compile(r"(.+)%([BDXS])(\d+)\.(\d+)\.(\d+)$")
+# Internal variables of parts, RAM16K[3] or PC[]
+VARIABLE = re.compile(r"(\w+)\[(\d*)\]$")
+
+
+class ScriptError(Exception):
+    """A test script using a command or variable the runner cannot run."""
+
+
+def parse_script(text):
+    """Parse the source of a test script into a list of statements.
+
+    A statement is a list of words, or ["repeat", count, body] and
+    ["while", condition, body] where body is again a list of statements.
+    """
+    tokens = [
+        token for token in TOKENS.findall(text)
+        if not token.startswith(("//", "/*"))
+    ]
+    statements, index = _parse_block(tokens, 0)
+    if index != len(tokens):
+        raise ScriptError("unbalanced '}'")
+    return statements
+
+
+def _parse_block(tokens, index, nested=False):
+    """Parse statements from tokens[index] up to a closing brace.
+
+    Return the statements and the index after the closing brace.
+    """
+    statements = []
+    words = []
+    while index < len(tokens):
+        token = tokens[index]
+        index += 1
+        if token in (",", ";"):
+            if words:
+                statements.append(words)
+            words = []
+        elif token == "{":
+            if not words:
+                raise ScriptError("block without a command")
+            body, index = _parse_block(tokens, index, nested=True)
+            if words[0] == "repeat":
+                count = int(words[1]) if len(words) > 1 else None
+                statements.append(["repeat", count, body])
+            else:
+                statements.append([words[0], " ".join(words[1:]), body])
+            words = []
+        elif token == "}":
+            if words:
+                statements.append(words)
+            return statements, index
+        else:
+            words.append(token)
+
+    if nested:
+        raise ScriptError("missing '}'")
+    if words:
+        statements.append(words)
+    return statements, index
+
+
+def parse_value(text):
+    """Parse a number written in the %B, %X or %D notation, or decimal."""
+    if text.startswith("%B"):
+        value = int(text[2:], 2)
+        return value - 0x10000 if value & 0x8000 else value
+    if text.startswith("%X"):
+        value = int(text[2:], 16)
+        return value - 0x10000 if value & 0x8000 else value
+    if text.startswith("%D"):
+        return int(text[2:])
+    return int(text)
+
+
+def parse_output_list(words):
+    """Return (name, format, left pad, length, right pad) of each column."""
+    columns = []
+    for word in words:
+        match = OUTPUT_FORMAT.match(word)
+        if match is None:
+            raise ScriptError(f"invalid output-list entry {word}")
+        name, fmt, left, length, right = match.groups()
+        columns.append((name, fmt, int(left), int(length), int(right)))
+    return columns
+
+
+def format_header(columns):
+    """Return the header line printed by output-list."""
+    cells = []
+    for name, _, left, length, right in columns:
+        width = left + length + right
+        name = name[:width]
+        padding = width - len(name)
+        cells.append(" " * (padding // 2) + name +
+                     " " * (padding - padding // 2))
+    return "|" + "|".join(cells) + "|"
+
+
+def format_value(value, fmt, length):
+    """Format a value the way the test scripts print it."""
+    if fmt == "S":
+        return str(value).ljust(length)[:length]
+    if fmt == "D":
+        return str(value).rjust(length)
+    if fmt == "B":
+        return format(value & 0xFFFF, "016b")[-length:].rjust(length, "0")
+    return format(value & 0xFFFF, "04X")[-length:].rjust(length, "0")
+
+
+def lines_match(expected, actual):
+    """Compare an output line to a .cmp line where * matches anything."""
+    if len(expected) != len(actual):
+        return False
+    return all(
+        want == "*" or want == got for want, got in zip(expected, actual)
+    )
+
+
+class CPUBackend(object):
+    """Run the hack programs of .hack and .asm files."""
+
+    def __init__(self):
+        """Create a computer with nothing in ROM."""
+        self.executor = BlockExecutor()
+        self.time = 0
+
+    def load(self, path, cache=None, gate_level=False):
+        """Load a .hack file, or assemble and load an .asm file.
+
+        Programs are small enough to always assemble, cache and
+        gate_level only apply to chips.
+        """
+        if path.endswith(".asm"):
+            self.executor.loadProgram(assemble(path))
+        else:
+            self.executor.load(path)
+
+    def get(self, name):
+        """Return the value of a register, RAM[address] or time."""
+        executor = self.executor
+        if name.startswith("RAM[") and name.endswith("]"):
+            return executor.peek(int(name[4:-1]))
+        if name == "PC":
+            return executor.pc
+        if name == "A":
+            return _signed(executor.a)
+        if name == "D":
+            return _signed(executor.d)
+        if name == "time":
+            return self.time
+        raise ScriptError(f"unknown variable {name}")
+
+    def set(self, name, value):
+        """Set a register or RAM[address]."""
+        executor = self.executor
+        if name.startswith("RAM[") and name.endswith("]"):
+            executor.poke(int(name[4:-1]), value)
+        elif name == "PC":
+            executor.pc = value & 0x7FFF
+        elif name == "A":
+            executor.a = value & 0xFFFF
+        elif name == "D":
+            executor.d = value & 0xFFFF
+        else:
+            raise ScriptError(f"unknown variable {name}")
+
+    def eval(self):
+        """Nothing to evaluate, the computer only changes on the clock."""
+
+    def tick(self):
+        """First half of a clock cycle, the instruction runs on tock."""
+
+    def tock(self):
+        """Second half of a clock cycle."""
+        self.ticktock()
+
+    def ticktock(self, count=1):
+        """Run count clock cycles."""
+        # once halted the state does not change any more
+        self.executor.run(count, stop_at_halt=True)
+        self.time += count
+
+    def load_part(self, chip, path):
+        """The computer has no parts to load files into."""
+        raise ScriptError(f"{chip} load needs a chip")
+
+    def finish(self):
+        """Nothing is deferred, every value was returned by get."""
+
+
+class HDLBackend(object):
+    """Simulate the chip of a .hdl file.
+
+    Scripts of combinational chips are batched: get records the inputs
+    set so far as a lane and returns a callable, and finish evaluates
+    every lane in one sweep. Chips with state or modelled parts run a
+    single lane step by step as every step depends on the previous one.
+    Variables such as RAM16K[3] or PC[] read and write the models.
+    """
+
+    def __init__(self):
+        """Create a backend with no chip loaded."""
+        self.simulator = None
+        self.time = 0
+        self.ticked = False
+        self.lanes = []
+        self.lane = None
+        self.results = None
+
+    def load(self, path, cache=None, gate_level=False):
+        """Flatten the chip of a .hdl file, reusing cached netlists.
+
+        With gate_level no memory part is replaced by its model.
+        """
+        if hdl_simulator is None:
+            raise ScriptError("numpy is needed to simulate .hdl files")
+        try:
+            self.netlist = hdl_simulator.elaborate(
+                path, cache, substitute=not gate_level
+            )
+        except MissingChipError as error:
+            raise ScriptError(str(error))
+
+        self.inputs = {name: 0 for name, _ in self.netlist.inputs}
+        if self.netlist.clocked or self.netlist.components:
+            self.simulator = hdl_simulator.Simulator(self.netlist)
+
+    def load_part(self, chip, path):
+        """Load a file into a modelled part, as in ROM32K load Max.hack."""
+        self._model(chip).load(path)
+
+    def get(self, name):
+        """Return the value of a pin, a variable or the time."""
+        if name == "time":
+            return f"{self.time}+" if self.ticked else str(self.time)
+        if name not in self.netlist.pins:
+            chip, index = self._variable(name)
+            return _signed(self._model(chip).get(index))
+
+        width = self.netlist.width(name)
+        if self.simulator is not None:
+            return _pin_value(self.simulator.get(name)[0], width)
+
+        if self.lane is None:
+            self.lanes.append(dict(self.inputs))
+            self.lane = len(self.lanes) - 1
+        lane = self.lane
+        return lambda: _pin_value(self.results[name][lane], width)
+
+    def set(self, name, value):
+        """Set an input pin or a variable."""
+        if name not in self.inputs:
+            chip, index = self._variable(name)
+            self._model(chip).set(index, value)
+            return
+        value &= (1 << self.netlist.width(name)) - 1
+        self.inputs[name] = value
+        if self.simulator is not None:
+            self.simulator.set(name, value)
+        else:
+            self.lane = None
+
+    def eval(self):
+        """Evaluate the chip."""
+        if self.simulator is not None:
+            self.simulator.evaluate()
+
+    def tick(self):
+        """First half of a clock cycle, DFFs sample their inputs."""
+        if self.simulator is not None:
+            self.simulator.tick()
+        self.ticked = True
+
+    def tock(self):
+        """Second half of a clock cycle, DFFs output the sampled values."""
+        if self.simulator is not None:
+            self.simulator.tock()
+        self.ticked = False
+        self.time += 1
+
+    def ticktock(self, count=1):
+        """Run count clock cycles."""
+        for _ in range(count):
+            self.tick()
+            self.tock()
+
+    def finish(self):
+        """Evaluate every recorded lane of a combinational chip."""
+        if self.simulator is not None or not self.lanes:
+            return
+        simulator = hdl_simulator.Simulator(self.netlist, len(self.lanes))
+        for name in self.inputs:
+            simulator.set(name, [lane[name] for lane in self.lanes])
+        simulator.evaluate()
+        self.results = {
+            name: simulator.get(name) for name in self.netlist.pins
+        }
+
+    def _variable(self, name):
+        """Return the chip and index of a variable like RAM16K[3]."""
+        match = VARIABLE.match(name)
+        if match is None:
+            raise ScriptError(f"unknown variable {name}")
+        chip, index = match.groups()
+        return chip, int(index or 0)
+
+    def _model(self, chip):
+        """Return the model simulating the first part called chip."""
+        try:
+            return self.simulator.model(chip)
+        except (AttributeError, KeyError):
+            raise ScriptError(f"no modelled {chip} part")
+
+
+# Extension of the loaded file -> backend simulating it
+BACKENDS = {
+    ".hack": CPUBackend,
+    ".asm": CPUBackend,
+    ".hdl": HDLBackend,
+}
+
+
+class ScriptRunner(object):
+    """Run a single test script."""
+
+    def __init__(self, script_path, cache=None, gate_level=False):
+        """Create a runner for the script at script_path."""
+        self.script_path = script_path
+        self.cache = cache
+        self.gate_level = gate_level
+        self.directory = os.path.dirname(script_path)
+        self.backend = None
+        self.columns = []
+        self.output_file = None
+        self.compare_file = None
+        # header lines and (columns, values) of every output
+        self.rows = []
+        self.lines = []
+
+    def run(self):
+        """Run the script, return the lines it output."""
+        with open(self.script_path) as script:
+            statements = parse_script(script.read())
+        self.execute(statements)
+        if self.backend is not None:
+            self.backend.finish()
+        self.lines = [self._format_row(row) for row in self.rows]
+        return self.lines
+
+    def execute(self, statements):
+        """Execute a list of statements."""
+        for statement in statements:
+            command = statement[0]
+            if command == "repeat":
+                self.repeat(statement[1], statement[2])
+            elif command == "load":
+                self.load(statement[1:])
+            elif command == "output-file":
+                self.output_file = os.path.join(self.directory, statement[1])
+            elif command == "compare-to":
+                self.compare_file = os.path.join(self.directory, statement[1])
+            elif command == "output-list":
+                self.columns = parse_output_list(statement[1:])
+                self.rows.append(format_header(self.columns))
+            elif command == "output":
+                self.output()
+            elif command == "set":
+                self._require_backend().set(
+                    statement[1], parse_value(statement[2])
+                )
+            elif command in ("eval", "tick", "tock", "ticktock"):
+                getattr(self._require_backend(), command)()
+            elif command in ("echo", "clear-echo"):
+                continue
+            elif len(statement) == 3 and statement[1] == "load":
+                self._require_backend().load_part(
+                    command, os.path.join(self.directory, statement[2])
+                )
+            else:
+                raise ScriptError(f"unsupported command {command}")
+
+    def repeat(self, count, body):
+        """Execute body count times."""
+        if count is None:
+            raise ScriptError("repeat without a count runs forever")
+        if body == [["ticktock"]]:
+            self._require_backend().ticktock(count)
+            return
+        for _ in range(count):
+            self.execute(body)
+
+    def load(self, words):
+        """Create the backend for the loaded file."""
+        if not words:
+            raise ScriptError("loading a directory of VM files")
+        path = os.path.join(self.directory, words[0])
+        extension = os.path.splitext(path)[1]
+        if extension not in BACKENDS:
+            raise ScriptError(f"no backend for {extension} files")
+        if self.backend is not None:
+            self.backend.finish()
+        self.backend = BACKENDS[extension]()
+        self.backend.load(path, self.cache, self.gate_level)
+
+    def output(self):
+        """Record the current value of every output column."""
+        backend = self._require_backend()
+        values = [backend.get(name) for name, _, _, _, _ in self.columns]
+        self.rows.append((self.columns, values))
+
+    def _format_row(self, row):
+        """Return the output line of a row.
+
+        Backends may return a callable for a value known only once they
+        have finished.
+        """
+        if isinstance(row, str):
+            return row
+        cells = []
+        for (_, fmt, left, length, right), value in zip(*row):
+            if callable(value):
+                value = value()
+            value = format_value(value, fmt, length)
+            cells.append(" " * left + value + " " * right)
+        return "|" + "|".join(cells) + "|"
+
+    def compare(self):
+        """Return a description of the first difference to the .cmp file.
+
+        Return None when the output matches or there is nothing to compare.
+        """
+        if self.compare_file is None:
+            return None
+        with open(self.compare_file) as cmp:
+            expected = cmp.read().splitlines()
+
+        for number, (want, got) in enumerate(zip(expected, self.lines), 1):
+            if not lines_match(want.rstrip(), got):
+                return f"line {number}: expected {want!r}, got {got!r}"
+        if len(expected) != len(self.lines):
+            return (f"{len(self.lines)} output lines, {len(expected)} "
+                    f"expected")
+        return None
+
+    def write_output(self):
+        """Write the output lines to the output-file of the script."""
+        if self.output_file is not None:
+            with open(self.output_file, "w") as out:
+                out.write("\n".join(self.lines) + "\n")
+
+    def _require_backend(self):
+        """Return the backend, failing if nothing has been loaded yet."""
+        if self.backend is None:
+            raise ScriptError("no file loaded")
+        return self.backend
+
+
+def assemble(asm_path):
+    """Return the instructions of a hack assembly file."""
+    sys.path.insert(0, ASSEMBLER_DIR)
+    from assembler import assemble as assemble_program
+    from parser import Parser
+
+    with open(asm_path) as asm:
+        return list(assemble_program(Parser(asm)))
+
+
+def run_script(script_path, write_output=False, cache=None,
+               gate_level=False):
+    """Run a script, return (path, status, message, seconds).
+
+    status is "pass", "FAIL" or "skip" for scripts needing something the
+    runner does not support.
+    """
+    start = time.perf_counter()
+    runner = ScriptRunner(script_path, cache, gate_level)
+    try:
+        runner.run()
+    except ScriptError as error:
+        return script_path, "skip", str(error), time.perf_counter() - start
+    except Exception as error:
+        return (script_path, "FAIL", f"{type(error).__name__}: {error}",
+                time.perf_counter() - start)
+
+    if write_output:
+        runner.write_output()
+    difference = runner.compare()
+    elapsed = time.perf_counter() - start
+    if difference is not None:
+        return script_path, "FAIL", difference, elapsed
+    return script_path, "pass", None, elapsed
+
+
+def run_scripts(script_paths, jobs=None, write_output=False, cache=None,
+                gate_level=False):
+    """Run scripts in a process pool, return one result per script."""
+    count = len(script_paths)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(
+            run_script, script_paths, [write_output] * count,
+            [cache] * count, [gate_level] * count
+        ))
+
+
+def collect_scripts(paths):
+    """Expand files, directories and glob patterns into .tst files."""
+    script_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, "**", "*.tst")
+            script_paths.extend(sorted(glob.glob(pattern, recursive=True)))
+        elif os.path.isfile(path):
+            script_paths.append(path)
+        else:
+            script_paths.extend(sorted(glob.glob(path, recursive=True)))
+
+    # drop duplicates but keep the order
+    return list(dict.fromkeys(script_paths))
+
+
+def print_summary(results, elapsed, verbose=False):
+    """Print the result of every script, return the number of failures."""
+    counts = {"pass": 0, "FAIL": 0, "skip": 0}
+    for script_path, status, message, seconds in results:
+        counts[status] += 1
+        if status == "skip" and not verbose:
+            continue
+        line = f"{status:4s}  {seconds * 1000:9.1f} ms  {script_path}"
+        print(f"{line}: {message}" if message else line)
+
+    print(f"{counts['pass']} passed, {counts['FAIL']} failed, "
+          f"{counts['skip']} skipped in {elapsed:.2f} s")
+    return counts["FAIL"]
+
+
+def main():
+    """Entry point for the test script runner."""
+    args = parse_args()
+    script_paths = collect_scripts(args.paths)
+    if not script_paths:
+        print("no .tst files found")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    results = run_scripts(
+        script_paths, args.jobs, args.write_output,
+        build_cache.open_cache(args.cache, args.cache_size), args.gate_level
+    )
+    elapsed = time.perf_counter() - start
+
+    if print_summary(results, elapsed, args.verbose):
+        sys.exit(1)
+
+
+def parse_args(argv=None):
+    """Parse the command line arguments of the test script runner."""
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument(
+        "paths", nargs="+",
+        help=".tst files, directories to search recursively or glob patterns"
+    )
+    arg_parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="number of worker processes (default: number of cores)"
+    )
+    arg_parser.add_argument(
+        "--write-output", action="store_true",
+        help="also write the output-file of every script"
+    )
+    arg_parser.add_argument(
+        "--cache", metavar="DIR", default=None,
+        help=("reuse the netlists of unchanged chips from this build cache "
+              "(default: $HACK_BUILD_CACHE, off when unset)")
+    )
+    arg_parser.add_argument(
+        "--cache-size", metavar="MB", type=float, default=None,
+        help="evict least recently used cache entries beyond this size"
+    )
+    arg_parser.add_argument(
+        "--gate-level", action="store_true",
+        help=("simulate memory chips from their gates instead of the "
+              "array models they were checked against")
+    )
+    arg_parser.add_argument(
+        "-v", "--verbose", action="store_true",
+        help="also list skipped scripts and why"
+    )
+    return arg_parser.parse_args(argv)
+
+
+def _signed(value):
+    """Return a 16 bit word as a signed integer."""
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def _pin_value(value, width):
+    """Return the value of a pin, 16 bit pins are signed."""
+    value = int(value)
+    return _signed(value) if width == 16 else value
+
+
+if __name__ == "__main__":
+    main()